@@ -1,39 +1,63 @@
 import asyncio
 import logging
 from asyncio import Future
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
 
 from homeassistant.core import HomeAssistant
 
-from .api import Smartmeter
+from .api import AsyncSmartmeterClient, payloads
 from .api.constants import ValueType
-from .const import ATTRS_METERREADINGS_CALL, ATTRS_BASEINFORMATION_CALL, ATTRS_CONSUMPTIONS_CALL, ATTRS_BEWEGUNGSDATEN, ATTRS_ZAEHLPUNKTE_CALL, ATTRS_HISTORIC_DATA, ATTRS_VERBRAUCH_CALL
-from .utils import translate_dict
+from .api.errors import SmartmeterQueryError
+from .api.models import BewegungsdatenDescriptor, Contract, HistoricalDataHeader, Zaehlpunkt
+from .api.timestamps import parse_epoch
+from .auth_store import AuthStore
+from .const import ATTRS_METERREADINGS_CALL, ATTRS_BASEINFORMATION_CALL, ATTRS_CONSUMPTIONS_CALL, ATTRS_VERBRAUCH_CALL
+from .utils import AttributeExtractor
 
 _LOGGER = logging.getLogger(__name__)
 
+_METER_READINGS = AttributeExtractor(ATTRS_METERREADINGS_CALL)
+_BASE_INFORMATION = AttributeExtractor(ATTRS_BASEINFORMATION_CALL)
+_VERBRAUCH = AttributeExtractor(ATTRS_VERBRAUCH_CALL)
+_CONSUMPTIONS = AttributeExtractor(ATTRS_CONSUMPTIONS_CALL)
+
+
+class MeterReading(NamedTuple):
+    """A daily meter reading in kWh and the start of the day it has been read"""
+    value: float
+    timestamp: datetime
+
+
 class AsyncSmartmeter:
 
-    def __init__(self, hass: HomeAssistant, smartmeter: Smartmeter = None):
+    def __init__(self, hass: HomeAssistant, smartmeter: AsyncSmartmeterClient = None, store: AuthStore = None):
         self.hass = hass
         self.smartmeter = smartmeter
+        self.store = store
         self.login_lock = asyncio.Lock()
+        self._restored = store is None
+        if store is not None:
+            # tokens are also refreshed by api calls (shortly before they expire), not only by login
+            smartmeter.on_tokens_updated = lambda: store.async_schedule_save(smartmeter)
 
     async def login(self) -> Future:
         async with self.login_lock:
-            return await self.hass.async_add_executor_job(self.smartmeter.login)
+            if not self._restored:
+                # a restart with still valid tokens does not need to authenticate at all
+                self._restored = True
+                await self.store.async_restore(self.smartmeter)
+            return await self.smartmeter.login()
 
     async def get_meter_readings(self) -> dict[str, any]:
         """
         asynchronously get and parse /meterReadings response
         Returns response already sanitized of the specified zaehlpunkt in ctor
         """
-        response = await self.hass.async_add_executor_job(
-            self.smartmeter.historical_data,
-        )
+        response = await self.smartmeter.historical_data()
         if "Exception" in response:
             raise RuntimeError("Cannot access /meterReadings: ", response)
-        return translate_dict(response, ATTRS_METERREADINGS_CALL)
+        return _METER_READINGS(response)
 
 
     async def get_base_information(self) -> dict[str, str]:
@@ -41,65 +65,48 @@ class AsyncSmartmeter:
         asynchronously get and parse /baseInformation response
         Returns response already sanitized of the specified zaehlpunkt in ctor
         """
-        response = await self.hass.async_add_executor_job(self.smartmeter.base_information)
+        response = await self.smartmeter.base_information()
         if "Exception" in response:
             raise RuntimeError("Cannot access /baseInformation: ", response)
-        return translate_dict(response, ATTRS_BASEINFORMATION_CALL)
-
-    def contracts2zaehlpunkte(self, contracts: dict, zaehlpunkt: str) -> list[dict]:
-        zaehlpunkte = []
-        if contracts is not None and isinstance(contracts, list) and len(contracts) > 0:
-            for contract in contracts:
-                if "zaehlpunkte" in contract:
-                    geschaeftspartner = contract["geschaeftspartner"] if "geschaeftspartner" in contract else None
-                    zaehlpunkte += [
-                        {**z, "geschaeftspartner": geschaeftspartner} for z in contract["zaehlpunkte"] if z["zaehlpunktnummer"] == zaehlpunkt
-                    ]
-        else:
+        return _BASE_INFORMATION(response)
+
+    @staticmethod
+    def contracts2zaehlpunkte(contracts: tuple[Contract, ...], zaehlpunkt: str) -> list[Zaehlpunkt]:
+        if not contracts:
             raise RuntimeError(f"Cannot access Zaehlpunkt {zaehlpunkt}")
-        return zaehlpunkte
+        return [zp for contract in contracts for zp in contract.zaehlpunkte if zp.zaehlpunktnummer == zaehlpunkt]
 
     async def get_zaehlpunkt(self, zaehlpunkt: str) -> dict[str, str]:
         """
         asynchronously get and parse /zaehlpunkt response
         Returns response already sanitized of the specified zaehlpunkt in ctor
         """
-        contracts = await self.hass.async_add_executor_job(self.smartmeter.zaehlpunkte)
-        zaehlpunkte = self.contracts2zaehlpunkte(contracts, zaehlpunkt)
-        zp = [z for z in zaehlpunkte if z["zaehlpunktnummer"] == zaehlpunkt]
-        if len(zp) == 0:
-            raise RuntimeError(f"Zaehlpunkt {zaehlpunkt} not found")
+        try:
+            info = await self.smartmeter.zaehlpunkt_info(zaehlpunkt)
+        except SmartmeterQueryError as exception:
+            raise RuntimeError(f"Zaehlpunkt {zaehlpunkt} not found") from exception
 
-        return (
-            translate_dict(zp[0], ATTRS_ZAEHLPUNKTE_CALL)
-            if len(zp) > 0
-            else None
-        )
+        return info.as_attributes()
 
     async def get_consumption(self, customer_id: str, zaehlpunkt: str, start_date: datetime):
         """Return 24h of hourly consumption starting from a date"""
-        response = await self.hass.async_add_executor_job(
-            self.smartmeter.verbrauch, customer_id, zaehlpunkt, start_date
-        )
+        response = await self.smartmeter.verbrauch(customer_id, zaehlpunkt, start_date)
         if "Exception" in response:
             raise RuntimeError(f"Cannot access daily consumption: {response}")
 
-        return translate_dict(response, ATTRS_VERBRAUCH_CALL)
+        return _VERBRAUCH(response)
 
     async def get_consumption_raw(self, customer_id: str, zaehlpunkt: str, start_date: datetime):
         """Return daily consumptions from the given start date until today"""
-        response = await self.hass.async_add_executor_job(
-            self.smartmeter.verbrauchRaw, customer_id, zaehlpunkt, start_date
-        )
+        response = await self.smartmeter.verbrauchRaw(customer_id, zaehlpunkt, start_date)
         if "Exception" in response:
             raise RuntimeError(f"Cannot access daily consumption: {response}")
 
-        return translate_dict(response, ATTRS_VERBRAUCH_CALL)
+        return _VERBRAUCH(response)
 
     async def get_historic_data(self, zaehlpunkt: str, date_from: datetime = None, date_to: datetime = None, granularity: ValueType = ValueType.QUARTER_HOUR):
         """Return three years of historic quarter-hourly data"""
-        response = await self.hass.async_add_executor_job(
-            self.smartmeter.historical_data,
+        response = await self.smartmeter.historical_data(
             zaehlpunkt,
             date_from,
             date_to,
@@ -107,13 +114,12 @@ class AsyncSmartmeter:
         )
         if "Exception" in response:
             raise RuntimeError(f"Cannot access historic data: {response}")
-        _LOGGER.debug(f"Raw historical data: {response}")
-        return translate_dict(response, ATTRS_HISTORIC_DATA)
+        payloads.log_payload("Raw historical data: %s", response)
+        return self.historic_data_attributes(response)
 
     async def get_meter_reading_from_historic_data(self, zaehlpunkt: str, start_date: datetime, end_date: datetime) -> float:
         """Return daily meter readings from the given start date until today"""
-        response = await self.hass.async_add_executor_job(
-            self.smartmeter.historical_data,
+        response = await self.smartmeter.historical_data(
             zaehlpunkt,
             start_date,
             end_date,
@@ -121,11 +127,47 @@ class AsyncSmartmeter:
         )
         if "Exception" in response:
             raise RuntimeError(f"Cannot access historic data: {response}")
-        _LOGGER.debug(f"Raw historical data: {response}")
-        meter_readings = translate_dict(response, ATTRS_HISTORIC_DATA)
+        payloads.log_payload("Raw historical data: %s", response)
+        meter_readings = self.historic_data_attributes(response)
         if "values" in meter_readings and all("messwert" in messwert for messwert in meter_readings['values']) and len(meter_readings['values']) > 0:
             return meter_readings['values'][0]['messwert'] / 1000
 
+    async def get_latest_meter_reading(self, zaehlpunkt: str, start_date: datetime, end_date: datetime) -> Optional[MeterReading]:
+        """Return the latest valid meter reading between the given dates, fetched in a single request"""
+        response = await self.smartmeter.historical_data(
+            zaehlpunkt,
+            start_date,
+            end_date,
+            ValueType.METER_READ
+        )
+        if "Exception" in response:
+            raise RuntimeError(f"Cannot access historic data: {response}")
+        payloads.log_payload("Raw historical data: %s", response)
+        return self.latest_meter_reading(response.get("messwerte") or [])
+
+    @staticmethod
+    def historic_data_attributes(response: dict) -> dict:
+        """
+        returns the header (obis code and unit) and the messwerte of a historical data response
+        """
+        return {**HistoricalDataHeader.from_json(response).as_attributes(), "values": response.get("messwerte")}
+
+    @staticmethod
+    def latest_meter_reading(messwerte: list[dict]) -> Optional[MeterReading]:
+        """
+        returns the meter reading of the latest messwert, which has a value (None if there is none)
+        """
+        latest = None
+        for messwert in messwerte:
+            if messwert.get("messwert") is None or not messwert.get("zeitVon"):
+                continue
+            epoch = parse_epoch(messwert["zeitVon"])
+            if latest is None or epoch >= latest[0]:
+                latest = (epoch, messwert["messwert"])
+        if latest is None:
+            return None
+        return MeterReading(latest[1] / 1000, datetime.fromtimestamp(latest[0], timezone.utc))
+
     @staticmethod
     def is_active(zaehlpunkt_response: dict) -> bool:
         """
@@ -140,8 +182,9 @@ class AsyncSmartmeter:
 
     async def get_bewegungsdaten(self, zaehlpunkt: str, start: datetime = None, end: datetime = None, granularity: ValueType = ValueType.QUARTER_HOUR):
         """Return three years of historic quarter-hourly data"""
-        response = await self.hass.async_add_executor_job(
-            self.smartmeter.bewegungsdaten,
+        # long spans (e.g. the initial import) are fetched in concurrent windows,
+        # the values are returned as compact MeasurementSeries
+        response = await self.smartmeter.bewegungsdaten_series(
             zaehlpunkt,
             start,
             end,
@@ -149,15 +192,15 @@ class AsyncSmartmeter:
         )
         if "Exception" in response:
             raise RuntimeError(f"Cannot access bewegungsdaten: {response}")
-        _LOGGER.debug(f"Raw bewegungsdaten: {response}")
-        return translate_dict(response, ATTRS_BEWEGUNGSDATEN)
+        payloads.log_payload("Raw bewegungsdaten: %s", response)
+        return {**BewegungsdatenDescriptor.from_json(response.get("descriptor")).as_attributes(), "values": response.get("values")}
 
     async def get_consumptions(self) -> dict[str, str]:
         """
         asynchronously get and parse /consumptions response
         Returns response already sanitized of the specified zaehlpunkt in ctor
         """
-        response = await self.hass.async_add_executor_job(self.smartmeter.consumptions)
+        response = await self.smartmeter.consumptions()
         if "Exception" in response:
             raise RuntimeError("Cannot access /consumptions: ", response)
-        return translate_dict(response, ATTRS_CONSUMPTIONS_CALL)
\ No newline at end of file
+        return _CONSUMPTIONS(response)
\ No newline at end of file
@@ -1,6 +1,16 @@
 """Set up the Wiener Netze SmartMeter Integration component."""
 from homeassistant import core, config_entries
+from homeassistant.const import CONF_USERNAME, CONF_PASSWORD
 from homeassistant.core import DOMAIN
+from homeassistant.exceptions import ConfigEntryNotReady
+
+from .auth_store import AuthStore
+from .client_registry import async_get_registry
+from .const import CONF_ZAEHLPUNKTE
+from .coordinator import WNSMCoordinator
+from .services import async_setup_services
+
+PLATFORMS = ["sensor"]
 
 
 async def async_setup_entry(
@@ -8,10 +18,55 @@ async def async_setup_entry(
         entry: config_entries.ConfigEntry
 ) -> bool:
     """Set up platform from a ConfigEntry."""
+    # all sensors and entries of the same account share one logged-in client
+    registry = async_get_registry(hass)
+    registry.acquire(entry.data[CONF_USERNAME], entry.data[CONF_PASSWORD], entry.entry_id)
+    # one update cycle (login, zaehlpunkte, readings and imports) for all zaehlpunkte of the entry
+    coordinator = WNSMCoordinator(
+        hass,
+        entry.data[CONF_USERNAME],
+        entry.data[CONF_PASSWORD],
+        [zp["zaehlpunktnummer"] for zp in entry.data[CONF_ZAEHLPUNKTE]],
+        entry,
+    )
+    try:
+        # HA retries the setup, if the first update fails (the coordinator is shut down on its own)
+        await coordinator.async_config_entry_first_refresh()
+    except ConfigEntryNotReady:
+        registry.release(entry.data[CONF_USERNAME], entry.entry_id)
+        raise
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    hass.data[DOMAIN][entry.entry_id] = coordinator
+    async_setup_services(hass)
 
     # Forward the setup to the sensor platform.
-    await hass.config_entries.async_forward_entry_setups(entry, ["sensor"])
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
     return True
+
+
+async def async_unload_entry(
+        hass: core.HomeAssistant,
+        entry: config_entries.ConfigEntry
+) -> bool:
+    """Unload a ConfigEntry and release its api client."""
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        hass.data[DOMAIN].pop(entry.entry_id, None)
+        async_get_registry(hass).release(entry.data[CONF_USERNAME], entry.entry_id)
+    return unload_ok
+
+
+async def async_remove_entry(
+        hass: core.HomeAssistant,
+        entry: config_entries.ConfigEntry
+) -> None:
+    """Remove the persisted login state, unless another entry uses the same account."""
+    username = entry.data[CONF_USERNAME]
+    if any(
+        other.data.get(CONF_USERNAME) == username
+        for other in hass.config_entries.async_entries(entry.domain)
+        if other.entry_id != entry.entry_id
+    ):
+        return
+    await AuthStore(hass, username).async_remove()
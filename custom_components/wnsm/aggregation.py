@@ -0,0 +1,152 @@
+"""
+Hourly aggregation of measurement series into the (cumulative) sums of the statistics
+"""
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from .api.series import MeasurementSeries
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+#: fixed point units per kWh (1 unit = 1 mWh), the finest resolution reported by the api is Wh
+SCALE = 1_000_000
+
+#: fixed point units per unit of measurement reported by the api
+UNIT_SCALE = {
+    "KWH": SCALE,
+    "WH": SCALE // 1000,
+}
+
+
+class HourlyUsage(NamedTuple):
+    """Hourly usage in fixed point units (see SCALE), hours are epoch seconds"""
+    hours: list[int]
+    usage: list[int]
+    #: cumulative usage up to and including the hour
+    sums: list[int]
+    #: values dropped, because they do not start after the previous value
+    skipped: int
+    #: values not aligned to quarter hours
+    misaligned: int
+    #: estimated values
+    estimated: int
+
+    @property
+    def total(self) -> int:
+        return self.sums[-1] if self.sums else 0
+
+
+def to_decimal(units: int) -> Decimal:
+    """
+    converts fixed point units into kWh (exact)
+    """
+    return Decimal(units) / SCALE
+
+
+def to_float(units: int) -> float:
+    """
+    converts fixed point units into kWh (correctly rounded)
+    """
+    return units / SCALE
+
+
+def _hour(epoch):
+    # same as datetime.replace(minute=0) of the (utc) timestamp
+    return epoch - (epoch % 3600 - epoch % 60)
+
+
+def aggregate_hourly(series: MeasurementSeries, multiplier: int, since: float,
+                     use_numpy: Optional[bool] = None) -> HourlyUsage:
+    """
+    Sums the values of the series per hour in fixed point units.
+    Values are converted by round(value * multiplier) (see UNIT_SCALE), i.e. every value is quantized to 1 mWh
+    on purpose: the api reports Wh at most, so this only drops the binary noise of fractional floats
+    (e.g. 0.1 kWh is summed as exactly 0.1 instead of Decimal(0.1)).
+    Values starting before `since` or not after the previous value are dropped, missing values are ignored.
+    Uses NumPy if it is available (or requested), all paths return identical results.
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and len(series):
+        return _aggregate_numpy(series, multiplier, since)
+    return _aggregate_python(series, multiplier, since)
+
+
+def _aggregate_python(series: MeasurementSeries, multiplier: int, since: float) -> HourlyUsage:
+    """
+    single pass over the series, summing integers per hour
+    """
+    hours: dict[int, int] = {}
+    last = since
+    skipped = misaligned = estimated_count = 0
+    for epoch, value, estimated in series.raw():
+        if epoch < last:
+            skipped += 1
+            continue
+        last = epoch
+        if value is None:
+            continue
+        units = value * multiplier if isinstance(value, int) else round(value * multiplier)
+        if epoch % 900:
+            misaligned += 1
+        estimated_count += estimated
+        hour = _hour(epoch)
+        hours[hour] = hours.get(hour, 0) + units
+
+    keys = sorted(hours)
+    usage = [hours[hour] for hour in keys]
+    sums = []
+    total = 0
+    for units in usage:
+        total += units
+        sums.append(total)
+    return HourlyUsage(keys, usage, sums, skipped, misaligned, estimated_count)
+
+
+def _aggregate_numpy(series: MeasurementSeries, multiplier: int, since: float) -> HourlyUsage:
+    """
+    vectorised: mask dropped and missing values, reduce the values of every hour and cumsum
+    """
+    count = len(series)
+    starts = np.frombuffer(series.starts, dtype=np.int64, count=count)
+    values = np.frombuffer(series.values, dtype=np.int64 if series.values.typecode == "q" else np.float64, count=count)
+    missing = np.unpackbits(np.frombuffer(series.missing, dtype=np.uint8), bitorder="little")[:count].astype(bool)
+    estimated = np.unpackbits(np.frombuffer(series.estimated, dtype=np.uint8), bitorder="little")[:count].astype(bool)
+
+    # a value is kept, if it does not start before `since` or any previous value
+    previous = np.empty(count, dtype=np.float64)
+    previous[0] = since
+    if count > 1:
+        previous[1:] = np.maximum.accumulate(starts[:-1])
+        np.maximum(previous, since, out=previous)
+    kept = starts >= previous
+    skipped = int(count - np.count_nonzero(kept))
+    valid = kept & ~missing
+
+    starts = starts[valid]
+    if values.dtype == np.int64:
+        units = values[valid] * multiplier
+    else:
+        units = np.rint(values[valid] * multiplier).astype(np.int64)
+
+    # kept values are ordered by their start, so every hour is a contiguous run
+    hours = _hour(starts)
+    if len(hours):
+        first = np.concatenate(([0], np.flatnonzero(np.diff(hours)) + 1))
+        usage = np.add.reduceat(units, first)
+        hours = hours[first]
+    else:
+        usage = units
+    sums = np.cumsum(usage)
+    return HourlyUsage(
+        hours.tolist(),
+        usage.tolist(),
+        sums.tolist(),
+        skipped,
+        int(np.count_nonzero(starts % 900)),
+        int(np.count_nonzero(estimated[valid])),
+    )
+
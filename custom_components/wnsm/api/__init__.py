@@ -2,10 +2,15 @@
 from importlib.metadata import version
 
 from .client import Smartmeter
+from .async_client import AsyncSmartmeterClient
+from .models import Contract, Zaehlpunkt
+from .policy import RateLimiter, RequestPolicy
+from .series import Measurement, MeasurementSeries
 
 try:
     __version__ = version(__name__)
 except Exception:  # pylint: disable=broad-except
     pass
 
-__all__ = ["Smartmeter"]
+__all__ = ["Smartmeter", "AsyncSmartmeterClient", "Contract", "Zaehlpunkt", "RateLimiter", "RequestPolicy",
+           "Measurement", "MeasurementSeries"]
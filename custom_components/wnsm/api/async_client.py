@@ -0,0 +1,593 @@
+"""Contains the asyncio based Smartmeter API Client."""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, date
+from typing import Any, AsyncIterator
+
+import aiohttp
+
+from . import constants as const
+from . import payloads, range_fetcher
+from .client import Smartmeter, ZaehlpunktInfo
+from .models import Contract
+from .errors import SmartmeterConnectionError, SmartmeterLoginError
+from .metrics import MetricsRegistry, endpoint_name, timed
+from .policy import RateLimiter, RequestPolicy, parse_retry_after
+from .series import MeasurementSeries, SeriesBuilder
+from .streaming import STREAM_CHUNK_SIZE, JsonArrayStream
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSmartmeterClient(Smartmeter):
+    """Smartmeter client using a single (pooled) aiohttp session."""
+
+    def __init__(self, username, password, session: aiohttp.ClientSession = None, input_code_verifier=None,
+                 zaehlpunkte_ttl=const.ZAEHLPUNKTE_TTL, request_policy: RequestPolicy = None,
+                 rate_limiter: RateLimiter = None, metrics: MetricsRegistry = None):
+        """Access the Smartmeter API asynchronously.
+
+        Args:
+            username (str): Username used for API Login.
+            password (str): Password used for API Login.
+            session (aiohttp.ClientSession, optional): Session to perform all requests with.
+                If None, an own session is created on first use and closed with `close`.
+            request_policy (RequestPolicy, optional): Retries of failing api calls.
+            rate_limiter (RateLimiter, optional): Limits the rate of api calls per api (shared by default).
+            metrics (MetricsRegistry, optional): Collects latency, size and error metrics per endpoint.
+        """
+        super().__init__(username, password, input_code_verifier, zaehlpunkte_ttl, request_policy, rate_limiter,
+                         metrics)
+        self.session = session
+        self._owns_session = session is None
+        self._login_lock = asyncio.Lock()
+
+    def _new_session(self):
+        # the aiohttp session is created on first use (see `_session`), no requests session is needed
+        return None
+
+    def reset(self):
+        session = self.session
+        super().reset()
+        # keep the pooled connections, only login state is thrown away
+        self.session = session
+        if self.session is not None:
+            self.session.cookie_jar.clear()
+
+    def _session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+            self._owns_session = True
+        return self.session
+
+    async def close(self):
+        """Closes the session, if it has been created by this client."""
+        if self._owns_session and self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    @timed("login/page")
+    async def load_login_page(self):
+        """
+        loads login page and extracts encoded login url
+        """
+        login_url = self._prepare_login_url()
+        try:
+            async with self._session().get(login_url) as result:
+                status = result.status
+                content = await result.read()
+        except Exception as exception:
+            raise SmartmeterConnectionError("Could not load login page") from exception
+        if status != 200:
+            raise SmartmeterConnectionError(
+                f"Could not load login page. Error: {content}"
+            )
+        action = self._form_action(content)
+        if action is None:
+            raise SmartmeterConnectionError("No form found on the login page.")
+        return action
+
+    @timed("login/credentials")
+    async def credentials_login(self, url):
+        """
+        login with credentials provided the login url
+        """
+        try:
+            async with self._session().post(
+                url,
+                data={
+                    "username": self.username,
+                    "login": " "
+                },
+                allow_redirects=False,
+            ) as result:
+                action = self._form_action(await result.read())
+            if action is None:
+                raise SmartmeterConnectionError("No form found on the credentials page.")
+
+            async with self._session().post(
+                action,
+                data={
+                    "username": self.username,
+                    "password": self.password,
+                },
+                allow_redirects=False,
+            ) as result:
+                headers = result.headers
+        except Exception as exception:
+            raise SmartmeterConnectionError(
+                "Could not login with credentials"
+            ) from exception
+
+        return self._extract_code(headers)
+
+    @timed("login/tokens")
+    async def load_tokens(self, code):
+        """
+        Provided the totp code loads access and refresh token
+        """
+        try:
+            async with self._session().post(
+                const.AUTH_URL + "token",
+                data=const.build_access_token_args(code=code, code_verifier=self._code_verifier)
+            ) as result:
+                status = result.status
+                content = await result.read()
+        except Exception as exception:
+            raise SmartmeterConnectionError(
+                "Could not obtain access token"
+            ) from exception
+
+        if status != 200:
+            raise SmartmeterConnectionError(
+                f"Could not obtain access token: {content}"
+            )
+        return self._check_tokens(json.loads(content))
+
+    @timed("login/refresh")
+    async def refresh_tokens(self):
+        """
+        Obtains new access (and refresh) token using the refresh token grant
+        """
+        try:
+            async with self._session().post(
+                const.AUTH_URL + "token",
+                data=const.build_refresh_token_args(refresh_token=self._refresh_token)
+            ) as result:
+                status = result.status
+                content = await result.read()
+        except Exception as exception:
+            raise SmartmeterConnectionError(
+                "Could not refresh access token"
+            ) from exception
+        return self._check_refreshed_tokens(status, content, lambda: json.loads(content))
+
+    async def login(self):
+        """
+        login with credentials specified in ctor (or refresh the tokens), see `Smartmeter.login`
+        """
+        async with self._login_lock:
+            if self.is_logged_in() and not self.is_access_token_expiring():
+                return self
+            if self.can_refresh():
+                try:
+                    self._set_tokens(await self.refresh_tokens())
+                    if self._api_gateway_token is None or self._api_gateway_b2b_token is None:
+                        self._api_gateway_token, self._api_gateway_b2b_token = await self._get_api_key(
+                            self._access_token
+                        )
+                    return self
+                except SmartmeterLoginError as exception:
+                    logger.debug("Falling back to login with credentials: %s", exception)
+            if self._access_token is not None:
+                self.reset()
+            url = await self.load_login_page()
+            code = await self.credentials_login(url)
+            tokens = await self.load_tokens(code)
+            self._set_tokens(tokens)
+
+            self._api_gateway_token, self._api_gateway_b2b_token = await self._get_api_key(
+                self._access_token
+            )
+        return self
+
+    async def _renew_access_if_expiring(self):
+        """Refreshes the access token shortly before it expires"""
+        if self._access_token is not None and self.is_access_token_expiring():
+            await self.login()
+
+    @timed("app-config")
+    async def _get_api_key(self, token):
+        self._access_valid_or_raise()
+
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            async with self._session().get(const.API_CONFIG_URL, headers=headers) as response:
+                result = await response.json(content_type=None)
+        except Exception as exception:
+            raise SmartmeterConnectionError("Could not obtain API key") from exception
+
+        return self._apply_api_config(result)
+
+    async def _send(self, method, url, headers, data, timeout, limit_key, metric, stream=False):
+        """
+        sends a request according to the rate limiter and request policy and returns the final response and its body
+        If stream is set, the body has not been read yet (None) and the caller has to release the response.
+        """
+        attempt = 0
+        while True:
+            wait = self.rate_limiter.reserve(limit_key)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            start = time.perf_counter()
+            body = None
+            try:
+                response = await self._session().request(
+                    method, url, headers=headers, json=data, timeout=aiohttp.ClientTimeout(total=timeout)
+                )
+                if not stream:
+                    # read the body while the connection is still held
+                    try:
+                        body = await response.read()
+                    finally:
+                        response.release()
+            except aiohttp.ClientConnectionError as exception:
+                self.metrics.record_request(metric, time.perf_counter() - start, error=exception, retry=attempt > 0)
+                # timeouts are left to the caller, repeating the same (large) query rarely helps
+                if isinstance(exception, asyncio.TimeoutError) or not self.request_policy.should_retry_error(method, attempt):
+                    raise
+                delay = self.request_policy.delay(attempt)
+                logger.debug("API Request %s failed (%r), retrying in %.1fs", url, exception, delay)
+            except Exception as exception:
+                self.metrics.record_request(metric, time.perf_counter() - start, error=exception, retry=attempt > 0)
+                raise
+            else:
+                self.metrics.record_request(metric, time.perf_counter() - start, response.status,
+                                            None if body is None else len(body), retry=attempt > 0)
+                if not self.request_policy.should_retry_status(method, response.status, attempt):
+                    return response, body
+                delay = self.request_policy.delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                logger.debug("API Request %s returned %d, retrying in %.1fs", url, response.status, delay)
+                response.release()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _call_api(
+        self,
+        endpoint,
+        base_url=None,
+        method="GET",
+        data=None,
+        query=None,
+        return_response=False,
+        timeout=60.0,
+        extra_headers=None,
+    ):
+        await self._renew_access_if_expiring()
+        self._access_valid_or_raise()
+
+        url, headers = self._build_request(endpoint, base_url, data, query, extra_headers)
+        metric = endpoint_name(endpoint)
+        response, body = await self._send(method, url, headers, data, timeout, base_url or const.API_URL, metric)
+
+        payloads.log_exchange(url, data, body)
+
+        if return_response:
+            return response
+
+        if not body:
+            return None
+        start = time.perf_counter()
+        result = json.loads(body)
+        self.metrics.record_decode(metric, time.perf_counter() - start)
+        return result
+
+    async def _stream_api(
+        self,
+        endpoint,
+        key,
+        base_url=None,
+        query=None,
+        timeout=60.0,
+        extra_headers=None,
+        parser: JsonArrayStream = None,
+    ) -> AsyncIterator[Any]:
+        """
+        GETs the given endpoint and yields the items of the array `key` of the response while it is received.
+        The rest of the response is available as `parser.envelope` afterwards.
+        """
+        await self._renew_access_if_expiring()
+        self._access_valid_or_raise()
+
+        url, headers = self._build_request(endpoint, base_url, None, query, extra_headers)
+        metric = endpoint_name(endpoint)
+        parser = parser or JsonArrayStream(key)
+        response, _ = await self._send("GET", url, headers, None, timeout, base_url or const.API_URL, metric,
+                                       stream=True)
+        try:
+            if response.status != 200:
+                raise SmartmeterConnectionError(
+                    f"API Request {metric} failed with status {response.status}: {await response.read()}",
+                    code=response.status,
+                )
+            size = 0
+            decoding = 0.0
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                start = time.perf_counter()
+                items = parser.feed(chunk)
+                decoding += time.perf_counter() - start
+                for item in items:
+                    yield item
+            start = time.perf_counter()
+            parser.close()
+            self.metrics.record_decode(metric, decoding + time.perf_counter() - start)
+            self.metrics.record_size(metric, size)
+            logger.debug("\nAPI Request: %s\n\nAPI Response: %d %s streamed, envelope %s", url, parser.count, key,
+                         parser.envelope)
+        finally:
+            response.release()
+
+    async def get_zaehlpunkt(self, zaehlpunkt: str = None) -> tuple[str, str, str]:
+        info = await self.zaehlpunkt_info(zaehlpunkt)
+        return info.customer_id, info.zaehlpunktnummer, info.anlagetype
+
+    async def zaehlpunkt_info(self, zaehlpunkt: str = None) -> ZaehlpunktInfo:
+        """Returns the (cached) metadata of the given zaehlpunkt or the first one if None."""
+        await self.zaehlpunkte()
+        return self._lookup_zaehlpunkt(zaehlpunkt)
+
+    async def zaehlpunkte(self):
+        """Returns zaehlpunkte for currently logged in user (cached for `zaehlpunkte_ttl` seconds)."""
+        if self._zaehlpunkte_cached():
+            return self._zaehlpunkte
+        return self._cache_zaehlpunkte(await self._call_api("zaehlpunkte"))
+
+    async def contracts(self) -> tuple[Contract, ...]:
+        """Returns the contracts and their zaehlpunkte as models. See `Smartmeter.contracts`."""
+        await self.zaehlpunkte()
+        return self._contracts
+
+    async def consumptions(self):
+        """Returns response from 'consumptions' endpoint."""
+        return await self._call_api("zaehlpunkt/consumptions")
+
+    async def base_information(self):
+        """Returns response from 'baseInformation' endpoint."""
+        return await self._call_api("zaehlpunkt/baseInformation")
+
+    async def meter_readings(self):
+        """Returns response from 'meterReadings' endpoint."""
+        return await self._call_api("zaehlpunkt/meterReadings")
+
+    async def verbrauch(
+        self,
+        customer_id: str,
+        zaehlpunkt: str,
+        date_from: datetime,
+        resolution: const.Resolution = const.Resolution.HOUR
+    ):
+        """Returns energy usage. See `Smartmeter.verbrauch`."""
+        if zaehlpunkt is None or customer_id is None:
+            customer_id, zaehlpunkt, anlagetype = await self.get_zaehlpunkt()
+        endpoint = f"messdaten/{customer_id}/{zaehlpunkt}/verbrauch"
+        query = const.build_verbrauchs_args(
+            # This one does not have a dateTo...
+            dateFrom=self._dt_string(date_from),
+            dayViewResolution=resolution.value
+        )
+        return await self._call_api(endpoint, query=query)
+
+    async def verbrauchRaw(
+        self,
+        customer_id: str,
+        zaehlpunkt: str,
+        date_from: datetime,
+        date_to: datetime = None,
+    ):
+        """Returns daily energy usage. See `Smartmeter.verbrauchRaw`."""
+        if date_to is None:
+            date_to = datetime.now()
+        if zaehlpunkt is None or customer_id is None:
+            customer_id, zaehlpunkt, anlagetype = await self.get_zaehlpunkt()
+        endpoint = f"messdaten/{customer_id}/{zaehlpunkt}/verbrauchRaw"
+        query = dict(
+            # These are the only three fields that are used for that endpoint:
+            dateFrom=self._dt_string(date_from),
+            dateTo=self._dt_string(date_to),
+            granularity="DAY",
+        )
+        return await self._call_api(endpoint, query=query)
+
+    async def profil(self):
+        """Returns profile of a logged-in user. See `Smartmeter.profil`."""
+        return await self._call_api("user/profile", const.API_URL_ALT)
+
+    async def ereignisse(
+        self, date_from: datetime, date_to: datetime = None, zaehlpunkt=None
+    ):
+        """Returns events between date_from and date_to. See `Smartmeter.ereignisse`."""
+        if date_to is None:
+            date_to = datetime.now()
+        if zaehlpunkt is None:
+            customer_id, zaehlpunkt, anlagetype = await self.get_zaehlpunkt()
+        query = {
+            "zaehlpunkt": zaehlpunkt,
+            "dateFrom": self._dt_string(date_from),
+            "dateUntil": self._dt_string(date_to),
+        }
+        return await self._call_api("user/ereignisse", const.API_URL_ALT, query=query)
+
+    async def create_ereignis(self, zaehlpunkt, name, date_from, date_to=None):
+        """Creates new event. See `Smartmeter.create_ereignis`."""
+        data = self._ereignis_data(zaehlpunkt, name, date_from, date_to)
+        return await self._call_api("user/ereignis", data=data, method="POST")
+
+    async def delete_ereignis(self, ereignis_id):
+        """Deletes ereignis."""
+        return await self._call_api(f"user/ereignis/{ereignis_id}", method="DELETE")
+
+    async def historical_data(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.METER_READ
+    ):
+        """Query historical data in a batch. See `Smartmeter.historical_data`."""
+        customer_id, zaehlpunkt, anlagetype = await self.get_zaehlpunkt(zaehlpunktnummer)
+
+        query = self._historical_data_query(date_from, date_until, valuetype)
+
+        extra = {
+            # For this API Call, requesting json is important!
+            "Accept": "application/json"
+        }
+
+        data = await self._call_api(
+            f"zaehlpunkte/{customer_id}/{zaehlpunkt}/messwerte",
+            base_url=const.API_URL_B2B,
+            query=query,
+            extra_headers=extra,
+        )
+
+        return self._check_historical_data(data, zaehlpunkt)
+
+    async def bewegungsdaten(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.QUARTER_HOUR,
+        aggregat: str = None,
+    ):
+        """Query bewegungsdaten in a batch. See `Smartmeter.bewegungsdaten`."""
+        customer_id, zaehlpunkt, anlagetype = await self.get_zaehlpunkt(zaehlpunktnummer)
+
+        query = self._bewegungsdaten_query(
+            customer_id, zaehlpunkt, anlagetype, date_from, date_until, valuetype, aggregat
+        )
+
+        extra = {
+            # For this API Call, requesting json is important!
+            "Accept": "application/json"
+        }
+
+        data = await self._call_api(
+            "user/messwerte/bewegungsdaten",
+            base_url=const.API_URL_ALT,
+            query=query,
+            extra_headers=extra,
+        )
+        return self._check_bewegungsdaten(data, zaehlpunkt)
+
+    async def bewegungsdaten_stream(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.QUARTER_HOUR,
+        aggregat: str = None,
+        parser: JsonArrayStream = None,
+    ) -> AsyncIterator[dict]:
+        """Yield bewegungsdaten values while they are received. See `Smartmeter.bewegungsdaten_stream`."""
+        customer_id, zaehlpunkt, anlagetype = await self.get_zaehlpunkt(zaehlpunktnummer)
+
+        query = self._bewegungsdaten_query(
+            customer_id, zaehlpunkt, anlagetype, date_from, date_until, valuetype, aggregat
+        )
+        parser = parser or JsonArrayStream("values")
+        async for value in self._stream_api(
+            "user/messwerte/bewegungsdaten",
+            "values",
+            base_url=const.API_URL_ALT,
+            query=query,
+            extra_headers={"Accept": "application/json"},
+            parser=parser,
+        ):
+            yield value
+        self._check_bewegungsdaten(parser.envelope, zaehlpunkt)
+
+    async def historical_data_range(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.METER_READ,
+        window=range_fetcher.DEFAULT_WINDOW,
+        max_concurrency: int = range_fetcher.DEFAULT_MAX_CONCURRENCY,
+    ):
+        """
+        Query historical data like `historical_data`, but split into windows of the given size,
+        which are fetched concurrently and merged into a single result.
+        """
+        date_from, date_until = self._default_range(date_from, date_until)
+        # resolve (and cache) the zaehlpunkt once instead of in every window
+        await self.get_zaehlpunkt(zaehlpunktnummer)
+        windows = range_fetcher.split_range(date_from, date_until, window)
+        responses = await range_fetcher.fetch_windows(
+            lambda start, end: self.historical_data(zaehlpunktnummer, start, end, valuetype),
+            windows,
+            max_concurrency,
+        )
+        return range_fetcher.merge_historical_data(responses)
+
+    async def bewegungsdaten_range(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.QUARTER_HOUR,
+        aggregat: str = None,
+        window=range_fetcher.DEFAULT_WINDOW,
+        max_concurrency: int = range_fetcher.DEFAULT_MAX_CONCURRENCY,
+    ):
+        """
+        Query bewegungsdaten like `bewegungsdaten`, but split into windows of the given size,
+        which are fetched concurrently and merged into a single result.
+        A window running into a timeout is split up further.
+        """
+        date_from, date_until = self._default_range(date_from, date_until)
+        # resolve (and cache) the zaehlpunkt once instead of in every window
+        await self.get_zaehlpunkt(zaehlpunktnummer)
+        windows = range_fetcher.split_range(date_from, date_until, window)
+        responses = await range_fetcher.fetch_windows(
+            lambda start, end: self.bewegungsdaten(zaehlpunktnummer, start, end, valuetype, aggregat),
+            windows,
+            max_concurrency,
+        )
+        return range_fetcher.merge_bewegungsdaten(responses)
+
+    async def bewegungsdaten_series(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.QUARTER_HOUR,
+        aggregat: str = None,
+        window=range_fetcher.DEFAULT_WINDOW,
+        max_concurrency: int = range_fetcher.DEFAULT_MAX_CONCURRENCY,
+    ) -> dict:
+        """
+        Query bewegungsdaten like `bewegungsdaten_range`, but stream every window into a compact MeasurementSeries,
+        so neither the responses nor one dict per value are kept in memory.
+        """
+        date_from, date_until = self._default_range(date_from, date_until)
+        await self.get_zaehlpunkt(zaehlpunktnummer)
+
+        async def fetch(start, end):
+            parser = JsonArrayStream("values")
+            builder = SeriesBuilder()
+            async for value in self.bewegungsdaten_stream(zaehlpunktnummer, start, end, valuetype, aggregat, parser):
+                builder.append(value)
+            return parser.envelope, builder.build()
+
+        windows = range_fetcher.split_range(date_from, date_until, window)
+        responses = await range_fetcher.fetch_windows(fetch, windows, max_concurrency)
+        if not responses:
+            return {}
+        return {
+            **responses[0][0],
+            "values": MeasurementSeries.concat(series for _, series in responses),
+        }
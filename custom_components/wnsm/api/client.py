@@ -1,9 +1,8 @@
 """Contains the Smartmeter API Client."""
-import json
 import logging
 from datetime import datetime, timedelta, date
 from urllib import parse
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Iterator, Optional
 
 import requests
 from dateutil.relativedelta import relativedelta
@@ -14,8 +13,14 @@ import hashlib
 import os
 import copy
 import re
-
-from . import constants as const
+import time
+
+from . import constants as const, payloads
+from .metrics import MetricsRegistry, endpoint_name, timed
+from .models import BewegungsdatenDescriptor, Contract, Zaehlpunkt, contracts_from_json
+from .policy import DEFAULT_RATE_LIMITER, RateLimiter, RequestPolicy, parse_retry_after
+from .series import MeasurementSeries
+from .streaming import STREAM_CHUNK_SIZE, JsonArrayStream
 from .errors import (
     SmartmeterConnectionError,
     SmartmeterLoginError,
@@ -25,26 +30,46 @@ from .errors import (
 logger = logging.getLogger(__name__)
 
 
+def _timestamp(value: datetime = None):
+    return None if value is None else value.timestamp()
+
+
+def _datetime(value: float = None):
+    return None if value is None else datetime.fromtimestamp(value)
+
+
+#: metadata of a zaehlpunkt, as indexed from the 'zaehlpunkte' response
+ZaehlpunktInfo = Zaehlpunkt
+
+
 class Smartmeter:
     """Smartmeter client."""
 
-    def __init__(self, username, password, input_code_verifier=None):
+    def __init__(self, username, password, input_code_verifier=None, zaehlpunkte_ttl=const.ZAEHLPUNKTE_TTL,
+                 request_policy: RequestPolicy = None, rate_limiter: RateLimiter = None,
+                 metrics: MetricsRegistry = None):
         """Access the Smartmeter API.
 
         Args:
             username (str): Username used for API Login.
             password (str): Password used for API Login.
+            zaehlpunkte_ttl (float, optional): Seconds the response of 'zaehlpunkte' is cached.
+            request_policy (RequestPolicy, optional): Retries of failing api calls.
+            rate_limiter (RateLimiter, optional): Limits the rate of api calls per api (shared by default).
+            metrics (MetricsRegistry, optional): Collects latency, size and error metrics per endpoint.
         """
         self.username = username
         self.password = password
-        self.session = requests.Session()
+        self.session = self._new_session()
         self._access_token = None
         self._refresh_token = None
         self._api_gateway_token = None
         self._access_token_expiration = None
         self._refresh_token_expiration = None
         self._api_gateway_b2b_token = None
-        
+        #: called whenever new tokens have been taken over (login or refresh), e.g. to persist them
+        self.on_tokens_updated: Optional[Callable[[], None]] = None
+
         self._code_verifier = None
         if input_code_verifier is not None:
             if self.is_valid_code_verifier(input_code_verifier):
@@ -53,8 +78,23 @@ class Smartmeter:
         self._code_challenge = None
         self._local_login_args = None
 
+        self.zaehlpunkte_ttl = zaehlpunkte_ttl
+        self._zaehlpunkte = None
+        self._zaehlpunkte_expiration = None
+        self._contracts: tuple[Contract, ...] = ()
+        self._zaehlpunkte_index: dict[str, ZaehlpunktInfo] = {}
+        self._default_zaehlpunkt: Optional[ZaehlpunktInfo] = None
+
+        self.request_policy = request_policy or RequestPolicy()
+        self.rate_limiter = rate_limiter or DEFAULT_RATE_LIMITER
+        self.metrics = metrics or MetricsRegistry()
+
+    def _new_session(self):
+        """creates the session all requests are sent with"""
+        return requests.Session()
+
     def reset(self):
-        self.session = requests.Session()
+        self.session = self._new_session()
         self._access_token = None
         self._refresh_token = None
         self._api_gateway_token = None
@@ -71,6 +111,60 @@ class Smartmeter:
     def is_logged_in(self):
         return self._access_token is not None and not self.is_login_expired()
 
+    def is_access_token_expiring(self):
+        """
+        True if the access token expires within the next ACCESS_TOKEN_REFRESH_MARGIN seconds
+        """
+        return self._access_token_expiration is not None and datetime.now() >= (
+            self._access_token_expiration - timedelta(seconds=const.ACCESS_TOKEN_REFRESH_MARGIN)
+        )
+
+    def can_refresh(self):
+        """
+        True if a refresh token is present, which has not expired yet
+        """
+        return self._refresh_token is not None and self._refresh_token_expiration is not None \
+            and datetime.now() < self._refresh_token_expiration
+
+    def export_auth_state(self) -> dict:
+        """
+        returns the login state (tokens, their expiration, code verifier and gateway keys) as json serializable dict
+        """
+        return {
+            "username": self.username,
+            "access_token": self._access_token,
+            "access_token_expiration": _timestamp(self._access_token_expiration),
+            "refresh_token": self._refresh_token,
+            "refresh_token_expiration": _timestamp(self._refresh_token_expiration),
+            "code_verifier": self._code_verifier,
+            "api_gateway_token": self._api_gateway_token,
+            "api_gateway_b2b_token": self._api_gateway_b2b_token,
+        }
+
+    def restore_auth_state(self, state: dict) -> bool:
+        """
+        restores a login state created by `export_auth_state`
+        Returns True if the state has been taken over, i.e. it belongs to this user and can still be used.
+        """
+        if not state or state.get("username") != self.username:
+            return False
+        refresh_token_expiration = _datetime(state.get("refresh_token_expiration"))
+        access_token_expiration = _datetime(state.get("access_token_expiration"))
+        now = datetime.now()
+        if not any(expiration is not None and now < expiration
+                   for expiration in (access_token_expiration, refresh_token_expiration)):
+            return False
+        self._access_token = state.get("access_token")
+        self._access_token_expiration = access_token_expiration
+        self._refresh_token = state.get("refresh_token")
+        self._refresh_token_expiration = refresh_token_expiration
+        code_verifier = state.get("code_verifier")
+        if code_verifier is not None and self.is_valid_code_verifier(code_verifier):
+            self._code_verifier = code_verifier
+        self._api_gateway_token = state.get("api_gateway_token")
+        self._api_gateway_b2b_token = state.get("api_gateway_b2b_token")
+        return True
+
     def generate_code_verifier(self):
         """
         generate a code verifier
@@ -94,11 +188,10 @@ class Smartmeter:
         
         return True
     
-    def load_login_page(self):
+    def _prepare_login_url(self):
         """
-        loads login page and extracts encoded login url
+        prepares PKCE parameters and returns the url of the login page
         """
-        
         #generate a code verifier, which serves as a secure random value
         if not hasattr(self, '_code_verifier') or self._code_verifier is None:
            #only generate if it does not exist 
@@ -113,7 +206,22 @@ class Smartmeter:
         #add code_challenge in self._local_login_args
         self._local_login_args["code_challenge"] = self._code_challenge
         
-        login_url = const.AUTH_URL + "auth?" + parse.urlencode(self._local_login_args)
+        return const.AUTH_URL + "auth?" + parse.urlencode(self._local_login_args)
+
+    @staticmethod
+    def _form_action(content):
+        """
+        extracts the action of the first form in the given html content
+        """
+        forms = html.fromstring(content).xpath("(//form/@action)")
+        return forms[0] if forms else None
+
+    @timed("login/page")
+    def load_login_page(self):
+        """
+        loads login page and extracts encoded login url
+        """
+        login_url = self._prepare_login_url()
         try:
             result = self.session.get(login_url)
         except Exception as exception:
@@ -122,15 +230,12 @@ class Smartmeter:
             raise SmartmeterConnectionError(
                 f"Could not load login page. Error: {result.content}"
             )
-        tree = html.fromstring(result.content)
-        forms = tree.xpath("(//form/@action)")
-        
-        if not forms:
+        action = self._form_action(result.content)
+        if action is None:
             raise SmartmeterConnectionError("No form found on the login page.")
-        
-        action = forms[0]
         return action
 
+    @timed("login/credentials")
     def credentials_login(self, url):
         """
         login with credentials provided the login url
@@ -144,8 +249,9 @@ class Smartmeter:
                 },
                 allow_redirects=False,
             )
-            tree = html.fromstring(result.content)
-            action = tree.xpath("(//form/@action)")[0]
+            action = self._form_action(result.content)
+            if action is None:
+                raise SmartmeterConnectionError("No form found on the credentials page.")
 
             result = self.session.post(
                 action,
@@ -160,9 +266,16 @@ class Smartmeter:
                 "Could not login with credentials"
             ) from exception
 
-        if "Location" not in result.headers:
+        return self._extract_code(result.headers)
+
+    @staticmethod
+    def _extract_code(headers):
+        """
+        extracts the authorization code from the 'Location' header of the login redirect
+        """
+        if "Location" not in headers:
             raise SmartmeterLoginError("Login failed. Check username/password.")
-        location = result.headers["Location"]
+        location = headers["Location"]
 
         parsed_url = parse.urlparse(location)
 
@@ -181,6 +294,7 @@ class Smartmeter:
         code = fragment_dict["code"]
         return code
 
+    @timed("login/tokens")
     def load_tokens(self, code):
         """
         Provided the totp code loads access and refresh token
@@ -199,46 +313,109 @@ class Smartmeter:
             raise SmartmeterConnectionError(
                 f"Could not obtain access token: {result.content}"
             )
-        tokens = result.json()
+        return self._check_tokens(result.json())
+
+    @staticmethod
+    def _check_tokens(tokens):
+        """
+        validates the token response of the auth server
+        """
         if tokens["token_type"] != "Bearer":
             raise SmartmeterLoginError(
                 f'Bearer token required, but got {tokens["token_type"]!r}'
             )
         return tokens
 
-    def login(self):
+    def _set_tokens(self, tokens):
         """
-        login with credentials specified in ctor
+        takes over access and refresh token from a token response
         """
-        if self.is_login_expired():
-            self.reset()
-        if not self.is_logged_in():
-            url = self.load_login_page()
-            code = self.credentials_login(url)
-            tokens = self.load_tokens(code)
-            self._access_token = tokens["access_token"]
+        now = datetime.now()
+        self._access_token = tokens["access_token"]
+        self._access_token_expiration = now + timedelta(seconds=tokens["expires_in"])
+        # a refresh grant may not rotate the refresh token
+        if "refresh_token" in tokens:
             self._refresh_token = tokens["refresh_token"]
-            now = datetime.now()
-            self._access_token_expiration = now + timedelta(seconds=tokens["expires_in"])
             self._refresh_token_expiration = now + timedelta(
                 seconds=tokens["refresh_expires_in"]
             )
 
-            logger.debug("Access Token valid until %s" % self._access_token_expiration)
+        logger.debug("Access Token valid until %s" % self._access_token_expiration)
+        if self.on_tokens_updated is not None:
+            self.on_tokens_updated()
+
+    @timed("login/refresh")
+    def refresh_tokens(self):
+        """
+        Obtains new access (and refresh) token using the refresh token grant
+        """
+        try:
+            result = self.session.post(
+                const.AUTH_URL + "token",
+                data=const.build_refresh_token_args(refresh_token=self._refresh_token)
+            )
+        except Exception as exception:
+            raise SmartmeterConnectionError(
+                "Could not refresh access token"
+            ) from exception
+        return self._check_refreshed_tokens(result.status_code, result.content, result.json)
 
-            self._api_gateway_token, self._api_gateway_b2b_token = self._get_api_key(
-                self._access_token
+    def _check_refreshed_tokens(self, status, content, decode):
+        """
+        validates the response of a refresh token grant
+        """
+        if status in (400, 401):
+            # e.g. the session has been terminated on the server side
+            raise SmartmeterLoginError(f"Refresh token has been rejected: {content}")
+        if status != 200:
+            raise SmartmeterConnectionError(
+                f"Could not refresh access token: {content}"
             )
+        return self._check_tokens(decode())
+
+    def login(self):
+        """
+        login with credentials specified in ctor
+        If the access token is about to expire, but the refresh token is still valid,
+        the tokens are refreshed instead of performing the whole login again.
+        """
+        if self.is_logged_in() and not self.is_access_token_expiring():
+            return self
+        if self.can_refresh():
+            try:
+                self._set_tokens(self.refresh_tokens())
+                if self._api_gateway_token is None or self._api_gateway_b2b_token is None:
+                    self._api_gateway_token, self._api_gateway_b2b_token = self._get_api_key(
+                        self._access_token
+                    )
+                return self
+            except SmartmeterLoginError as exception:
+                logger.debug("Falling back to login with credentials: %s", exception)
+        if self._access_token is not None:
+            self.reset()
+        url = self.load_login_page()
+        code = self.credentials_login(url)
+        tokens = self.load_tokens(code)
+        self._set_tokens(tokens)
+
+        self._api_gateway_token, self._api_gateway_b2b_token = self._get_api_key(
+            self._access_token
+        )
         return self
 
+    def _renew_access_if_expiring(self):
+        """Refreshes the access token shortly before it expires"""
+        if self._access_token is not None and self.is_access_token_expiring():
+            self.login()
+
     def _access_valid_or_raise(self):
         """Checks if the access token is still valid or raises an exception"""
         if datetime.now() >= self._access_token_expiration:
-            # TODO: If the refresh token is still valid, it could be refreshed here
             raise SmartmeterConnectionError(
                 "Access Token is not valid anymore, please re-log!"
             )
 
+    @timed("app-config")
     def _get_api_key(self, token):
         self._access_valid_or_raise()
 
@@ -248,6 +425,13 @@ class Smartmeter:
         except Exception as exception:
             raise SmartmeterConnectionError("Could not obtain API key") from exception
 
+        return self._apply_api_config(result)
+
+    @staticmethod
+    def _apply_api_config(result):
+        """
+        extracts the gateway api keys from app-config.json and takes over changed api urls
+        """
         find_keys = ["b2cApiKey", "b2bApiKey"]
         for key in find_keys:
             if key not in result:
@@ -268,19 +452,10 @@ class Smartmeter:
     def _dt_string(datetime_string):
         return datetime_string.strftime(const.API_DATE_FORMAT)[:-3] + "Z"
 
-    def _call_api(
-        self,
-        endpoint,
-        base_url=None,
-        method="GET",
-        data=None,
-        query=None,
-        return_response=False,
-        timeout=60.0,
-        extra_headers=None,
-    ):
-        self._access_valid_or_raise()
-
+    def _build_request(self, endpoint, base_url=None, data=None, query=None, extra_headers=None):
+        """
+        builds url and headers of an api call
+        """
         if base_url is None:
             base_url = const.API_URL
         url = parse.urljoin(base_url, endpoint)
@@ -307,38 +482,172 @@ class Smartmeter:
         if data:
             headers["Content-Type"] = "application/json"
 
-        response = self.session.request(
-            method, url, headers=headers, json=data, timeout=timeout
-        )
+        return url, headers
 
-        logger.debug("\nAPI Request: %s\n%s\n\nAPI Response: %s" % (
-            url, ("" if data is None else "body: "+json.dumps(data, indent=2)),
-            None if response is None or response.json() is None else json.dumps(response.json(), indent=2)))
+    def _send(self, method, url, headers, data, timeout, limit_key, metric, stream=False):
+        """
+        sends a request according to the rate limiter and request policy and returns the final response
+        If stream is set, the body has not been read yet.
+        """
+        attempt = 0
+        while True:
+            wait = self.rate_limiter.reserve(limit_key)
+            if wait > 0:
+                time.sleep(wait)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, url, headers=headers, json=data, timeout=timeout, stream=stream
+                )
+            except requests.ConnectionError as exception:
+                self.metrics.record_request(metric, time.perf_counter() - start, error=exception, retry=attempt > 0)
+                # read timeouts are left to the caller, repeating the same (large) query rarely helps
+                if not self.request_policy.should_retry_error(method, attempt):
+                    raise
+                delay = self.request_policy.delay(attempt)
+                logger.debug("API Request %s failed (%s), retrying in %.1fs", url, exception, delay)
+            except Exception as exception:
+                self.metrics.record_request(metric, time.perf_counter() - start, error=exception, retry=attempt > 0)
+                raise
+            else:
+                self.metrics.record_request(metric, time.perf_counter() - start, response.status_code,
+                                            None if stream else len(response.content), retry=attempt > 0)
+                if not self.request_policy.should_retry_status(method, response.status_code, attempt):
+                    return response
+                delay = self.request_policy.delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                logger.debug("API Request %s returned %d, retrying in %.1fs", url, response.status_code, delay)
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def _call_api(
+        self,
+        endpoint,
+        base_url=None,
+        method="GET",
+        data=None,
+        query=None,
+        return_response=False,
+        timeout=60.0,
+        extra_headers=None,
+    ):
+        self._renew_access_if_expiring()
+        self._access_valid_or_raise()
+
+        url, headers = self._build_request(endpoint, base_url, data, query, extra_headers)
+        metric = endpoint_name(endpoint)
+        response = self._send(method, url, headers, data, timeout, base_url or const.API_URL, metric)
 
         if return_response:
             return response
 
-        return response.json()
+        start = time.perf_counter()
+        result = response.json()
+        self.metrics.record_decode(metric, time.perf_counter() - start)
+
+        payloads.log_exchange(url, data, result)
+
+        return result
+
+    def _stream_api(
+        self,
+        endpoint,
+        key,
+        base_url=None,
+        query=None,
+        timeout=60.0,
+        extra_headers=None,
+        parser: JsonArrayStream = None,
+    ) -> Iterator[Any]:
+        """
+        GETs the given endpoint and yields the items of the array `key` of the response while it is received.
+        The rest of the response is available as `parser.envelope` afterwards.
+        """
+        self._renew_access_if_expiring()
+        self._access_valid_or_raise()
+
+        url, headers = self._build_request(endpoint, base_url, None, query, extra_headers)
+        metric = endpoint_name(endpoint)
+        parser = parser or JsonArrayStream(key)
+        response = self._send("GET", url, headers, None, timeout, base_url or const.API_URL, metric, stream=True)
+        try:
+            if response.status_code != 200:
+                raise SmartmeterConnectionError(
+                    f"API Request {metric} failed with status {response.status_code}: {response.content}",
+                    code=response.status_code,
+                )
+            size = 0
+            decoding = 0.0
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                start = time.perf_counter()
+                items = parser.feed(chunk)
+                decoding += time.perf_counter() - start
+                yield from items
+            start = time.perf_counter()
+            parser.close()
+            self.metrics.record_decode(metric, decoding + time.perf_counter() - start)
+            self.metrics.record_size(metric, size)
+            logger.debug("\nAPI Request: %s\n\nAPI Response: %d %s streamed, envelope %s", url, parser.count, key,
+                         parser.envelope)
+        finally:
+            response.close()
 
     def get_zaehlpunkt(self, zaehlpunkt: str = None) -> tuple[str, str, str]:
-        contracts = self.zaehlpunkte()
-        if zaehlpunkt is None:
-            customer_id = contracts[0]["geschaeftspartner"]
-            zp = contracts[0]["zaehlpunkte"][0]["zaehlpunktnummer"]
-            anlagetype = contracts[0]["zaehlpunkte"][0]["anlage"]["typ"]
-        else:
-            customer_id = zp = anlagetype = None
-            for contract in contracts:
-                zp_details = [z for z in contract["zaehlpunkte"] if z["zaehlpunktnummer"] == zaehlpunkt]
-                if len(zp_details) > 0:
-                    anlagetype = zp_details[0]["anlage"]["typ"]
-                    zp = zp_details[0]["zaehlpunktnummer"]
-                    customer_id = contract["geschaeftspartner"]
-        return customer_id, zp, const.AnlagenType.from_str(anlagetype)
+        info = self.zaehlpunkt_info(zaehlpunkt)
+        return info.customer_id, info.zaehlpunktnummer, info.anlagetype
+
+    def zaehlpunkt_info(self, zaehlpunkt: str = None) -> ZaehlpunktInfo:
+        """Returns the (cached) metadata of the given zaehlpunkt or the first one if None."""
+        self.zaehlpunkte()
+        return self._lookup_zaehlpunkt(zaehlpunkt)
+
+    def _lookup_zaehlpunkt(self, zaehlpunkt: str = None) -> ZaehlpunktInfo:
+        """
+        returns the metadata of the given (or the first) zaehlpunkt from the index
+        """
+        info = self._default_zaehlpunkt if zaehlpunkt is None else self._zaehlpunkte_index.get(zaehlpunkt)
+        if info is None:
+            raise SmartmeterQueryError(f"Zaehlpunkt {zaehlpunkt} not found!")
+        return info
+
+    def _zaehlpunkte_cached(self) -> bool:
+        return self._zaehlpunkte is not None and time.monotonic() < self._zaehlpunkte_expiration
+
+    def _cache_zaehlpunkte(self, contracts):
+        """
+        caches the 'zaehlpunkte' response, builds its models once and indexes them by zaehlpunktnummer
+        """
+        models = contracts_from_json(contracts)
+        index = {}
+        for contract in models:
+            for zp in contract.zaehlpunkte:
+                index[zp.zaehlpunktnummer] = zp
+        self._zaehlpunkte = contracts
+        self._contracts = models
+        self._zaehlpunkte_expiration = time.monotonic() + self.zaehlpunkte_ttl
+        self._zaehlpunkte_index = index
+        self._default_zaehlpunkt = next((zp for contract in models for zp in contract.zaehlpunkte), None)
+        return contracts
+
+    def invalidate_zaehlpunkte(self):
+        """Drops the cached 'zaehlpunkte' response, the next access queries the api again."""
+        self._zaehlpunkte = None
+        self._zaehlpunkte_expiration = None
+        self._contracts = ()
+        self._zaehlpunkte_index = {}
+        self._default_zaehlpunkt = None
 
     def zaehlpunkte(self):
-        """Returns zaehlpunkte for currently logged in user."""
-        return self._call_api("zaehlpunkte")
+        """Returns zaehlpunkte for currently logged in user (cached for `zaehlpunkte_ttl` seconds)."""
+        if self._zaehlpunkte_cached():
+            return self._zaehlpunkte
+        return self._cache_zaehlpunkte(self._call_api("zaehlpunkte"))
+
+    def contracts(self) -> tuple[Contract, ...]:
+        """Returns the contracts and their zaehlpunkte of the 'zaehlpunkte' response as models (cached as well)."""
+        self.zaehlpunkte()
+        return self._contracts
 
     def consumptions(self):
         """Returns response from 'consumptions' endpoint."""
@@ -467,6 +776,11 @@ class Smartmeter:
         Returns:
             dict: JSON response of api call to 'user/ereignis'
         """
+        data = self._ereignis_data(zaehlpunkt, name, date_from, date_to)
+        return self._call_api("user/ereignis", data=data, method="POST")
+
+    def _ereignis_data(self, zaehlpunkt, name, date_from, date_to=None) -> dict:
+        """builds the payload of a new event (see `create_ereignis`)"""
         if date_to is None:
             dto = None
             typ = "ZEITPUNKT"
@@ -474,7 +788,7 @@ class Smartmeter:
             dto = self._dt_string(date_to)
             typ = "ZEITSPANNE"
 
-        data = {
+        return {
             "endAt": dto,
             "name": name,
             "startAt": self._dt_string(date_from),
@@ -482,8 +796,6 @@ class Smartmeter:
             "zaehlpunkt": zaehlpunkt,
         }
 
-        return self._call_api("user/ereignis", data=data, method="POST")
-
     def delete_ereignis(self, ereignis_id):
         """Deletes ereignis."""
         return self._call_api(f"user/ereignis/{ereignis_id}", method="DELETE")
@@ -496,7 +808,7 @@ class Smartmeter:
         # Check if any OBIS codes exist
         all_obis_codes = [zaehlwerk.get("obisCode") for zaehlwerk in zaehlwerke]
         if not any(all_obis_codes):
-            logger.debug("Returned zaehlwerke: %s", zaehlwerke)
+            payloads.log_payload("Returned zaehlwerke: %s", zaehlwerke)
             raise SmartmeterQueryError("No OBIS codes found in the provided data.")
         
         # Filter data for valid OBIS codes
@@ -506,7 +818,7 @@ class Smartmeter:
         ]
         
         if not valid_data:
-            logger.debug("Returned zaehlwerke: %s", zaehlwerke)
+            payloads.log_payload("Returned zaehlwerke: %s", zaehlwerke)
             raise SmartmeterQueryError(f"No valid OBIS code found. OBIS codes in data: {all_obis_codes}")
         
         # Check for empty or missing messwerte
@@ -522,6 +834,53 @@ class Smartmeter:
 
         return valid_data[0]
 
+    @staticmethod
+    def _default_range(date_from: date = None, date_until: date = None) -> tuple[date, date]:
+        """
+        returns (date_from, date_until) defaulting to a span of three years until today
+        """
+        if date_until is None:
+            date_until = date.today()
+        if date_from is None:
+            date_from = date_until - relativedelta(years=3)
+        return date_from, date_until
+
+    @staticmethod
+    def _historical_data_query(
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.METER_READ
+    ) -> dict:
+        """
+        builds the query of a historical data ('messwerte') call, defaulting to a three year span
+        """
+        date_from, date_until = Smartmeter._default_range(date_from, date_until)
+
+        # Query parameters
+        return {
+            "datumVon": date_from.strftime("%Y-%m-%d"),
+            "datumBis": date_until.strftime("%Y-%m-%d"),
+            "wertetyp": valuetype.value,
+        }
+
+    def _check_historical_data(self, data: dict, zaehlpunkt: str) -> Dict[str, Any]:
+        """
+        validates a historical data response and returns the data of the valid OBIS code
+        """
+        # Sanity check: Validate returned zaehlpunkt
+        if data.get("zaehlpunkt") != zaehlpunkt:
+            payloads.log_payload("Returned data: %s", data)
+            raise SmartmeterQueryError("Returned data does not match given zaehlpunkt!")
+
+        # Validate and extract valid OBIS data
+        zaehlwerke = data.get("zaehlwerke")
+        if not zaehlwerke:
+            payloads.log_payload("Returned data: %s", data)
+            raise SmartmeterQueryError("Returned data does not contain any zaehlwerke or is empty.")
+
+        valid_obis_data = self.find_valid_obis_data(zaehlwerke)
+        return valid_obis_data
+
     def historical_data(
         self,
         zaehlpunktnummer: str = None,
@@ -540,19 +899,7 @@ class Smartmeter:
         else:
             customer_id, zaehlpunkt, anlagetype = self.get_zaehlpunkt(zaehlpunktnummer)
 
-        # Set date range defaults
-        if date_until is None:
-            date_until = date.today()
-            
-        if date_from is None:
-            date_from = date_until - relativedelta(years=3)
-
-        # Query parameters
-        query = {
-            "datumVon": date_from.strftime("%Y-%m-%d"),
-            "datumBis": date_until.strftime("%Y-%m-%d"),
-            "wertetyp": valuetype.value,
-        }
+        query = self._historical_data_query(date_from, date_until, valuetype)
         
         extra = {
             # For this API Call, requesting json is important!
@@ -567,35 +914,21 @@ class Smartmeter:
             extra_headers=extra,
         )
 
-        # Sanity check: Validate returned zaehlpunkt
-        if data.get("zaehlpunkt") != zaehlpunkt:
-            logger.debug("Returned data: %s", data)
-            raise SmartmeterQueryError("Returned data does not match given zaehlpunkt!")
-
-        # Validate and extract valid OBIS data
-        zaehlwerke = data.get("zaehlwerke")
-        if not zaehlwerke:
-            logger.debug("Returned data: %s", data)
-            raise SmartmeterQueryError("Returned data does not contain any zaehlwerke or is empty.")
-
-        valid_obis_data = self.find_valid_obis_data(zaehlwerke)
-        return valid_obis_data
+        return self._check_historical_data(data, zaehlpunkt)
 
-    def bewegungsdaten(
-        self,
-        zaehlpunktnummer: str = None,
+    @staticmethod
+    def _bewegungsdaten_query(
+        customer_id: str,
+        zaehlpunkt: str,
+        anlagetype: const.AnlagenType,
         date_from: date = None,
         date_until: date = None,
         valuetype: const.ValueType = const.ValueType.QUARTER_HOUR,
         aggregat: str = None,
-    ):
+    ) -> dict:
         """
-        Query historical data in a batch
-        If no arguments are given, a span of three year is queried (same day as today but from current year - 3).
-        If date_from is not given but date_until, again a three year span is assumed.
+        builds the query of a bewegungsdaten call, defaulting to a three year span
         """
-        customer_id, zaehlpunkt, anlagetype = self.get_zaehlpunkt(zaehlpunktnummer)
-
         if anlagetype == const.AnlagenType.FEEDING:
             if valuetype == const.ValueType.DAY:
                 rolle = const.RoleType.DAILY_FEEDING.value
@@ -607,13 +940,9 @@ class Smartmeter:
             else:
                 rolle = const.RoleType.QUARTER_HOURLY_CONSUMING.value
 
-        if date_until is None:
-            date_until = date.today()
-
-        if date_from is None:
-            date_from = date_until - relativedelta(years=3)
+        date_from, date_until = Smartmeter._default_range(date_from, date_until)
 
-        query = {
+        return {
             "geschaeftspartner": customer_id,
             "zaehlpunktnummer": zaehlpunkt,
             "rolle": rolle,
@@ -622,6 +951,34 @@ class Smartmeter:
             "aggregat": aggregat or "NONE"
         }
 
+    @staticmethod
+    def _check_bewegungsdaten(data: dict, zaehlpunkt: str) -> dict:
+        """
+        validates a bewegungsdaten response
+        """
+        if BewegungsdatenDescriptor.from_json(data.get("descriptor")).zaehlpunkt != zaehlpunkt:
+            raise SmartmeterQueryError("Returned data does not match given zaehlpunkt!")
+        return data
+
+    def bewegungsdaten(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.QUARTER_HOUR,
+        aggregat: str = None,
+    ):
+        """
+        Query historical data in a batch
+        If no arguments are given, a span of three year is queried (same day as today but from current year - 3).
+        If date_from is not given but date_until, again a three year span is assumed.
+        """
+        customer_id, zaehlpunkt, anlagetype = self.get_zaehlpunkt(zaehlpunktnummer)
+
+        query = self._bewegungsdaten_query(
+            customer_id, zaehlpunkt, anlagetype, date_from, date_until, valuetype, aggregat
+        )
+
         extra = {
             # For this API Call, requesting json is important!
             "Accept": "application/json"
@@ -633,6 +990,52 @@ class Smartmeter:
             query=query,
             extra_headers=extra,
         )
-        if data["descriptor"]["zaehlpunktnummer"] != zaehlpunkt:
-            raise SmartmeterQueryError("Returned data does not match given zaehlpunkt!")
-        return data
+        return self._check_bewegungsdaten(data, zaehlpunkt)
+
+    def bewegungsdaten_stream(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.QUARTER_HOUR,
+        aggregat: str = None,
+        parser: JsonArrayStream = None,
+    ) -> Iterator[dict]:
+        """
+        Query bewegungsdaten like `bewegungsdaten`, but yield the values while the response is received,
+        so memory stays flat regardless of the requested range.
+        The descriptor is validated when the response is complete and available as `parser.envelope`.
+        """
+        customer_id, zaehlpunkt, anlagetype = self.get_zaehlpunkt(zaehlpunktnummer)
+
+        query = self._bewegungsdaten_query(
+            customer_id, zaehlpunkt, anlagetype, date_from, date_until, valuetype, aggregat
+        )
+        parser = parser or JsonArrayStream("values")
+        yield from self._stream_api(
+            "user/messwerte/bewegungsdaten",
+            "values",
+            base_url=const.API_URL_ALT,
+            query=query,
+            extra_headers={"Accept": "application/json"},
+            parser=parser,
+        )
+        self._check_bewegungsdaten(parser.envelope, zaehlpunkt)
+
+    def bewegungsdaten_series(
+        self,
+        zaehlpunktnummer: str = None,
+        date_from: date = None,
+        date_until: date = None,
+        valuetype: const.ValueType = const.ValueType.QUARTER_HOUR,
+        aggregat: str = None,
+    ) -> dict:
+        """
+        Query bewegungsdaten like `bewegungsdaten`, but return the values as compact MeasurementSeries
+        (built while the response is streamed).
+        """
+        parser = JsonArrayStream("values")
+        series = MeasurementSeries.from_values(
+            self.bewegungsdaten_stream(zaehlpunktnummer, date_from, date_until, valuetype, aggregat, parser)
+        )
+        return {**parser.envelope, "values": series}
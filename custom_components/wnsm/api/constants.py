@@ -12,6 +12,10 @@ API_URL_B2B = "https://api.wstw.at/gateway/WN_SMART_METER_PORTAL_API_B2B/1.0"
 REDIRECT_URI = "https://smartmeter-web.wienernetze.at/"
 API_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
 AUTH_URL = "https://log.wien/auth/realms/logwien/protocol/openid-connect/"  # noqa
+# seconds before the expiration of the access token, when it is already refreshed
+ACCESS_TOKEN_REFRESH_MARGIN = 60
+# seconds the contracts and zaehlpunkte of an account are cached
+ZAEHLPUNKTE_TTL = 3600
 
 LOGIN_ARGS = {
     "client_id": "wn-smartmeter",
@@ -89,6 +93,18 @@ def build_access_token_args(**kwargs):
     return args
 
 
+def build_refresh_token_args(**kwargs):
+    """
+    build refresh token grant args and add kwargs
+    """
+    args = {
+        "grant_type": "refresh_token",
+        "client_id": "wn-smartmeter",
+    }
+    args.update(**kwargs)
+    return args
+
+
 def build_verbrauchs_args(**kwargs):
     """
     build arguments for verbrauchs call and add kwargs
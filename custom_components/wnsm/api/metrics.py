@@ -0,0 +1,259 @@
+"""In-process metrics of api calls and login steps."""
+import bisect
+import functools
+import inspect
+import re
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+#: upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+#: upper bounds of the response size buckets in bytes
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+#: upper bounds of the json decode time buckets in seconds
+DECODE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+#: upper bounds of the event loop hold time buckets in seconds
+LOOP_HOLD_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+_ID_SEGMENT = re.compile(r"^[^/]*\d[^/]*$")
+
+
+def endpoint_name(endpoint: str) -> str:
+    """
+    normalizes an api endpoint, so calls with different ids or queries count as the same endpoint
+    e.g. 'zaehlpunkte/1234/AT0010000000000000001000004392265/messwerte?x=y' -> 'zaehlpunkte/{id}/{id}/messwerte'
+    """
+    path = endpoint.split("?", 1)[0].strip("/")
+    return "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/"))
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets, keeping count, sum, min and max of the observed values
+    """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        approximates the given quantile by the upper bound of its bucket (max for the overflow bucket)
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {
+                **{str(bound): count for bound, count in zip(self.buckets, self.counts)},
+                "+Inf": self.counts[-1],
+            },
+        }
+
+
+class EndpointMetrics:
+    """
+    Metrics of a single endpoint (or login step)
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.decode = Histogram(DECODE_BUCKETS)
+        self.last_error: Optional[str] = None
+        self.last_request: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "errors": dict(self.errors),
+            "last_error": self.last_error,
+            "last_request": self.last_request,
+            "latency": self.latency.as_dict(),
+            "size": self.size.as_dict(),
+            "decode": self.decode.as_dict(),
+        }
+
+
+class MetricsRegistry:
+    """
+    Collects counters and histograms per endpoint. Thread safe, so the synchronous client can use it as well.
+    """
+
+    def __init__(self):
+        self._endpoints: dict[str, EndpointMetrics] = {}
+        self._loop_holds: dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, name: str) -> EndpointMetrics:
+        metrics = self._endpoints.get(name)
+        if metrics is None:
+            metrics = self._endpoints[name] = EndpointMetrics()
+        return metrics
+
+    def record_request(
+        self,
+        name: str,
+        latency: float,
+        status: Optional[int] = None,
+        size: Optional[int] = None,
+        error: Optional[BaseException] = None,
+        retry: bool = False,
+    ) -> None:
+        """
+        records a single attempt of a request
+        """
+        with self._lock:
+            metrics = self._endpoint(name)
+            metrics.requests += 1
+            metrics.retries += retry
+            metrics.last_request = time.time()
+            metrics.latency.observe(latency)
+            if status is not None:
+                metrics.statuses[status] += 1
+            if size is not None:
+                metrics.size.observe(size)
+            if error is not None:
+                metrics.errors[type(error).__name__] += 1
+                metrics.last_error = f"{type(error).__name__}: {error}"
+            elif status is not None and status >= 400:
+                metrics.errors[f"HTTP {status}"] += 1
+                metrics.last_error = f"HTTP {status}"
+
+    def record_decode(self, name: str, seconds: float) -> None:
+        """
+        records the time it took to decode a json response
+        """
+        with self._lock:
+            self._endpoint(name).decode.observe(seconds)
+
+    def record_size(self, name: str, size: int) -> None:
+        """
+        records the size of a streamed response, which is only known after it has been consumed
+        """
+        with self._lock:
+            self._endpoint(name).size.observe(size)
+
+    def record_loop_hold(self, name: str, seconds: float) -> None:
+        """
+        records for how long the event loop has been held (not able to run other tasks) during the given task
+        """
+        with self._lock:
+            histogram = self._loop_holds.get(name)
+            if histogram is None:
+                histogram = self._loop_holds[name] = Histogram(LOOP_HOLD_BUCKETS)
+            histogram.observe(seconds)
+
+    def loop_holds(self) -> dict:
+        """
+        returns the event loop hold times per task as a (json serializable) dict
+        """
+        with self._lock:
+            return {name: histogram.as_dict() for name, histogram in sorted(self._loop_holds.items())}
+
+    def endpoints(self) -> list[str]:
+        with self._lock:
+            return sorted(self._endpoints)
+
+    def snapshot(self) -> dict:
+        """
+        returns all metrics as a (json serializable) dict
+        """
+        with self._lock:
+            return {name: metrics.as_dict() for name, metrics in sorted(self._endpoints.items())}
+
+    def summary(self) -> dict:
+        """
+        returns the totals over all endpoints
+        """
+        with self._lock:
+            requests = sum(metrics.requests for metrics in self._endpoints.values())
+            latency = sum(metrics.latency.sum for metrics in self._endpoints.values())
+            loop_holds = [histogram.max for histogram in self._loop_holds.values()]
+            return {
+                "requests": requests,
+                "retries": sum(metrics.retries for metrics in self._endpoints.values()),
+                "errors": sum(sum(metrics.errors.values()) for metrics in self._endpoints.values()),
+                "mean_latency": latency / requests if requests else None,
+                "max_loop_hold": max(loop_holds) if loop_holds else None,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+            self._loop_holds.clear()
+
+
+def timed(name: str):
+    """
+    decorates a (sync or async) method of a client with a `metrics` registry,
+    recording latency and error class of every call under the given name
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await func(self, *args, **kwargs)
+                except Exception as exception:
+                    self.metrics.record_request(name, time.perf_counter() - start, error=exception)
+                    raise
+                self.metrics.record_request(name, time.perf_counter() - start)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(self, *args, **kwargs)
+            except Exception as exception:
+                self.metrics.record_request(name, time.perf_counter() - start, error=exception)
+                raise
+            self.metrics.record_request(name, time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,144 @@
+"""Typed, immutable models of the contract and descriptor metadata of api responses."""
+import logging
+from typing import Any, NamedTuple, Optional
+
+from . import constants as const
+from .errors import SmartmeterQueryError
+
+logger = logging.getLogger(__name__)
+
+
+def _path(data: Any, *keys: str) -> Any:
+    """
+    returns the nested value of the given keys, None if any of them is missing
+    """
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+class Zaehlpunkt(NamedTuple):
+    """Metadata of a zaehlpunkt of the 'zaehlpunkte' response"""
+    customer_id: Optional[str]
+    zaehlpunktnummer: str
+    label: Optional[str] = None
+    equipment_number: Optional[str] = None
+    device_id: Optional[str] = None
+    street: Optional[str] = None
+    street_number: Optional[str] = None
+    zip: Optional[str] = None
+    city: Optional[str] = None
+    longitude: Optional[str] = None
+    latitude: Optional[str] = None
+    anlage_typ: Optional[str] = None
+    default: Optional[bool] = None
+    active: Optional[bool] = None
+    smart_meter_ready: Optional[bool] = None
+    granularity: Optional[str] = None
+
+    #: names of the fields as entity (and config entry) attributes, in field order
+    ATTRIBUTES = (
+        "customerId", "zaehlpunktnummer", "label", "equipmentNumber", "deviceId", "street", "streetNumber", "zip",
+        "city", "longitude", "latitude", "type", "default", "active", "smartMeterReady", "granularity",
+    )
+
+    @classmethod
+    def from_json(cls, zaehlpunkt: dict, customer_id: Optional[str] = None) -> "Zaehlpunkt":
+        if not isinstance(zaehlpunkt, dict) or not zaehlpunkt.get("zaehlpunktnummer"):
+            raise SmartmeterQueryError(f"Invalid zaehlpunkt: {zaehlpunkt}")
+        verbrauchsstelle = zaehlpunkt.get("verbrauchsstelle")
+        return cls(
+            customer_id,
+            zaehlpunkt["zaehlpunktnummer"],
+            zaehlpunkt.get("customLabel"),
+            zaehlpunkt.get("equipmentNumber"),
+            zaehlpunkt.get("geraetNumber"),
+            _path(verbrauchsstelle, "strasse"),
+            _path(verbrauchsstelle, "anlageHausnummer"),
+            _path(verbrauchsstelle, "postleitzahl"),
+            _path(verbrauchsstelle, "ort"),
+            _path(verbrauchsstelle, "laengengrad"),
+            _path(verbrauchsstelle, "breitengrad"),
+            _path(zaehlpunkt, "anlage", "typ"),
+            zaehlpunkt.get("isDefault"),
+            zaehlpunkt.get("isActive"),
+            zaehlpunkt.get("isSmartMeterMarketReady"),
+            _path(zaehlpunkt, "idexStatus", "granularity", "status"),
+        )
+
+    @property
+    def anlagetype(self) -> const.AnlagenType:
+        return const.AnlagenType.from_str(self.anlage_typ)
+
+    def as_attributes(self) -> dict[str, Any]:
+        """
+        returns the zaehlpunkt as (json serializable) entity attributes
+        """
+        return dict(zip(self.ATTRIBUTES, self))
+
+
+class Contract(NamedTuple):
+    """A contract (geschaeftspartner) and its zaehlpunkte"""
+    customer_id: Optional[str]
+    zaehlpunkte: tuple[Zaehlpunkt, ...]
+
+    @classmethod
+    def from_json(cls, contract: dict) -> "Contract":
+        customer_id = contract.get("geschaeftspartner")
+        zaehlpunkte = []
+        for zaehlpunkt in contract.get("zaehlpunkte") or ():
+            try:
+                zaehlpunkte.append(Zaehlpunkt.from_json(zaehlpunkt, customer_id))
+            except SmartmeterQueryError as exception:
+                # e.g. a zaehlpunkt without number, the valid ones of the contract are kept
+                logger.warning("Skipping zaehlpunkt of contract %s: %s", customer_id, exception)
+        return cls(customer_id, tuple(zaehlpunkte))
+
+
+def contracts_from_json(contracts: Any) -> tuple[Contract, ...]:
+    """
+    builds the contracts of a 'zaehlpunkte' response (which is a list of contracts)
+    """
+    if not isinstance(contracts, list):
+        return ()
+    return tuple(Contract.from_json(contract) for contract in contracts if isinstance(contract, dict))
+
+
+class BewegungsdatenDescriptor(NamedTuple):
+    """The 'descriptor' of a bewegungsdaten response"""
+    customer_id: Optional[str]
+    zaehlpunkt: Optional[str]
+    role: Optional[str]
+    aggregator: Optional[str]
+    granularity: Optional[str]
+    unit: Optional[str]
+
+    #: names of the fields as attributes, in field order
+    ATTRIBUTES = ("customerId", "zaehlpunkt", "role", "aggregator", "granularity", "unitOfMeasurement")
+
+    @classmethod
+    def from_json(cls, descriptor: Optional[dict]) -> "BewegungsdatenDescriptor":
+        return cls(*(_path(descriptor, key) for key in (
+            "geschaeftspartnernummer", "zaehlpunktnummer", "rolle", "aggregat", "granularitaet", "einheit",
+        )))
+
+    def as_attributes(self) -> dict[str, Any]:
+        return dict(zip(self.ATTRIBUTES, self))
+
+
+class HistoricalDataHeader(NamedTuple):
+    """The header of a historical data (messwerte) response of a single zaehlwerk"""
+    obis_code: Optional[str]
+    unit: Optional[str]
+
+    #: names of the fields as attributes, in field order
+    ATTRIBUTES = ("obisCode", "unitOfMeasurement")
+
+    @classmethod
+    def from_json(cls, zaehlwerk: Optional[dict]) -> "HistoricalDataHeader":
+        return cls(_path(zaehlwerk, "obisCode"), _path(zaehlwerk, "einheit"))
+
+    def as_attributes(self) -> dict[str, Any]:
+        return dict(zip(self.ATTRIBUTES, self))
@@ -0,0 +1,96 @@
+"""
+Debug logging of request and response payloads.
+
+Payloads are logged by their own logger, so they can be switched on independently of the other debug messages:
+
+    logger:
+      logs:
+        custom_components.wnsm.api.payloads: debug
+
+Nothing is formatted unless that logger is enabled for debug. Then payloads are sampled (the first items of long
+arrays) and truncated to `PAYLOAD_LOG_LIMIT` characters. Complete payloads are dumped once the `.full` child logger
+is set to debug explicitly (or `full_payloads` is set).
+"""
+import json
+import logging
+from typing import Any
+
+logger = logging.getLogger(__name__)
+_full_logger = logging.getLogger(__name__ + ".full")
+
+#: maximal length of a logged payload (characters)
+PAYLOAD_LOG_LIMIT = 4000
+#: number of items of an array which are logged
+PAYLOAD_SAMPLE_ITEMS = 5
+
+#: dump complete payloads (also enabled by setting the level of the `.full` logger to debug)
+full_payloads = False
+
+
+def is_enabled() -> bool:
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+def is_full() -> bool:
+    """
+    complete payloads are only dumped on request, not because a parent (e.g. the root) logger is at debug level
+    """
+    return full_payloads or logging.NOTSET < _full_logger.level <= logging.DEBUG
+
+
+def _sample(value: Any, items: int) -> Any:
+    """
+    returns the value with arrays cut to their first `items` items (and a note how many have been dropped)
+    """
+    if isinstance(value, dict):
+        return {key: _sample(item, items) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        sampled = [_sample(item, items) for item in value[:items]]
+        if len(value) > items:
+            sampled.append(f"... {len(value) - items} more items")
+        return sampled
+    return value
+
+
+class Payload:
+    """
+    Formats a payload (json data, bytes or text) when a log record is emitted, i.e. only if it is emitted at all.
+    """
+
+    __slots__ = ("payload", "prefix")
+
+    def __init__(self, payload: Any, prefix: str = ""):
+        self.payload = payload
+        self.prefix = prefix
+
+    def __str__(self) -> str:
+        if self.payload is None:
+            return ""
+        full = is_full()
+        payload = self.payload
+        if isinstance(payload, (bytes, bytearray)):
+            text = payload[:None if full else PAYLOAD_LOG_LIMIT + 1].decode("utf-8", "replace")
+        elif isinstance(payload, str):
+            text = payload
+        else:
+            text = json.dumps(payload if full else _sample(payload, PAYLOAD_SAMPLE_ITEMS), indent=2, default=str)
+        if not full and len(text) > PAYLOAD_LOG_LIMIT:
+            size = len(payload) if isinstance(payload, (bytes, bytearray, str)) else len(text)
+            text = f"{text[:PAYLOAD_LOG_LIMIT]}... (truncated, {size} in total)"
+        return self.prefix + text
+
+
+def log_exchange(url: str, data: Any, response: Any) -> None:
+    """
+    logs a request (its body) and the received response
+    """
+    if is_enabled():
+        logger.debug("\nAPI Request: %s\n%s\n\nAPI Response: %s", url, Payload(data, "body: "), Payload(response))
+
+
+def log_payload(message: str, payload: Any) -> None:
+    """
+    logs the given payload with a message (with a single %s placeholder of the payload)
+    """
+    if is_enabled():
+        logger.debug(message, Payload(payload))
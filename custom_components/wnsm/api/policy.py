@@ -0,0 +1,142 @@
+"""Retry and rate limiting policy of api calls."""
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+#: status codes worth another attempt
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+#: methods which can be safely repeated after a server error or a dropped connection
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+#: default number of retries of a single api call
+DEFAULT_RETRIES = 3
+#: seconds to wait before the first retry (doubled with every further retry)
+DEFAULT_BACKOFF = 1.0
+#: upper bound of the wait between two attempts in seconds
+DEFAULT_MAX_BACKOFF = 60.0
+#: requests per second granted per api
+DEFAULT_RATE = 2.0
+#: requests which may be sent in a burst per api
+DEFAULT_BURST = 10
+
+
+def parse_retry_after(value: Optional[str], now: datetime = None) -> Optional[float]:
+    """
+    parses the value of a Retry-After header (delay seconds or http date) into seconds
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+class RequestPolicy:
+    """
+    Decides whether (and when) a failed api call is attempted again.
+    Waits grow exponentially with full jitter, a Retry-After of the server takes precedence.
+    """
+
+    def __init__(
+        self,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        jitter: bool = True,
+        retry_statuses: frozenset = RETRY_STATUSES,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = retry_statuses
+
+    def should_retry_status(self, method: str, status: int, attempt: int) -> bool:
+        """
+        a rejected request (429) can always be repeated, server errors only for idempotent methods
+        """
+        if attempt >= self.retries or status not in self.retry_statuses:
+            return False
+        return status == 429 or method.upper() in IDEMPOTENT_METHODS
+
+    def should_retry_error(self, method: str, attempt: int) -> bool:
+        """
+        connection errors are only retried for idempotent methods
+        """
+        return attempt < self.retries and method.upper() in IDEMPOTENT_METHODS
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        seconds to wait before the given (zero based) retry
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class TokenBucket:
+    """
+    Token bucket granting `rate` requests per second with bursts of up to `capacity` requests.
+    Instead of blocking, `reserve` returns the seconds the caller has to wait,
+    which lets synchronous and asynchronous callers share the same bucket.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, capacity: int = DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        takes a token and returns the seconds to wait until it is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class RateLimiter:
+    """
+    One token bucket per api base url.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, capacity: int = DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, base_url: str) -> TokenBucket:
+        with self._lock:
+            if base_url not in self._buckets:
+                self._buckets[base_url] = TokenBucket(self.rate, self.capacity)
+            return self._buckets[base_url]
+
+    def reserve(self, base_url: str) -> float:
+        """
+        takes a token of the given api and returns the seconds to wait until it is available
+        """
+        return self.bucket(base_url).reserve()
+
+
+#: rate limiter shared by all clients, so several accounts and meters do not add up beyond the limit
+DEFAULT_RATE_LIMITER = RateLimiter()
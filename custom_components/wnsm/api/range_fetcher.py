@@ -0,0 +1,149 @@
+"""Fetching long date ranges in (concurrent) windows."""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Coroutine, Iterable, Union
+
+from dateutil.relativedelta import relativedelta
+
+logger = logging.getLogger(__name__)
+
+#: default span of a single request
+DEFAULT_WINDOW = relativedelta(months=1)
+#: default number of requests in flight at the same time
+DEFAULT_MAX_CONCURRENCY = 4
+#: default number of retries of a single day window running into a timeout
+DEFAULT_RETRIES = 2
+#: seconds to wait before the first retry of a window (doubled with every further retry)
+DEFAULT_RETRY_DELAY = 1.0
+
+Start = Union[date, datetime]
+Window = tuple[Start, date]
+
+
+def _day(value: Start) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def split_range(date_from: Start, date_until: Start, window: Union[relativedelta, timedelta] = DEFAULT_WINDOW) -> list[Window]:
+    """
+    Splits [date_from, date_until] into consecutive windows of the given size.
+    The first window starts at date_from (keeping its time of day), all following windows
+    start at midnight of the day after the previous window. The end of every window is a whole day.
+    """
+    until = _day(date_until)
+    windows = []
+    start = date_from
+    while _day(start) <= until:
+        end = min(_day(start) + window - timedelta(days=1), until)
+        # a window spans at least one day
+        end = max(end, _day(start))
+        windows.append((start, end))
+        start = end + timedelta(days=1)
+    return windows
+
+
+def split_window(window: Window) -> list[Window]:
+    """
+    Splits a window into two halves, a single day cannot be split any further.
+    """
+    start, end = window
+    days = (end - _day(start)).days
+    if days < 1:
+        return [window]
+    mid = _day(start) + timedelta(days=(days - 1) // 2)
+    return [(start, mid), (mid + timedelta(days=1), end)]
+
+
+async def _gather(coros: Iterable[Coroutine[Any, Any, Any]]) -> list[Any]:
+    """
+    awaits the coroutines concurrently and returns their results in order.
+    Unlike asyncio.gather, the pending coroutines are cancelled as soon as one of them fails,
+    the (first) error is raised as it is.
+    """
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(coro) for coro in coros]
+    except BaseExceptionGroup as errors:
+        raise errors.exceptions[0]
+    return [task.result() for task in tasks]
+
+
+async def fetch_windows(
+        fetch: Callable[[Start, date], Awaitable[Any]],
+        windows: list[Window],
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        retries: int = DEFAULT_RETRIES,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+) -> list[Any]:
+    """
+    Calls fetch(start, end) for every window with at most max_concurrency calls in flight.
+    A window running into a timeout is split into two halves, which are fetched instead
+    (a single day is retried up to `retries` times). Connection and server errors are not retried here,
+    the client retries the transient ones per request (see RequestPolicy).
+    As soon as a window fails, the pending windows are cancelled and the error is raised.
+    Returns the results in the order of the windows (split windows contribute several results).
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_window(window: Window) -> list[Any]:
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    return [await fetch(*window)]
+            except TimeoutError:
+                halves = split_window(window)
+                if len(halves) > 1:
+                    logger.debug("Timeout fetching %s - %s, shrinking window", *window)
+                    results = await _gather(fetch_window(half) for half in halves)
+                    return [result for part in results for result in part]
+                if attempt >= retries:
+                    raise
+            attempt += 1
+            logger.debug("Retrying %s - %s (%d/%d)", window[0], window[1], attempt, retries)
+            await asyncio.sleep(retry_delay * 2 ** (attempt - 1))
+
+    results = await _gather(fetch_window(window) for window in windows)
+    return [result for part in results for result in part]
+
+
+def _merge_ordered(items_of_responses, key: str) -> list:
+    """
+    concatenates the items of consecutive windows, dropping items not after the previous one
+    (windows do not overlap, but do not trust the api to respect the boundaries)
+    """
+    merged = []
+    last = None
+    for items in items_of_responses:
+        for item in items or []:
+            ts = item.get(key)
+            if last is not None and ts is not None and ts <= last:
+                continue
+            last = ts if ts is not None else last
+            merged.append(item)
+    return merged
+
+
+def merge_bewegungsdaten(responses: list[dict]) -> dict:
+    """
+    Merges bewegungsdaten responses of consecutive windows into a single response
+    """
+    if not responses:
+        return {}
+    return {
+        **responses[0],
+        "values": _merge_ordered((response.get("values") for response in responses), "zeitpunktVon"),
+    }
+
+
+def merge_historical_data(responses: list[dict]) -> dict:
+    """
+    Merges the (valid OBIS) zaehlwerk of historical data responses of consecutive windows into a single one
+    """
+    if not responses:
+        return {}
+    return {
+        **responses[0],
+        "messwerte": _merge_ordered((response.get("messwerte") for response in responses), "zeitVon"),
+    }
@@ -0,0 +1,232 @@
+"""Compact, array backed storage of measurement values."""
+from array import array
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+
+from .timestamps import TimestampDecoder
+
+#: keys of a single value in the bewegungsdaten response: start, end, value
+BEWEGUNGSDATEN_KEYS = ("zeitpunktVon", "zeitpunktBis", "wert")
+#: keys of a single value in the messwerte (historical data) response: start, end, value
+MESSWERTE_KEYS = ("zeitVon", "zeitBis", "messwert")
+
+
+def _timestamp(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+class Measurement(NamedTuple):
+    """A single value of a series, value is None if it is missing"""
+    start: datetime
+    end: datetime
+    value: Optional[Union[int, float]]
+    estimated: bool
+
+
+def _bit(mask: bytearray, index: int) -> bool:
+    return bool(mask[index >> 3] & (1 << (index & 7)))
+
+
+def _set_bit(mask: bytearray, index: int) -> None:
+    mask[index >> 3] |= 1 << (index & 7)
+
+
+class MeasurementSeries:
+    """
+    Measurement values stored in arrays instead of one dict per value:
+    start and end (epoch seconds, int64), values (int64 if all values are integral, double otherwise)
+    and bitmasks of estimated and missing values.
+
+    A series is immutable. It can be iterated, indexed and sliced (a slice is a new series).
+    It can also be converted back into the dict form of the api with `to_dicts`.
+    """
+
+    __slots__ = ("starts", "ends", "values", "estimated", "missing", "keys")
+
+    def __init__(self, starts: array, ends: array, values: array, estimated: bytearray, missing: bytearray,
+                 keys: tuple[str, str, str] = BEWEGUNGSDATEN_KEYS):
+        self.starts = starts
+        self.ends = ends
+        self.values = values
+        self.estimated = estimated
+        self.missing = missing
+        self.keys = keys
+
+    @classmethod
+    def from_values(cls, values: Iterable[dict], keys: tuple[str, str, str] = BEWEGUNGSDATEN_KEYS) -> "MeasurementSeries":
+        """
+        builds a series from the values of a bewegungsdaten response (or any iterable of value dicts, e.g. a stream)
+        """
+        builder = SeriesBuilder(keys)
+        builder.extend(values)
+        return builder.build()
+
+    @classmethod
+    def from_messwerte(cls, messwerte: Iterable[dict]) -> "MeasurementSeries":
+        """
+        builds a series from the messwerte of a historical data response
+        """
+        return cls.from_values(messwerte, MESSWERTE_KEYS)
+
+    @classmethod
+    def concat(cls, series: Iterable["MeasurementSeries"]) -> "MeasurementSeries":
+        """
+        concatenates consecutive series, dropping values which do not start after the previous value
+        """
+        builder = None
+        for part in series:
+            if builder is None:
+                builder = SeriesBuilder(part.keys)
+            builder.extend_series(part)
+        return (builder or SeriesBuilder()).build()
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _measurement(self, index: int) -> Measurement:
+        return Measurement(
+            datetime.fromtimestamp(self.starts[index], timezone.utc),
+            datetime.fromtimestamp(self.ends[index], timezone.utc),
+            None if _bit(self.missing, index) else self.values[index],
+            _bit(self.estimated, index),
+        )
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            builder = SeriesBuilder(self.keys, self.values.typecode)
+            for i in range(*index.indices(len(self))):
+                builder.append_raw(self.starts[i], self.ends[i], self.values[i],
+                                   _bit(self.estimated, i), _bit(self.missing, i))
+            return builder.build()
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("series index out of range")
+        return self._measurement(index)
+
+    def __iter__(self) -> Iterator[Measurement]:
+        for index in range(len(self)):
+            yield self._measurement(index)
+
+    def raw(self) -> Iterator[tuple[int, Optional[Union[int, float]], bool]]:
+        """
+        iterates (start epoch, value or None if missing, estimated) without creating datetimes
+        """
+        estimated, missing = self.estimated, self.missing
+        for index, (start, value) in enumerate(zip(self.starts, self.values)):
+            mask = 1 << (index & 7)
+            yield start, None if missing[index >> 3] & mask else value, bool(estimated[index >> 3] & mask)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, MeasurementSeries):
+            return NotImplemented
+        return self.to_dicts() == other.to_dicts()
+
+    def __repr__(self) -> str:
+        return f"MeasurementSeries({len(self)} values, {self.nbytes} bytes)"
+
+    def is_estimated(self, index: int) -> bool:
+        return _bit(self.estimated, index)
+
+    def is_missing(self, index: int) -> bool:
+        return _bit(self.missing, index)
+
+    def total(self) -> Union[int, float]:
+        """
+        returns the sum of all values which are not missing
+        """
+        return sum(value for index, value in enumerate(self.values) if not _bit(self.missing, index))
+
+    @property
+    def nbytes(self) -> int:
+        """
+        returns the size of the stored arrays and masks in bytes
+        """
+        return sum(len(a) * a.itemsize for a in (self.starts, self.ends, self.values)) + \
+            len(self.estimated) + len(self.missing)
+
+    def to_dicts(self) -> list[dict]:
+        """
+        returns the values in the dict form of the api
+        """
+        start_key, end_key, value_key = self.keys
+        estimated_key = "geschaetzt" if self.keys == BEWEGUNGSDATEN_KEYS else "qualitaet"
+        result = []
+        for index in range(len(self)):
+            estimated = _bit(self.estimated, index)
+            result.append({
+                value_key: None if _bit(self.missing, index) else self.values[index],
+                start_key: _timestamp(self.starts[index]),
+                end_key: _timestamp(self.ends[index]),
+                estimated_key: estimated if estimated_key == "geschaetzt" else ("EST" if estimated else "VAL"),
+            })
+        return result
+
+
+class SeriesBuilder:
+    """
+    Appends values one by one (e.g. while a response is streamed) and builds a MeasurementSeries of them.
+    Values are stored as integers until the first non integral value is appended.
+    """
+
+    def __init__(self, keys: tuple[str, str, str] = BEWEGUNGSDATEN_KEYS, typecode: str = "q"):
+        self.keys = keys
+        self._starts = array("q")
+        self._ends = array("q")
+        self._values = array(typecode)
+        self._estimated = bytearray()
+        self._missing = bytearray()
+        self._start_decoder = TimestampDecoder()
+        self._end_decoder = TimestampDecoder()
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def append(self, value: dict) -> None:
+        start_key, end_key, value_key = self.keys
+        if "geschaetzt" in value:
+            estimated = bool(value["geschaetzt"])
+        else:
+            estimated = value.get("qualitaet", "VAL") != "VAL"
+        start = self._start_decoder.decode(value[start_key])
+        end = self._end_decoder.decode(value[end_key]) if value.get(end_key) else start
+        self.append_raw(start, end, value.get(value_key), estimated)
+
+    def extend(self, values: Iterable[dict]) -> None:
+        for value in values:
+            self.append(value)
+
+    def extend_series(self, series: MeasurementSeries) -> None:
+        """
+        appends all values of the given series, which start after the last value of this builder
+        """
+        last = self._starts[-1] if self._starts else None
+        for i in range(len(series)):
+            if last is not None and series.starts[i] <= last:
+                continue
+            self.append_raw(series.starts[i], series.ends[i], series.values[i],
+                            _bit(series.estimated, i), _bit(series.missing, i))
+
+    def append_raw(self, start: int, end: int, value, estimated: bool = False, missing: bool = False) -> None:
+        index = len(self._starts)
+        if index & 7 == 0:
+            self._estimated.append(0)
+            self._missing.append(0)
+        if value is None or missing:
+            missing = True
+            value = 0
+        elif self._values.typecode == "q" and not isinstance(value, int):
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            else:
+                self._values = array("d", self._values)
+        self._starts.append(start)
+        self._ends.append(end)
+        self._values.append(value)
+        if estimated:
+            _set_bit(self._estimated, index)
+        if missing:
+            _set_bit(self._missing, index)
+
+    def build(self) -> MeasurementSeries:
+        return MeasurementSeries(self._starts, self._ends, self._values, self._estimated, self._missing, self.keys)
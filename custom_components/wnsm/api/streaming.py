@@ -0,0 +1,178 @@
+"""Incremental decoding of the measurement arrays of large json responses."""
+import codecs
+import json
+from typing import Optional, Union
+
+from .errors import SmartmeterQueryError
+
+#: bytes read from the response body at once
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+_SCAN, _ITEMS, _DONE = range(3)
+
+
+class JsonArrayStream:
+    """
+    Push parser decoding the items of a single top level array (e.g. 'values') of a json document
+    as soon as they have been received, without holding the whole document in memory.
+
+    Everything outside of that array (the envelope, e.g. the 'descriptor') is kept and decoded on `close`,
+    with the streamed array replaced by an empty one.
+
+    >>> stream = JsonArrayStream("values")
+    >>> stream.feed(b'{"descriptor": {"einheit": "KWH"}, "values": [{"wert": 1}, {"we')
+    [{'wert': 1}]
+    >>> stream.feed(b'rt": 2}]}')
+    [{'wert': 2}]
+    >>> stream.close()
+    {'descriptor': {'einheit': 'KWH'}, 'values': []}
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.count = 0
+        self.envelope: Optional[dict] = None
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _SCAN
+        self._envelope = []
+        # scanner state of the envelope
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string = []
+        self._last_string: Optional[str] = None
+        self._key_matched = False
+
+    def feed(self, data: Union[bytes, str]) -> list:
+        """
+        feeds the next chunk of the document and returns the items completed by it
+        """
+        try:
+            self._buffer += self._text.decode(data) if isinstance(data, bytes) else data
+        except UnicodeDecodeError as exception:
+            raise SmartmeterQueryError(f"Invalid json document: {exception}") from exception
+        items = []
+        while True:
+            if self._state == _ITEMS:
+                if not self._decode_items(items):
+                    break
+            elif not self._scan():
+                break
+        # drop what has been consumed already
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        return items
+
+    def close(self) -> dict:
+        """
+        finishes the document and returns its envelope,
+        raises a SmartmeterQueryError if the document is incomplete or not json at all (e.g. an error page)
+        """
+        try:
+            self._buffer += self._text.decode(b"", final=True)
+        except UnicodeDecodeError as exception:
+            raise SmartmeterQueryError(f"Invalid json document: {exception}") from exception
+        remaining = self.feed("")
+        if remaining or self._state == _ITEMS:
+            raise SmartmeterQueryError(f"Incomplete json document, array {self.key!r} has not been terminated")
+        self._envelope.append(self._buffer)
+        self._buffer = ""
+        try:
+            self.envelope = json.loads("".join(self._envelope))
+        except json.JSONDecodeError as exception:
+            raise SmartmeterQueryError(f"Invalid json document: {exception}") from exception
+        return self.envelope
+
+    def _scan(self) -> bool:
+        """
+        walks the envelope until the streamed array starts, returns False if more data is needed
+        """
+        buffer = self._buffer
+        start = self._pos
+        for i in range(start, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                self._scan_string(char)
+            elif char not in _WHITESPACE and self._scan_token(char):
+                self._envelope.append(buffer[start:i + 1])
+                self._pos = i + 1
+                self._state = _ITEMS
+                return True
+        self._envelope.append(buffer[start:])
+        self._pos = len(buffer)
+        return False
+
+    def _scan_string(self, char: str):
+        """
+        consumes a character of a string of the envelope, keys of the top level object are recorded
+        """
+        if self._escape:
+            self._escape = False
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            if self._depth == 1:
+                self._last_string = "".join(self._string)
+            return
+        if self._depth == 1:
+            self._string.append(char)
+
+    def _scan_token(self, char: str) -> bool:
+        """
+        consumes a structural character of the envelope, returns True if it starts the streamed array
+        """
+        if char == '"':
+            self._in_string = True
+            self._string = []
+            self._key_matched = False
+        elif char == ":" and self._depth == 1:
+            self._key_matched = self._last_string == self.key
+        elif char == "[" and self._key_matched and self._depth == 1:
+            self._key_matched = False
+            return True
+        else:
+            if char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+            self._key_matched = False
+            self._last_string = None
+        return False
+
+    def _decode_items(self, items: list) -> bool:
+        """
+        decodes the complete items of the streamed array, returns False if more data is needed
+        """
+        buffer = self._buffer
+        pos = self._pos
+        length = len(buffer)
+        while True:
+            while pos < length and (buffer[pos] in _WHITESPACE or buffer[pos] == ","):
+                pos += 1
+            if pos >= length:
+                self._pos = pos
+                return False
+            if buffer[pos] == "]":
+                self._envelope.append("]")
+                self._pos = pos + 1
+                self._state = _SCAN
+                return True
+            try:
+                item, end = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # incomplete item, wait for the next chunk
+                self._pos = pos
+                return False
+            if end >= length:
+                # e.g. a number might continue in the next chunk
+                self._pos = pos
+                return False
+            items.append(item)
+            self.count += 1
+            pos = end
@@ -0,0 +1,133 @@
+"""Fast decoding of the (fixed format) timestamps of measurement values."""
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Optional
+
+#: default distance of two consecutive values (quarter hours)
+DEFAULT_CADENCE = 15 * 60
+
+_DAY = 24 * 60 * 60
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_epoch(value: str) -> int:
+    """
+    full (slow) parser: converts any iso 8601 timestamp into epoch seconds, naive timestamps are UTC
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+@lru_cache(maxsize=16)
+def _times_of_day(cadence: int) -> tuple[str, ...]:
+    """
+    returns 'HH:MM:SS' of every step of the given cadence within a day
+    """
+    return tuple(
+        f"{second // 3600:02d}:{second % 3600 // 60:02d}:{second % 60:02d}"
+        for second in range(0, _DAY, cadence)
+    )
+
+
+@lru_cache(maxsize=64)
+def _offset(suffix: str) -> Optional[int]:
+    """
+    returns the utc offset in seconds of a timestamp suffix like '.000Z', 'Z' or '+01:00' (None if unknown)
+    """
+    if suffix.startswith("."):
+        digits = len(suffix) - len(suffix[1:].lstrip("0123456789")) - 1
+        if digits == 0 or suffix[1:1 + digits].strip("0"):
+            # fractions of a second are left to the full parser
+            return None
+        suffix = suffix[1 + digits:]
+    if suffix == "Z":
+        return 0
+    if len(suffix) == 6 and suffix[0] in "+-" and suffix[3] == ":" and (suffix[1:3] + suffix[4:]).isdigit():
+        offset = int(suffix[1:3]) * 3600 + int(suffix[4:]) * 60
+        return offset if suffix[0] == "+" else -offset
+    return None
+
+
+class TimestampDecoder:
+    """
+    Decodes the timestamps of consecutive measurement values ('2023-01-01T00:15:00.000Z') into epoch seconds.
+
+    1. predicted: once the first timestamp of a day has been decoded, all timestamps of that day
+       (one cadence apart, same suffix) are predicted, a single dict lookup confirms the prediction
+    2. fast: fixed 'YYYY-MM-DDTHH:MM:SS<suffix>' layout, decoded by slicing,
+       the utc offset is cached per suffix
+    3. full: anything else is parsed by `datetime.fromisoformat`
+
+    The cadence adapts to the distance between a mispredicted timestamp and its predecessor.
+    """
+
+    __slots__ = ("cadence", "_predictions", "_previous", "fast", "full")
+
+    def __init__(self, cadence: int = DEFAULT_CADENCE):
+        self.cadence = cadence
+        # predicted timestamps of the current day
+        self._predictions: dict[str, int] = {}
+        self._previous: Optional[int] = None
+        # number of timestamps decoded by the fast and the full parser (all others have been predicted)
+        self.fast = 0
+        self.full = 0
+
+    def decode(self, value: str) -> int:
+        epoch = self._predictions.get(value)
+        if epoch is None:
+            return self._decode(value)
+        self._previous = epoch
+        return epoch
+
+    def _decode(self, value: str) -> int:
+        day = self._day(value)
+        epoch = None if day is None else self._time(value, day)
+        if epoch is None:
+            self.full += 1
+            epoch = parse_epoch(value)
+        else:
+            self.fast += 1
+            if self._previous is not None and 0 < epoch - self._previous <= _DAY \
+                    and _DAY % (epoch - self._previous) == 0:
+                self.cadence = epoch - self._previous
+            self._predict(value, day)
+        self._previous = epoch
+        return epoch
+
+    @staticmethod
+    def _day(value: str) -> Optional[int]:
+        """
+        returns the epoch of midnight of the date (and offset) of the given timestamp
+        """
+        if len(value) < 20 or value[10] != "T" or value[13] != ":" or value[16] != ":":
+            return None
+        offset = _offset(value[19:])
+        if offset is None:
+            return None
+        try:
+            ordinal = date.fromisoformat(value[:10]).toordinal()
+        except ValueError:
+            return None
+        return (ordinal - _EPOCH_ORDINAL) * _DAY - offset
+
+    @staticmethod
+    def _time(value: str, day: int) -> Optional[int]:
+        time = value[11:13] + value[14:16] + value[17:19]
+        if not time.isdigit():
+            return None
+        hours, minutes, seconds = int(time[:2]), int(time[2:4]), int(time[4:])
+        if hours > 23 or minutes > 59 or seconds > 59:
+            return None
+        return day + hours * 3600 + minutes * 60 + seconds
+
+    def _predict(self, value: str, day: int) -> None:
+        """
+        predicts all timestamps of the given day in the same format and cadence
+        """
+        prefix, suffix, cadence = value[:11], value[19:], self.cadence
+        self._predictions = {
+            prefix + time + suffix: day + step * cadence
+            for step, time in enumerate(_times_of_day(cadence))
+        }
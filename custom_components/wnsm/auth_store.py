@@ -0,0 +1,54 @@
+"""
+Persistence of the login state of a Wiener Netze account across Home Assistant restarts
+"""
+import hashlib
+import logging
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .api import Smartmeter
+from .const import AUTH_STORAGE_VERSION, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# delay in seconds to bundle several token changes into one write
+SAVE_DELAY = 10
+
+
+def storage_key(username: str) -> str:
+    """
+    storage key of an account, which does not reveal the username in .storage
+    """
+    return f"{DOMAIN}.auth.{hashlib.sha256(username.encode('utf-8')).hexdigest()[:16]}"
+
+
+class AuthStore:
+    """
+    Stores tokens, their expiration, code verifier and gateway keys of one account
+    in a private (only readable by the owner) file in Home Assistant's .storage
+    """
+
+    def __init__(self, hass: HomeAssistant, username: str):
+        self._store = Store(hass, AUTH_STORAGE_VERSION, storage_key(username), private=True)
+
+    async def async_restore(self, smartmeter: Smartmeter) -> bool:
+        """
+        restores a previously stored login state into the given client
+        """
+        state = await self._store.async_load()
+        restored = smartmeter.restore_auth_state(state)
+        _LOGGER.debug("Restored login state of %s: %s", smartmeter.username, restored)
+        return restored
+
+    def async_schedule_save(self, smartmeter: Smartmeter) -> None:
+        """
+        schedules persisting the current login state of the given client
+        """
+        self._store.async_delay_save(smartmeter.export_auth_state, SAVE_DELAY)
+
+    async def async_remove(self) -> None:
+        """
+        removes the stored login state
+        """
+        await self._store.async_remove()
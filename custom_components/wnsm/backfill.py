@@ -0,0 +1,279 @@
+"""
+Resumable background backfill of the statistics history of a zaehlpunkt
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Callable, NamedTuple, Optional
+
+import aiohttp
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+
+from .AsyncSmartmeter import AsyncSmartmeter
+from .api.constants import ValueType
+from .api.errors import SmartmeterError
+from .const import BACKFILL_HISTORY, BACKFILL_STORAGE_VERSION, BACKFILL_WINDOW, DOMAIN
+from .gaps import EstimateTracker, GapTracker
+from .importer import Importer
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_BACKFILLS = "backfills"
+
+
+def storage_key(zaehlpunkt: str) -> str:
+    return f"{DOMAIN}.backfill.{zaehlpunkt.lower()}"
+
+
+class BackfillCheckpoint(NamedTuple):
+    """The range of a backfill and its last committed window"""
+    #: start of the history to backfill
+    start: datetime
+    #: end (exclusive, midnight) of the backfill, from there on the regular import takes over
+    end: datetime
+    #: start of the next window, i.e. the end of the last committed window
+    next: datetime
+    #: sum of all statistics before `next`
+    sum: Decimal
+    paused: bool = False
+    #: the backfill has been cancelled, the history before `end` which has not been imported yet is skipped
+    cancelled: bool = False
+
+    @classmethod
+    def begin(cls, end: datetime, history: timedelta = BACKFILL_HISTORY, total_usage: Decimal = Decimal(0)) -> "BackfillCheckpoint":
+        return cls(end - history, end, end - history, total_usage)
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> Optional["BackfillCheckpoint"]:
+        if not data:
+            return None
+        return cls(
+            datetime.fromisoformat(data["start"]),
+            datetime.fromisoformat(data["end"]),
+            datetime.fromisoformat(data["next"]),
+            Decimal(data["sum"]),
+            bool(data.get("paused", False)),
+            bool(data.get("cancelled", False)),
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "next": self.next.isoformat(),
+            "sum": str(self.sum),
+            "paused": self.paused,
+            "cancelled": self.cancelled,
+        }
+
+    @property
+    def done(self) -> bool:
+        return self.next >= self.end
+
+    def window(self, size: timedelta = BACKFILL_WINDOW) -> tuple[datetime, datetime]:
+        """
+        returns the next window [start, end)
+        """
+        return self.next, min(self.next + size, self.end)
+
+    def windows_total(self, size: timedelta = BACKFILL_WINDOW) -> int:
+        return -(-(self.end - self.start) // size)
+
+    def windows_left(self, size: timedelta = BACKFILL_WINDOW) -> int:
+        return max(-(-(self.end - self.next) // size), 0)
+
+    @property
+    def percent(self) -> float:
+        total = (self.end - self.start).total_seconds()
+        return 100.0 if total <= 0 else round(100 * min((self.next - self.start).total_seconds() / total, 1.0), 1)
+
+
+class BackfillJob:
+    """
+    Imports the history of a zaehlpunkt window by window in a background task.
+    After every committed window, the checkpoint (next window and running sum) is persisted in Home Assistant's
+    storage, so the job resumes exactly there after a restart. It can be paused, resumed and cancelled.
+    A finished or cancelled backfill keeps its checkpoint, so the regular import continues after its end instead of
+    starting the backfill again (or importing the skipped history at once), even if it imported no statistics.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        async_smartmeter: AsyncSmartmeter,
+        zaehlpunkt: str,
+        granularity: ValueType = ValueType.QUARTER_HOUR,
+        on_progress: Optional[Callable[[], None]] = None,
+        window: timedelta = BACKFILL_WINDOW,
+        gaps: Optional[GapTracker] = None,
+        estimates: Optional[EstimateTracker] = None,
+    ):
+        self.hass = hass
+        self.zaehlpunkt = zaehlpunkt
+        self.window = window
+        self.on_progress = on_progress
+        self.importer = Importer(hass, async_smartmeter, zaehlpunkt, UnitOfEnergy.KILO_WATT_HOUR, granularity,
+                                 gaps=gaps, estimates=estimates)
+        self.checkpoint: Optional[BackfillCheckpoint] = None
+        self.last_error: Optional[str] = None
+        self._store = Store(hass, BACKFILL_STORAGE_VERSION, storage_key(zaehlpunkt))
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+        # seconds spent per window in this session, for the ETA
+        self._window_seconds: list[float] = []
+
+    @property
+    def active(self) -> bool:
+        """
+        True while there is history left to backfill (running or paused)
+        """
+        return self.checkpoint is not None and not self.checkpoint.cancelled and not self.checkpoint.done
+
+    @property
+    def cancelled(self) -> bool:
+        return self.checkpoint is not None and self.checkpoint.cancelled
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def async_load(self) -> Optional[BackfillCheckpoint]:
+        """
+        loads the persisted checkpoint (once)
+        """
+        if not self._loaded:
+            self._loaded = True
+            self.checkpoint = BackfillCheckpoint.from_dict(await self._store.async_load())
+            if self.checkpoint is not None:
+                _LOGGER.debug("Restored backfill of %s at %s", self.zaehlpunkt, self.checkpoint.next)
+        return self.checkpoint
+
+    async def async_begin(self, end: Optional[datetime] = None, total_usage: Decimal = Decimal(0)) -> None:
+        """
+        starts backfilling the history until `end` (default: today's midnight, UTC)
+        """
+        end = end if end is not None else datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.checkpoint = BackfillCheckpoint.begin(end, total_usage=total_usage)
+        await self._store.async_save(self.checkpoint.as_dict())
+        _LOGGER.warning("Starting backfill of historical data of %s in %d windows.", self.zaehlpunkt,
+                        self.checkpoint.windows_total(self.window))
+        self.async_start()
+
+    def async_start(self) -> bool:
+        """
+        starts (or resumes after a restart) the background task, unless it is paused, running or done
+        """
+        if not self.active or self.checkpoint.paused or self.running:
+            return False
+        self._task = self.hass.async_create_background_task(self._async_run(), f"{DOMAIN} backfill {self.zaehlpunkt}")
+        return True
+
+    async def async_stop(self) -> None:
+        """
+        stops the background task, keeping the checkpoint (e.g. when the entry is unloaded)
+        """
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def async_pause(self) -> None:
+        if not self.active:
+            return
+        await self.async_stop()
+        await self._async_save(self.checkpoint._replace(paused=True))
+
+    async def async_resume(self) -> None:
+        if not self.active:
+            return
+        await self._async_save(self.checkpoint._replace(paused=False))
+        self.async_start()
+
+    async def async_cancel(self) -> None:
+        """
+        stops the backfill for good, the statistics imported so far are kept
+        """
+        if not self.active:
+            return
+        await self.async_stop()
+        await self._async_save(self.checkpoint._replace(paused=False, cancelled=True))
+        if self.importer.gaps is not None:
+            # the skipped history is no hole to patch
+            await self.importer.gaps.async_set_scanned()
+        _LOGGER.warning("Cancelled backfill of historical data of %s.", self.zaehlpunkt)
+
+    def progress(self) -> Optional[dict[str, Any]]:
+        """
+        progress of the backfill as (json serializable) entity attributes
+        """
+        if not self.active:
+            return None
+        windows_left = self.checkpoint.windows_left(self.window)
+        eta = None
+        if self.running and self._window_seconds:
+            seconds = sum(self._window_seconds) / len(self._window_seconds) * windows_left
+            eta = (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat(timespec="seconds")
+        return {
+            "state": "paused" if self.checkpoint.paused else "running" if self.running else "pending",
+            "percent": self.checkpoint.percent,
+            "windows_left": windows_left,
+            "eta": eta,
+            "next": self.checkpoint.next.isoformat(),
+            "last_error": self.last_error,
+        }
+
+    def resume_point(self, start: Optional[datetime], total_usage: Decimal) -> tuple[Optional[datetime], Decimal]:
+        """
+        returns where the regular import continues given the end of the last statistics and their sum
+        (None if there are none): after a finished or cancelled backfill not before its end,
+        the history is neither backfilled again nor is the skipped history imported
+        """
+        if self.checkpoint is None or self.active:
+            return start, total_usage
+        if start is None:
+            return self.checkpoint.end, self.checkpoint.sum
+        return max(start, self.checkpoint.end), total_usage
+
+    async def _async_save(self, checkpoint: BackfillCheckpoint) -> None:
+        self.checkpoint = checkpoint
+        await self._store.async_save(checkpoint.as_dict())
+        self._notify()
+
+    def _notify(self) -> None:
+        if self.on_progress is not None:
+            self.on_progress()
+
+    async def _async_run(self) -> None:
+        try:
+            while not self.checkpoint.done:
+                started = time.monotonic()
+                start, end = self.checkpoint.window(self.window)
+                # the importer queries whole days up to (including) the given end
+                total = await self.importer.async_import_range(start, end - timedelta(days=1), self.checkpoint.sum)
+                await self._async_save(self.checkpoint._replace(next=end, sum=self.checkpoint.sum if total is None else total))
+                self._window_seconds.append(time.monotonic() - started)
+                self.last_error = None
+            # the done checkpoint is kept, see resume_point
+            _LOGGER.warning("Finished backfill of historical data of %s.", self.zaehlpunkt)
+        except (SmartmeterError, aiohttp.ClientError, TimeoutError, RuntimeError) as e:
+            # the next update cycle of the coordinator starts the job again at the checkpoint
+            self.last_error = f"{type(e).__name__}: {e}"
+            _LOGGER.warning("Backfill of %s stopped at %s: %s", self.zaehlpunkt, self.checkpoint.next, e)
+            self._notify()
+
+
+def async_get_backfills(hass: HomeAssistant) -> dict[str, BackfillJob]:
+    """
+    returns the backfill jobs of this integration by zaehlpunkt
+    """
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_BACKFILLS not in data:
+        data[DATA_BACKFILLS] = {}
+    return data[DATA_BACKFILLS]
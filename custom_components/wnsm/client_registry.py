@@ -0,0 +1,90 @@
+"""
+Registry handing out one long-lived api client per Wiener Netze account
+"""
+import logging
+from collections.abc import Hashable
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+
+from .AsyncSmartmeter import AsyncSmartmeter
+from .api import AsyncSmartmeterClient
+from .auth_store import AuthStore
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_CLIENT_REGISTRY = "client_registry"
+
+
+class ClientRegistry:
+    """
+    Shares one AsyncSmartmeter (session, tokens and login lock) between all sensors
+    and config entries of the same account (username).
+    Each user of a client acquires it with an owner token and releases it when done,
+    the client is dropped as soon as it has no owners anymore.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self.hass = hass
+        self._clients: dict[str, AsyncSmartmeter] = {}
+        self._owners: dict[str, set[Hashable]] = {}
+
+    def acquire(self, username: str, password: str, owner: Hashable) -> AsyncSmartmeter:
+        """
+        returns the client of the given account, creating it if necessary
+        """
+        client = self._clients.get(username)
+        if client is None:
+            smartmeter = AsyncSmartmeterClient(
+                username=username,
+                password=password,
+                # the session is closed on release, hence no auto cleanup
+                session=async_create_clientsession(self.hass, auto_cleanup=False),
+            )
+            client = AsyncSmartmeter(self.hass, smartmeter, AuthStore(self.hass, username))
+            self._clients[username] = client
+            _LOGGER.debug("Created api client for %s", username)
+        elif client.smartmeter.password != password:
+            # credentials have been changed, the next login has to use the new password
+            client.smartmeter.password = password
+            client.smartmeter.reset()
+        self._owners.setdefault(username, set()).add(owner)
+        return client
+
+    def get(self, username: str) -> AsyncSmartmeter | None:
+        """
+        returns the client of the given account without acquiring it
+        """
+        return self._clients.get(username)
+
+    def release(self, username: str, owner: Hashable) -> None:
+        """
+        releases the client of the given account for the given owner
+        """
+        owners = self._owners.get(username)
+        if owners is None:
+            return
+        owners.discard(owner)
+        if owners:
+            return
+        del self._owners[username]
+        client = self._clients.pop(username)
+        session = client.smartmeter.session
+        if session is not None and not session.closed:
+            # the session has been created without auto cleanup, closing it is up to the registry
+            self.hass.async_create_task(session.close(), f"{DOMAIN} close session")
+        _LOGGER.debug("Released api client for %s", username)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+def async_get_registry(hass: HomeAssistant) -> ClientRegistry:
+    """
+    returns the client registry of this integration
+    """
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_CLIENT_REGISTRY not in data:
+        data[DATA_CLIENT_REGISTRY] = ClientRegistry(hass)
+    return data[DATA_CLIENT_REGISTRY]
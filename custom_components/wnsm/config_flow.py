@@ -9,9 +9,9 @@ import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.const import CONF_USERNAME, CONF_PASSWORD
 
-from .api import Smartmeter
-from .const import ATTRS_ZAEHLPUNKTE_CALL, DOMAIN, CONF_ZAEHLPUNKTE
-from .utils import translate_dict
+from .api import AsyncSmartmeterClient
+from .api.models import Zaehlpunkt
+from .const import DOMAIN, CONF_ZAEHLPUNKTE
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -25,20 +25,19 @@ class WienerNetzeSmartMeterCustomConfigFlow(config_entries.ConfigFlow, domain=DO
 
     data: Optional[dict[str, Any]]
 
-    async def validate_auth(self, username: str, password: str) -> list[dict]:
+    async def validate_auth(self, username: str, password: str) -> list[Zaehlpunkt]:
         """
         Validates credentials for smartmeter.
         Raises a ValueError if the auth credentials are invalid.
         """
-        smartmeter = Smartmeter(username, password)
-        await self.hass.async_add_executor_job(smartmeter.login)
-        contracts = await self.hass.async_add_executor_job(smartmeter.zaehlpunkte)
-        zaehlpunkte=[]
-        if contracts is not None and isinstance(contracts, list) and len(contracts) > 0:
-            for contract in contracts:
-                if "zaehlpunkte" in contract:
-                    zaehlpunkte.extend(contract["zaehlpunkte"])
-        return zaehlpunkte
+        # the client owns its session (and cookies), it is closed once the credentials have been checked
+        smartmeter = AsyncSmartmeterClient(username, password)
+        try:
+            await smartmeter.login()
+            contracts = await smartmeter.contracts()
+        finally:
+            await smartmeter.close()
+        return [zp for contract in contracts for zp in contract.zaehlpunkte]
 
 
     async def async_step_user(self, user_input: Optional[dict[str, Any]] = None):
@@ -58,8 +57,8 @@ class WienerNetzeSmartMeterCustomConfigFlow(config_entries.ConfigFlow, domain=DO
                 # Input is valid, set data
                 self.data = user_input
                 self.data[CONF_ZAEHLPUNKTE] = [
-                    translate_dict(zp, ATTRS_ZAEHLPUNKTE_CALL) for zp in zps
-                    if zp["isActive"] # only create active zaehlpunkte, as inactive ones can appear in old contracts
+                    zp.as_attributes() for zp in zps
+                    if zp.active # only create active zaehlpunkte, as inactive ones can appear in old contracts
                 ]
                 # User is done authenticating, create entry
                 return self.async_create_entry(
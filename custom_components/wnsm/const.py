@@ -1,10 +1,38 @@
 """
     component constants
 """
+from datetime import timedelta
+
 DOMAIN = "wnsm"
 
 CONF_ZAEHLPUNKTE = "zaehlpunkte"
 
+# hourly statistics written to the recorder at once (about a month)
+STATISTICS_BATCH_SIZE = 24 * 31
+
+# zaehlpunkte of an account updated concurrently by its coordinator
+METER_UPDATE_CONCURRENCY = 3
+
+# version of the persisted login state (tokens and gateway keys) of an account
+AUTH_STORAGE_VERSION = 1
+
+# history imported by the backfill of a new zaehlpunkt, window by window
+BACKFILL_HISTORY = timedelta(days=365 * 3)
+BACKFILL_WINDOW = timedelta(days=30)
+# version of the persisted backfill checkpoints
+BACKFILL_STORAGE_VERSION = 1
+
+# gaps in the statistics re-fetched per update cycle, and how often a gap is tried before giving up on it
+GAP_PATCH_LIMIT = 4
+GAP_MAX_ATTEMPTS = 12
+# gaps are re-fetched (again) not before the next update cycle, the api needs time to publish the missing values
+GAP_PATCH_DELAY = timedelta(hours=5)
+# version of the persisted gaps (and estimated hours) of the statistics
+GAPS_STORAGE_VERSION = 1
+# estimated values are re-fetched once Wiener Netze had time to replace them with measured values
+ESTIMATE_REVALIDATION_DELAY = timedelta(days=3)
+ESTIMATE_PATCH_LIMIT = 2
+
 ATTRS_ZAEHLPUNKT_CALL = [
     ("zaehlpunktnummer", "zaehlpunktnummer"),
     ("customLabel", "label"),
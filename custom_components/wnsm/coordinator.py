@@ -0,0 +1,191 @@
+"""
+Coordinator updating all zaehlpunkte of an account in one cycle
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+import aiohttp
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .AsyncSmartmeter import AsyncSmartmeter
+from .api.constants import ValueType
+from .api.errors import SmartmeterError
+from .backfill import BackfillJob, async_get_backfills
+from .client_registry import async_get_registry
+from .const import DOMAIN, METER_UPDATE_CONCURRENCY
+from .gaps import EstimateTracker, GapTracker, async_get_estimate_trackers, async_get_gap_trackers
+from .importer import Importer
+from .utils import before, today
+
+_LOGGER = logging.getLogger(__name__)
+
+# Time between updating data from Wiener Netze
+UPDATE_INTERVAL = timedelta(minutes=60 * 6)
+
+
+class MeterData(NamedTuple):
+    """Result of a single zaehlpunkt of an update cycle"""
+    available: bool
+    attributes: dict
+    meter_reading: Optional[float] = None
+    updated: Optional[str] = None
+    #: start of the day the meter reading has been read
+    meter_reading_at: Optional[datetime] = None
+
+
+class WNSMCoordinator(DataUpdateCoordinator[dict[str, MeterData]]):
+    """
+    Updates all zaehlpunkte of an account at once: logs in and fetches the zaehlpunkte once per cycle,
+    the meter readings and statistics imports of the zaehlpunkte run concurrently (at most `max_concurrency`).
+    The sensors of the zaehlpunkte subscribe to this coordinator instead of polling on their own.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        username: str,
+        password: str,
+        zaehlpunkte: list[str],
+        config_entry: Optional[ConfigEntry] = None,
+        max_concurrency: int = METER_UPDATE_CONCURRENCY,
+    ):
+        super().__init__(
+            hass,
+            _LOGGER,
+            config_entry=config_entry,
+            name=f"{DOMAIN} {username}",
+            update_interval=UPDATE_INTERVAL,
+        )
+        self.username = username
+        self.zaehlpunkte = zaehlpunkte
+        self.max_concurrency = max_concurrency
+        self.async_smartmeter: AsyncSmartmeter = async_get_registry(hass).acquire(username, password, self)
+
+    async def async_shutdown(self) -> None:
+        """
+        release the shared api client
+        """
+        await super().async_shutdown()
+        backfills = async_get_backfills(self.hass)
+        for zaehlpunkt in self.zaehlpunkte:
+            backfill = backfills.pop(zaehlpunkt, None)
+            if backfill is not None:
+                # keeps the checkpoint, the backfill resumes when the entry is set up again
+                await backfill.async_stop()
+        gap_trackers, estimate_trackers = async_get_gap_trackers(self.hass), async_get_estimate_trackers(self.hass)
+        for zaehlpunkt in self.zaehlpunkte:
+            gap_trackers.pop(zaehlpunkt, None)
+            estimate_trackers.pop(zaehlpunkt, None)
+        async_get_registry(self.hass).release(self.username, self)
+
+    async def _async_update_data(self) -> dict[str, MeterData]:
+        try:
+            await self.async_smartmeter.login()
+            # fetched once for all zaehlpunkte, the per meter lookups hit the client's cache
+            await self.async_smartmeter.smartmeter.zaehlpunkte()
+        except (SmartmeterError, aiohttp.ClientError, TimeoutError, RuntimeError) as e:
+            raise UpdateFailed(f"Error retrieving data from smart meter api: {e}") from e
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(self._async_update_meter(zaehlpunkt, semaphore) for zaehlpunkt in self.zaehlpunkte))
+        data = dict(zip(self.zaehlpunkte, results))
+        if self.zaehlpunkte and not any(meter.available for meter in data.values()):
+            raise UpdateFailed("Error retrieving data from smart meter api for all zaehlpunkte")
+        return data
+
+    async def _async_update_meter(self, zaehlpunkt: str, semaphore: asyncio.Semaphore) -> MeterData:
+        """
+        fetches the meter reading of a single zaehlpunkt and imports its statistics
+        """
+        previous = (self.data or {}).get(zaehlpunkt)
+        attributes = previous.attributes if previous is not None else {}
+        meter_reading = previous.meter_reading if previous is not None else None
+        meter_reading_at = previous.meter_reading_at if previous is not None else None
+        async with semaphore:
+            try:
+                attributes = await self.async_smartmeter.get_zaehlpunkt(zaehlpunkt)
+                if self.async_smartmeter.is_active(attributes):
+                    if self._needs_meter_reading(meter_reading_at):
+                        # Since the update is not exactly at midnight, the readings of yesterday and the day before
+                        # are fetched at once and the latest one is used
+                        reading = await self.async_smartmeter.get_latest_meter_reading(zaehlpunkt, before(today(), 2), datetime.now())
+                        if reading is not None:
+                            meter_reading, meter_reading_at = reading
+                    granularity = ValueType.from_str(attributes.get("granularity", "QUARTER_HOUR"))
+                    gaps, estimates = await self._async_gaps(zaehlpunkt), await self._async_estimates(zaehlpunkt)
+                    backfill = await self._async_backfill(zaehlpunkt, granularity, gaps, estimates)
+                    if backfill.active:
+                        # the history is still being imported (e.g. resumed after a restart),
+                        # the regular import continues once it is done
+                        backfill.async_start()
+                    else:
+                        importer = Importer(self.hass, self.async_smartmeter, zaehlpunkt, UnitOfEnergy.KILO_WATT_HOUR,
+                                            granularity, backfill=backfill, gaps=gaps, estimates=estimates)
+                        await importer.async_import()
+                        if not backfill.active:
+                            # re-fetches a few of the hours which were missing when they were imported,
+                            # then (with lower priority) a few of the hours imported from estimated values
+                            await gaps.async_scan(importer)
+                            await gaps.async_patch(importer)
+                            await estimates.async_patch(importer)
+            except TimeoutError as e:
+                _LOGGER.warning("Error retrieving data of %s from smart meter api - Timeout: %s", zaehlpunkt, e)
+                return MeterData(False, attributes, meter_reading, meter_reading_at=meter_reading_at)
+            except (SmartmeterError, aiohttp.ClientError) as e:
+                # fails this zaehlpunkt only, the others of the cycle are updated regardless
+                _LOGGER.warning("Error retrieving data of %s from smart meter api - Error: %s", zaehlpunkt, e)
+                return MeterData(False, attributes, meter_reading, meter_reading_at=meter_reading_at)
+            except RuntimeError as e:
+                _LOGGER.exception("Error retrieving data of %s from smart meter api - Error: %s", zaehlpunkt, e)
+                return MeterData(False, attributes, meter_reading, meter_reading_at=meter_reading_at)
+        return MeterData(True, attributes, meter_reading, datetime.now().strftime("%d.%m.%Y %H:%M:%S"), meter_reading_at)
+
+    async def _async_backfill(self, zaehlpunkt: str, granularity: ValueType, gaps: Optional[GapTracker] = None,
+                              estimates: Optional[EstimateTracker] = None) -> BackfillJob:
+        """
+        returns the backfill job of a zaehlpunkt with its persisted checkpoint loaded
+        """
+        backfills = async_get_backfills(self.hass)
+        backfill = backfills.get(zaehlpunkt)
+        if backfill is None:
+            backfill = backfills[zaehlpunkt] = BackfillJob(
+                self.hass, self.async_smartmeter, zaehlpunkt, granularity, self.async_update_listeners,
+                gaps=gaps, estimates=estimates,
+            )
+        await backfill.async_load()
+        return backfill
+
+    async def _async_gaps(self, zaehlpunkt: str) -> GapTracker:
+        """
+        returns the gap tracker of a zaehlpunkt with its persisted gaps loaded
+        """
+        gap_trackers = async_get_gap_trackers(self.hass)
+        gaps = gap_trackers.get(zaehlpunkt)
+        if gaps is None:
+            gaps = gap_trackers[zaehlpunkt] = GapTracker(self.hass, zaehlpunkt)
+        await gaps.async_load()
+        return gaps
+
+    async def _async_estimates(self, zaehlpunkt: str) -> EstimateTracker:
+        """
+        returns the tracker of the estimated values of a zaehlpunkt with its persisted hours loaded
+        """
+        estimate_trackers = async_get_estimate_trackers(self.hass)
+        estimates = estimate_trackers.get(zaehlpunkt)
+        if estimates is None:
+            estimates = estimate_trackers[zaehlpunkt] = EstimateTracker(self.hass, zaehlpunkt)
+        await estimates.async_load()
+        return estimates
+
+    @staticmethod
+    def _needs_meter_reading(meter_reading_at: Optional[datetime]) -> bool:
+        """
+        the latest reading published by the api is the one of yesterday,
+        once it is known the api is not queried again until the next day
+        """
+        return meter_reading_at is None or meter_reading_at < before(today(), 1).astimezone()
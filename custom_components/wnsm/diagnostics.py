@@ -0,0 +1,38 @@
+"""
+Diagnostics of the Wiener Netze Smartmeter integration (api metrics of the entry's account)
+"""
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from .client_registry import async_get_registry
+
+# the credentials and everything identifying the customer, the meters or their address (the stored zaehlpunkte),
+# as the diagnostics are usually attached to public issues
+TO_REDACT = {
+    CONF_USERNAME, CONF_PASSWORD,
+    "customerId", "zaehlpunktnummer", "label", "equipmentNumber", "deviceId",
+    "street", "streetNumber", "zip", "city", "longitude", "latitude",
+}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return diagnostics of a config entry."""
+    client = async_get_registry(hass).get(entry.data[CONF_USERNAME])
+    diagnostics = {
+        "entry": async_redact_data(dict(entry.data), TO_REDACT),
+        "logged_in": False,
+        "api": {},
+    }
+    if client is not None:
+        smartmeter = client.smartmeter
+        diagnostics["logged_in"] = smartmeter.is_logged_in()
+        diagnostics["api"] = {
+            "summary": smartmeter.metrics.summary(),
+            "endpoints": smartmeter.metrics.snapshot(),
+            "loop_holds": smartmeter.metrics.loop_holds(),
+        }
+    return diagnostics
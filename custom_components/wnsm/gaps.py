@@ -0,0 +1,325 @@
+"""
+Detection and re-fetching of hours which are missing in the imported statistics
+(e.g. values the api reported as null, because they were not in the WSTW database yet)
+or which have been imported from estimated values, replaced by measured ones later on
+"""
+import logging
+import time
+from datetime import timedelta
+from decimal import Decimal
+from typing import TYPE_CHECKING, Callable, Iterable, NamedTuple, Optional
+
+import aiohttp
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .aggregation import SCALE, HourlyUsage, to_decimal
+from .api.errors import SmartmeterError
+from .api.series import MeasurementSeries
+from .const import (
+    DOMAIN, ESTIMATE_PATCH_LIMIT, ESTIMATE_REVALIDATION_DELAY, GAP_MAX_ATTEMPTS, GAP_PATCH_DELAY, GAP_PATCH_LIMIT,
+    GAPS_STORAGE_VERSION,
+)
+
+if TYPE_CHECKING:
+    from .importer import Importer
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_GAP_TRACKERS = "gap_trackers"
+DATA_ESTIMATE_TRACKERS = "estimate_trackers"
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+def storage_key(zaehlpunkt: str, kind: str = "gaps") -> str:
+    return f"{DOMAIN}.{kind}.{zaehlpunkt.lower()}"
+
+
+def _runs(flags: Iterable[bool], first: int) -> list[tuple[int, int]]:
+    """
+    returns the consecutive hours (starting at `first`) flagged True as [start, end) epoch ranges
+    """
+    runs = []
+    start = None
+    hour = first
+    for flag in flags:
+        if flag and start is None:
+            start = hour
+        elif not flag and start is not None:
+            runs.append((start, hour))
+            start = None
+        hour += HOUR
+    if start is not None:
+        runs.append((start, hour))
+    return runs
+
+
+def _first_reading(series: MeasurementSeries) -> Optional[int]:
+    """
+    returns the start of the first value of the series which is not null
+    """
+    missing = series.missing
+    for index in range(len(series)):
+        if not missing[index >> 3] & (1 << (index & 7)):
+            return series.starts[index]
+    return None
+
+
+def find_gaps(
+    series: MeasurementSeries, since: int, until: Optional[int] = None, first_reading: bool = False
+) -> list[tuple[int, int]]:
+    """
+    returns the hours within [since, until) which are not completely covered by values of the series
+    (missing or null values) as [start, end) epoch ranges.
+    until defaults to the end of the last value which is not null, hours after it are not published yet.
+    With `first_reading`, the hours before the first value which is not null are no gaps either
+    (e.g. the history before the meter has been installed).
+    """
+    missing = series.missing
+    if until is None:
+        until = since
+        for index in range(len(series) - 1, -1, -1):
+            if not missing[index >> 3] & (1 << (index & 7)):
+                until = series.ends[index]
+                break
+    if first_reading:
+        since = max(since, _first_reading(series) or until)
+    first = -(-since // HOUR) * HOUR
+    last = until - until % HOUR
+    if last <= first:
+        return []
+    covered = [0] * ((last - first) // HOUR)
+    for index, (start, end) in enumerate(zip(series.starts, series.ends)):
+        if missing[index >> 3] & (1 << (index & 7)) or end <= first or start >= last:
+            continue
+        start, end = max(start, first), min(end, last)
+        while start < end:
+            step = min(end, start - start % HOUR + HOUR)
+            covered[(start - first) // HOUR] += step - start
+            start = step
+    return _runs((seconds < HOUR for seconds in covered), first)
+
+
+def find_estimated(series: MeasurementSeries, since: int, until: Optional[int] = None) -> list[tuple[int, int]]:
+    """
+    returns the hours within [since, until) which contain estimated values as [start, end) epoch ranges
+    """
+    estimated, missing = series.estimated, series.missing
+    hours = set()
+    for index, (start, end) in enumerate(zip(series.starts, series.ends)):
+        bit = 1 << (index & 7)
+        if not estimated[index >> 3] & bit or missing[index >> 3] & bit:
+            continue
+        start, end = max(start, since), end if until is None else min(end, until)
+        hour = start - start % HOUR
+        while hour < end:
+            hours.add(hour)
+            hour += HOUR
+    if not hours:
+        return []
+    first = min(hours)
+    return _runs((hour in hours for hour in range(first, max(hours) + HOUR, HOUR)), first)
+
+
+def statistics_gaps(starts: Iterable[float], step: int = HOUR) -> list[tuple[int, int]]:
+    """
+    returns the holes between consecutive (sorted) statistics of the given cadence as [start, end) epoch ranges
+    """
+    gaps = []
+    previous = None
+    for start in starts:
+        start = int(start)
+        if previous is not None and start - previous > step:
+            gaps.append((previous + step, start))
+        previous = start
+    return gaps
+
+
+def rebase(rows: list[dict], hourly: HourlyUsage, until: int) -> tuple[list[tuple[int, int, Decimal]], Decimal]:
+    """
+    compares re-fetched hourly usage with the recorded statistics (rows with start, state and sum, from the start
+    of the patched range on) and returns the hours to rewrite as (start, usage, sum) and the difference of the sum
+    at `until`, by which all later statistics have to be adjusted.
+    Hours before the first changed hour are left as they are.
+    """
+    recorded = {int(row["start"]): row for row in rows if row["start"] < until}
+    usage = {hour: units for hour, units in zip(hourly.hours, hourly.usage) if hour < until}
+    first = rows[0]
+    # sum before the first recorded hour of the range
+    recorded_sum = Decimal(str(first["sum"])) - Decimal(str(first["state"] or 0))
+    delta = Decimal(0)
+    changed = []
+    for hour in sorted(recorded.keys() | usage.keys()):
+        row = recorded.get(hour)
+        recorded_units = 0 if row is None or row["state"] is None else round(row["state"] * SCALE)
+        if row is not None:
+            recorded_sum = Decimal(str(row["sum"]))
+        units = usage.get(hour, recorded_units)
+        delta += to_decimal(units - recorded_units)
+        if delta or units != recorded_units or row is None:
+            changed.append((hour, units, recorded_sum + delta))
+    return changed, delta
+
+
+class Gap(NamedTuple):
+    """Hours [start, end) (epoch seconds) to re-fetch, how often that has been tried and when it is due next"""
+    start: int
+    end: int
+    attempts: int = 0
+    due: int = 0
+
+
+def merge_gaps(gaps: Iterable[Gap], tolerance: int = DAY) -> list[Gap]:
+    """
+    merges overlapping gaps and gaps less than `tolerance` apart (they are re-fetched with a single request)
+    """
+    merged: list[Gap] = []
+    for gap in sorted(gaps):
+        if merged and gap.start <= merged[-1].end + tolerance:
+            last = merged[-1]
+            merged[-1] = Gap(last.start, max(last.end, gap.end), min(last.attempts, gap.attempts), max(last.due, gap.due))
+        else:
+            merged.append(gap)
+    return merged
+
+
+class GapTracker:
+    """
+    Keeps the gaps of the imported statistics of a zaehlpunkt (persisted in Home Assistant's storage)
+    and patches them: a few gaps per update cycle are re-fetched (each one not before `delay` has passed since
+    it has been found or tried) until they are complete or have been tried `GAP_MAX_ATTEMPTS` times.
+    """
+    #: name of the persisted ranges
+    kind = "gaps"
+    #: what is wrong with the hours of a gap (for the log)
+    description = "missing values"
+    limit = GAP_PATCH_LIMIT
+    #: gaps less than this apart are merged (and re-fetched with a single request)
+    tolerance = DAY
+    #: returns the hours of a re-fetched series which are still to be patched
+    pending: Callable[[MeasurementSeries, int, Optional[int]], list[tuple[int, int]]] = staticmethod(find_gaps)
+
+    def __init__(self, hass: HomeAssistant, zaehlpunkt: str, delay: timedelta = GAP_PATCH_DELAY):
+        self.zaehlpunkt = zaehlpunkt
+        self.delay = delay
+        self.gaps: list[Gap] = []
+        #: whether the statistics recorded before gaps were tracked have been scanned for holes
+        self.scanned = False
+        self._store = Store(hass, GAPS_STORAGE_VERSION, storage_key(zaehlpunkt, self.kind))
+        self._loaded = False
+
+    async def async_load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        data = await self._store.async_load() or {}
+        self.gaps = [Gap(*gap) for gap in data.get("gaps", [])]
+        self.scanned = data.get("scanned", False)
+
+    async def _async_save(self) -> None:
+        await self._store.async_save({"scanned": self.scanned, "gaps": [list(gap) for gap in self.gaps]})
+
+    async def async_add(self, gaps: list[tuple[int, int]]) -> None:
+        """
+        adds the gaps found while importing
+        """
+        if not gaps:
+            return
+        _LOGGER.debug("Found %d ranges of %s in the statistics of %s", len(gaps), self.description, self.zaehlpunkt)
+        due = self._due()
+        self.gaps = merge_gaps([*self.gaps, *(Gap(start, end, 0, due) for start, end in gaps)], self.tolerance)
+        await self._async_save()
+
+    def _due(self) -> int:
+        return int(time.time() + self.delay.total_seconds())
+
+    async def async_scan(self, importer: "Importer") -> None:
+        """
+        scans the already recorded statistics for holes (once)
+        """
+        if self.scanned:
+            return
+        gaps = await importer.async_recorded_gaps()
+        self.scanned = True
+        if gaps:
+            await self.async_add(gaps)
+        else:
+            await self._async_save()
+
+    async def async_set_scanned(self) -> None:
+        """
+        skips the scan of the recorded statistics, e.g. as the history skipped by a cancelled backfill is no hole
+        """
+        if not self.scanned:
+            self.scanned = True
+            await self._async_save()
+
+    async def async_patch(self, importer: "Importer", limit: Optional[int] = None) -> None:
+        """
+        re-fetches at most `limit` due gaps (the least often tried first) and patches their statistics
+        """
+        now = time.time()
+        patched = sorted((gap for gap in self.gaps if gap.due <= now), key=lambda gap: (gap.attempts, gap.start))
+        patched = patched[:self.limit if limit is None else limit]
+        if not patched:
+            return
+        gaps = [gap for gap in self.gaps if gap not in patched]
+        due = self._due()
+        for gap in patched:
+            try:
+                remaining = await importer.async_patch_hours(gap.start, gap.end, self.pending)
+            except (SmartmeterError, aiohttp.ClientError, TimeoutError) as e:
+                # counts as an attempt, the import of the zaehlpunkt has succeeded regardless
+                _LOGGER.warning("Error patching %s of %s from %s to %s: %s", self.description, self.zaehlpunkt,
+                                dt_util.utc_from_timestamp(gap.start), dt_util.utc_from_timestamp(gap.end), e)
+                remaining = None
+            if remaining is None:
+                remaining = [(gap.start, gap.end)]
+            for start, end in remaining:
+                if gap.attempts + 1 < GAP_MAX_ATTEMPTS:
+                    gaps.append(Gap(start, end, gap.attempts + 1, due))
+                else:
+                    _LOGGER.warning("Giving up on %s of %s from %s to %s", self.description, self.zaehlpunkt,
+                                    dt_util.utc_from_timestamp(start), dt_util.utc_from_timestamp(end))
+        self.gaps = merge_gaps(gaps, self.tolerance)
+        await self._async_save()
+
+
+class EstimateTracker(GapTracker):
+    """
+    Keeps the hours of a zaehlpunkt which have been imported from estimated (`geschaetzt`) values.
+    Once `delay` has passed, they are re-fetched with low priority (a few per update cycle, after the gaps) and
+    patched where Wiener Netze has replaced the estimates, until they are no longer estimated.
+    """
+    kind = "estimates"
+    description = "estimated values"
+    limit = ESTIMATE_PATCH_LIMIT
+    # estimates are usually whole days, merging the ones a day apart would join them into ranges spanning months
+    tolerance = 0
+    pending = staticmethod(find_estimated)
+
+    def __init__(self, hass: HomeAssistant, zaehlpunkt: str, delay: timedelta = ESTIMATE_REVALIDATION_DELAY):
+        super().__init__(hass, zaehlpunkt, delay)
+
+
+def async_get_gap_trackers(hass: HomeAssistant) -> dict[str, GapTracker]:
+    """
+    returns the gap trackers of this integration by zaehlpunkt
+    """
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_GAP_TRACKERS not in data:
+        data[DATA_GAP_TRACKERS] = {}
+    return data[DATA_GAP_TRACKERS]
+
+
+def async_get_estimate_trackers(hass: HomeAssistant) -> dict[str, EstimateTracker]:
+    """
+    returns the trackers of estimated values of this integration by zaehlpunkt
+    """
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_ESTIMATE_TRACKERS not in data:
+        data[DATA_ESTIMATE_TRACKERS] = {}
+    return data[DATA_ESTIMATE_TRACKERS]
@@ -1,9 +1,7 @@
 import logging
-from collections import defaultdict
 from datetime import timedelta, timezone, datetime
 from decimal import Decimal
-from operator import itemgetter
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
 
 from homeassistant.components.recorder import get_instance
 from homeassistant.components.recorder.models import (
@@ -11,7 +9,7 @@ from homeassistant.components.recorder.models import (
     StatisticMetaData
 )
 from homeassistant.components.recorder.statistics import (
-    get_last_statistics, async_add_external_statistics, StatisticMeanType
+    get_last_statistics, async_add_external_statistics, statistics_during_period, StatisticMeanType
 )
 from homeassistant.core import HomeAssistant
 from homeassistant.util import dt as dt_util
@@ -19,20 +17,55 @@ from homeassistant.util import dt as dt_util
 from homeassistant.util.unit_conversion import EnergyConverter
 
 from .AsyncSmartmeter import AsyncSmartmeter
+from .aggregation import UNIT_SCALE, HourlyUsage, aggregate_hourly, to_decimal, to_float
+from .api import payloads
 from .api.constants import ValueType
-from .const import DOMAIN
+from .api.series import MeasurementSeries
+from .const import DOMAIN, STATISTICS_BATCH_SIZE
+from .gaps import DAY, HOUR, EstimateTracker, GapTracker, find_estimated, find_gaps, rebase, statistics_gaps
+from .watchdog import LoopWatchdog
+
+if TYPE_CHECKING:
+    from .backfill import BackfillJob
 
 _LOGGER = logging.getLogger(__name__)
 
+# statistics after a patched range which are queried along with it (the sum before a gap is derived from them)
+PATCH_LOOKAHEAD = timedelta(days=7)
+
+
+def statistics_batches(hourly: HourlyUsage, total_usage: Decimal, batch_size: int = STATISTICS_BATCH_SIZE) -> Iterator[list[StatisticData]]:
+    """
+    builds the hourly statistics in batches of at most `batch_size` rows,
+    the sums continue the given total usage of the previously imported statistics
+    """
+    for offset in range(0, len(hourly.hours), batch_size):
+        batch = slice(offset, offset + batch_size)
+        yield [
+            StatisticData(start=dt_util.utc_from_timestamp(epoch), sum=total_usage + to_decimal(cumulated), state=to_float(usage))
+            for epoch, usage, cumulated in zip(hourly.hours[batch], hourly.usage[batch], hourly.sums[batch])
+        ]
+
+
 class Importer:
 
-    def __init__(self, hass: HomeAssistant, async_smartmeter: AsyncSmartmeter, zaehlpunkt: str, unit_of_measurement: str, granularity: ValueType = ValueType.QUARTER_HOUR):
+    def __init__(self, hass: HomeAssistant, async_smartmeter: AsyncSmartmeter, zaehlpunkt: str, unit_of_measurement: str, granularity: ValueType = ValueType.QUARTER_HOUR,
+                 batch_size: int = STATISTICS_BATCH_SIZE, backfill: Optional["BackfillJob"] = None,
+                 gaps: Optional[GapTracker] = None, estimates: Optional[EstimateTracker] = None):
         self.id = f'{DOMAIN}:{zaehlpunkt.lower()}'
         self.zaehlpunkt = zaehlpunkt
         self.granularity = granularity
         self.unit_of_measurement = unit_of_measurement
         self.hass = hass
         self.async_smartmeter = async_smartmeter
+        # number of hourly statistics written (and committed) at once
+        self.batch_size = batch_size
+        # imports the history in the background instead of the initial import
+        self.backfill = backfill
+        # records the hours missing in the imported data, to re-fetch them later on
+        self.gaps = gaps
+        # records the hours imported from estimated values, to re-fetch them once they are measured
+        self.estimates = estimates
 
     def is_last_inserted_stat_valid(self, last_inserted_stat):
         return len(last_inserted_stat) == 1 and len(last_inserted_stat[self.id]) == 1 and \
@@ -87,46 +120,66 @@ class Importer:
         )
         _LOGGER.debug("Last inserted stat: %s" % last_inserted_stat)
         try:
-            await self.async_smartmeter.login()
-            zaehlpunkt = await (self.async_smartmeter.get_zaehlpunkt(self.zaehlpunkt))
-
-            if not self.async_smartmeter.is_active(zaehlpunkt):
-                _LOGGER.debug("Smartmeter %s is not active" % zaehlpunkt)
-                return
-
-            if not self.is_last_inserted_stat_valid(last_inserted_stat):
-                # No previous data - start from scratch
-                _LOGGER.warning("Starting import of historical data. This might take some time.")
-                _sum = await self._initial_import_statistics()
-            else:
-                start_off_point = self.prepare_start_off_point(last_inserted_stat)
-                if start_off_point is None:
-                    return
-                start, _sum = start_off_point
-                _sum = await self._incremental_import_statistics(start, _sum)
-
-            # XXX: Note that the state of this sensor must never be an integer value, such as 0!
-            # If it is set to any number, home assistant will assume that a negative consumption
-            # compensated the last statistics entry and add a negative consumption in the energy
-            # dashboard.
-            # This is a technical debt of HA, as we cannot import statistics and have states at the
-            # same time.
-            # Due to None, the sensor will always show "unkown" - but that is currently the only way
-            # how historical data can be imported without rewriting the database on our own...
-            last_inserted_stat = await get_instance(self.hass).async_add_executor_job(
-                get_last_statistics,
-                self.hass,
-                1,  # Get at most one entry
-                self.id,  # of this sensor's statistics
-                True,  # convert the units
-                {"sum"}  # the fields we want to query
-            )
-            _LOGGER.debug("Last inserted stat: %s", last_inserted_stat)
+            await self._async_import(last_inserted_stat)
         except TimeoutError as e:
             _LOGGER.warning("Error retrieving data from smart meter api - Timeout: %s" % e)
         except RuntimeError as e:
             _LOGGER.exception("Error retrieving data from smart meter api - Error: %s" % e)
 
+    def _record_loop_hold(self, seconds: float):
+        self.async_smartmeter.smartmeter.metrics.record_loop_hold("import", seconds)
+
+    async def _async_import(self, last_inserted_stat):
+        """
+        imports the statistics of the zaehlpunkt, continuing the last inserted statistics if there are any
+        """
+        await self.async_smartmeter.login()
+        zaehlpunkt = await (self.async_smartmeter.get_zaehlpunkt(self.zaehlpunkt))
+
+        if not self.async_smartmeter.is_active(zaehlpunkt):
+            _LOGGER.debug("Smartmeter %s is not active" % zaehlpunkt)
+            return
+
+        if not self.is_last_inserted_stat_valid(last_inserted_stat):
+            start_off_point = None, Decimal(0)
+        else:
+            start_off_point = self.prepare_start_off_point(last_inserted_stat)
+            if start_off_point is None:
+                return
+        if self.backfill is not None:
+            # after a finished or cancelled backfill the import continues at its end, even without statistics
+            start_off_point = self.backfill.resume_point(*start_off_point)
+        start, _sum = start_off_point
+
+        if start is None:
+            if self.backfill is not None:
+                # No previous data - the history is imported window by window in the background
+                await self.backfill.async_begin()
+                return
+            # No previous data - start from scratch
+            _LOGGER.warning("Starting import of historical data. This might take some time.")
+            _sum = await self._initial_import_statistics()
+        else:
+            _sum = await self._incremental_import_statistics(start, _sum)
+
+        # XXX: Note that the state of this sensor must never be an integer value, such as 0!
+        # If it is set to any number, home assistant will assume that a negative consumption
+        # compensated the last statistics entry and add a negative consumption in the energy
+        # dashboard.
+        # This is a technical debt of HA, as we cannot import statistics and have states at the
+        # same time.
+        # Due to None, the sensor will always show "unkown" - but that is currently the only way
+        # how historical data can be imported without rewriting the database on our own...
+        last_inserted_stat = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics,
+            self.hass,
+            1,  # Get at most one entry
+            self.id,  # of this sensor's statistics
+            True,  # convert the units
+            {"sum"}  # the fields we want to query
+        )
+        _LOGGER.debug("Last inserted stat: %s", last_inserted_stat)
+
     def get_statistics_metadata(self):
         return StatisticMetaData(
             source=DOMAIN,
@@ -144,9 +197,22 @@ class Importer:
     async def _incremental_import_statistics(self, start: datetime, total_usage: Decimal):
         return await self._import_statistics(start=start, total_usage=total_usage)
 
+    async def async_import_range(self, start: datetime, end: datetime, total_usage: Decimal) -> Optional[Decimal]:
+        """
+        imports the statistics from start until (including) the day of end, continuing the given total usage.
+        Returns the new total usage, None if there was nothing to import.
+        """
+        return await self._import_statistics(start=start, end=end, total_usage=total_usage)
+
     async def _import_statistics(self, start: datetime = None, end: datetime = None, total_usage: Decimal = Decimal(0)) -> Optional[Decimal]:
-        """Import statistics"""
+        """
+        Import statistics, measuring for how long the event loop is held meanwhile
+        (by the regular import as well as by the windows of a backfill)
+        """
+        async with LoopWatchdog(self._record_loop_hold):
+            return await self._async_import_statistics(start, end, total_usage)
 
+    async def _async_import_statistics(self, start: Optional[datetime], end: Optional[datetime], total_usage: Decimal) -> Optional[Decimal]:
         start = start if start is not None else datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=365 * 3)
         end = end if end is not None else datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
 
@@ -158,52 +224,119 @@ class Importer:
             _LOGGER.warning(f"Ignoring async update since last import happened in the future (should not happen) {start} > {end}")
             return None
 
+        fetched = await self._async_fetch(start, end)
+        if fetched is None:
+            return None
+        series, multiplier = fetched
+        # Values are summed per hour as fixed point integers (exact, see aggregation.SCALE),
+        # like building the statistics below in the executor, so the event loop is not held by the whole series
+        hourly = await self.hass.async_add_executor_job(aggregate_hourly, series, multiplier, start.timestamp())
+        # Can actually check, if the whole batch can be skipped.
+        if hourly.total == 0:
+            _LOGGER.debug(f"Batch of data starting at {start} does not contain any bewegungsdaten. Seems there is nothing to import, yet.")
+            return None
+        # only the hours of imported windows are gaps or estimates to re-fetch later on
+        await self._async_check_series(series, hourly, int(start.timestamp()), first_reading=not total_usage)
+
+        metadata = self.get_statistics_metadata()
+        batches = statistics_batches(hourly, total_usage, self.batch_size)
+        while statistics := await self.hass.async_add_executor_job(next, batches, None):
+            await self._async_write_statistics(metadata, statistics)
+        return total_usage + to_decimal(hourly.total)
+
+    async def _async_check_series(self, series: MeasurementSeries, hourly: HourlyUsage, start: int, first_reading: bool = False):
+        """
+        reports the values which could not be imported and records the missing and the estimated hours
+        of the series, to re-fetch them later on.
+        If nothing has been imported before (`first_reading`), the hours before the first reading are no gaps
+        (e.g. the first window of a backfill starts before the meter has been installed)
+        """
+        if self.gaps is not None:
+            await self.gaps.async_add(await self.hass.async_add_executor_job(find_gaps, series, start, None, first_reading))
+        if hourly.skipped:
+            # This should prevent any issues with ambiguous values though...
+            _LOGGER.warning(f"Ignored {hourly.skipped} values from API, which do not start after the previously collected timestamp")
+        if hourly.misaligned:
+            _LOGGER.warning(f"Unexpected time detected in historic data: {hourly.misaligned} values do not start at a quarter hour")
+        if hourly.estimated:
+            _LOGGER.debug("%d estimated values found", hourly.estimated)
+            if self.estimates is not None:
+                await self.estimates.async_add(await self.hass.async_add_executor_job(find_estimated, series, start))
+
+    async def _async_fetch(self, start: datetime, end: datetime) -> Optional[tuple[MeasurementSeries, int]]:
+        """
+        fetches the bewegungsdaten from start until (including) the day of end,
+        returns the series and the multiplier of its unit (see aggregation.UNIT_SCALE)
+        """
         bewegungsdaten = await self.async_smartmeter.get_bewegungsdaten(self.zaehlpunkt, start, end, self.granularity)
-        _LOGGER.debug(f"Mapped historical data: {bewegungsdaten}")
+        payloads.log_payload("Mapped historical data: %s", bewegungsdaten)
         if bewegungsdaten['unitOfMeasurement'] is None:
             _LOGGER.warning("Unit of measurement is None! Aborting import...")
             return None
-        elif bewegungsdaten['unitOfMeasurement'] == 'WH':
-            factor = 1e-3
-        elif bewegungsdaten['unitOfMeasurement'] == 'KWH':
-            factor = 1.0
+        elif bewegungsdaten['unitOfMeasurement'] in UNIT_SCALE:
+            multiplier = UNIT_SCALE[bewegungsdaten['unitOfMeasurement']]
         else:
             raise NotImplementedError(f'Unit {bewegungsdaten["unitOfMeasurement"]}" is not yet implemented. Please report!')
 
-        dates = defaultdict(Decimal)
         if 'values' not in bewegungsdaten:
             raise ValueError("WienerNetze does not report historical data (yet)")
-        total_consumption = sum([v.get("wert", 0) for v in bewegungsdaten['values']])
-        # Can actually check, if the whole batch can be skipped.
-        if total_consumption == 0:
-            _LOGGER.debug(f"Batch of data starting at {start} does not contain any bewegungsdaten. Seems there is nothing to import, yet.")
-            return None
+        return bewegungsdaten['values'], multiplier
 
-        last_ts = start
-        for value in bewegungsdaten['values']:
-            ts = dt_util.parse_datetime(value['zeitpunktVon'])
-            if ts < last_ts:
-                # This should prevent any issues with ambiguous values though...
-                _LOGGER.warning(f"Timestamp from API ({ts}) is less than previously collected timestamp ({last_ts}), ignoring value!")
-                continue
-            last_ts = ts
-            if value['wert'] is None:
-                # Usually this means that the measurement is not yet in the WSTW database.
-                continue
-            reading = Decimal(value['wert'] * factor)
-            if ts.minute % 15 != 0 or ts.second != 0 or ts.microsecond != 0:
-                _LOGGER.warning(f"Unexpected time detected in historic data: {value}")
-            dates[ts.replace(minute=0)] += reading
-            if value['geschaetzt']:
-                _LOGGER.debug(f"Not seen that before: Estimated Value found for {ts}: {reading}")
-
-        statistics = []
-        metadata = self.get_statistics_metadata()
+    async def async_recorded_gaps(self) -> list[tuple[int, int]]:
+        """
+        returns the holes between the recorded statistics of the last three years as [start, end) epoch ranges
+        """
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=365 * 3)
+        rows = await get_instance(self.hass).async_add_executor_job(
+            statistics_during_period, self.hass, start, None, {self.id}, "hour", None, {"state"}
+        )
+        step = DAY if self.granularity == ValueType.DAY else HOUR
+        return statistics_gaps((row["start"] for row in rows.get(self.id, [])), step)
+
+    async def async_patch_hours(
+        self, start: int, end: int, pending: Callable[[MeasurementSeries, int, Optional[int]], list[tuple[int, int]]] = find_gaps
+    ) -> Optional[list[tuple[int, int]]]:
+        """
+        re-fetches the hours [start, end) (epoch seconds) and patches their statistics: the hours from the first
+        changed hour on are rewritten and all later statistics are re-based by the difference of the sum.
+        Returns the hours of the range which are still to be patched according to `pending` (by default the
+        incomplete ones), None if the range could not be patched (e.g. because there are no statistics after it yet).
+        """
+        start_time, end_time = dt_util.utc_from_timestamp(start), dt_util.utc_from_timestamp(end)
+        rows = (await get_instance(self.hass).async_add_executor_job(
+            statistics_during_period, self.hass, start_time, end_time + PATCH_LOOKAHEAD, {self.id}, "hour", None,
+            {"state", "sum"},
+        )).get(self.id)
+        if not rows:
+            return None
+        # the api is queried for whole days, the last one is the day of the last hour
+        fetched = await self._async_fetch(start_time, end_time - timedelta(seconds=1))
+        if fetched is None:
+            return None
+        series, multiplier = fetched
+        hourly = await self.hass.async_add_executor_job(aggregate_hourly, series, multiplier, start)
+        remaining = await self.hass.async_add_executor_job(pending, series, start, end)
+        if self.estimates is not None and pending is not find_estimated:
+            # hours filled in by the patch may be estimated, too
+            await self.estimates.async_add(await self.hass.async_add_executor_job(find_estimated, series, start, end))
+        changed, delta = await self.hass.async_add_executor_job(rebase, rows, hourly, end)
+        if changed:
+            _LOGGER.debug("Patching %d statistics of %s from %s on, re-basing the sum by %s", len(changed),
+                          self.zaehlpunkt, dt_util.utc_from_timestamp(changed[0][0]), delta)
+            await self._async_write_statistics(self.get_statistics_metadata(), [
+                StatisticData(start=dt_util.utc_from_timestamp(hour), sum=_sum, state=to_float(usage))
+                for hour, usage, _sum in changed
+            ])
+        if delta:
+            get_instance(self.hass).async_adjust_statistics(self.id, end_time, float(delta), self.unit_of_measurement)
+            await get_instance(self.hass).async_block_till_done()
+        return remaining
 
-        for ts, usage in sorted(dates.items(), key=itemgetter(0)):
-            total_usage += usage
-            statistics.append(StatisticData(start=ts, sum=total_usage, state=float(usage)))
-        if len(statistics) > 0:
-            _LOGGER.debug(f"Importing statistics from {statistics[0]} to {statistics[-1]}")
+    async def _async_write_statistics(self, metadata: StatisticMetaData, statistics: list[StatisticData]):
+        """
+        writes a batch of statistics and waits until the recorder has committed it,
+        so the running sum of everything written so far is persisted before the next batch is built
+        """
+        _LOGGER.debug("Importing statistics from %s to %s", statistics[0], statistics[-1])
         async_add_external_statistics(self.hass, metadata, statistics)
-        return total_usage
+        await get_instance(self.hass).async_block_till_done()
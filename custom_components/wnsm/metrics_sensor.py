@@ -0,0 +1,67 @@
+import logging
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfTime
+
+from .AsyncSmartmeter import AsyncSmartmeter
+from .client_registry import async_get_registry
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ApiMetricsSensor(SensorEntity):
+    """
+    Diagnostic sensor exposing the api metrics of an account (disabled by default)
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    #: unit and icon per summary key exposed as sensor
+    KINDS = {
+        "mean_latency": (UnitOfTime.MILLISECONDS, "mdi:timer-outline"),
+        "errors": (None, "mdi:alert-circle-outline"),
+    }
+
+    def __init__(self, username: str, password: str, entry_id: str, kind: str) -> None:
+        super().__init__()
+        self.username = username
+        self.password = password
+        self.kind = kind
+        unit, icon = self.KINDS[kind]
+        self._attr_name = f"Wiener Netze API {kind.replace('_', ' ')}"
+        self._attr_unique_id = f"{entry_id}_api_{kind}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_icon = icon
+        self._async_smartmeter: AsyncSmartmeter | None = None
+
+    def async_smartmeter(self) -> AsyncSmartmeter:
+        if self._async_smartmeter is None:
+            self._async_smartmeter = async_get_registry(self.hass).acquire(self.username, self.password, self)
+        return self._async_smartmeter
+
+    async def async_will_remove_from_hass(self) -> None:
+        if self._async_smartmeter is not None:
+            async_get_registry(self.hass).release(self.username, self)
+            self._async_smartmeter = None
+
+    async def async_update(self):
+        """
+        update sensor from the metrics registry of the shared client
+        """
+        metrics = self.async_smartmeter().smartmeter.metrics
+        summary = metrics.summary()
+        value = summary[self.kind]
+        if self.kind == "mean_latency" and value is not None:
+            value = round(value * 1000, 1)
+        self._attr_native_value = value
+        self._attr_extra_state_attributes = {
+            endpoint: {
+                "requests": stats["requests"],
+                "errors": sum(stats["errors"].values()),
+                "p95_latency_ms": None if stats["latency"]["p95"] is None else round(stats["latency"]["p95"] * 1000, 1),
+                "last_error": stats["last_error"],
+            }
+            for endpoint, stats in metrics.snapshot().items()
+        }
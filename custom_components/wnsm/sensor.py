@@ -17,13 +17,15 @@ from homeassistant.const import (
     CONF_DEVICE_ID
 )
 from homeassistant.core import DOMAIN
+from homeassistant.exceptions import PlatformNotReady
 from homeassistant.helpers.typing import (
     ConfigType,
     DiscoveryInfoType,
 )
-from .const import CONF_ZAEHLPUNKTE
+from .coordinator import WNSMCoordinator
+from .metrics_sensor import ApiMetricsSensor
 from .wnsm_sensor import WNSMSensor
-# Time between updating data from Wiener Netze
+# Time between updating the (polled) diagnostic sensors, the zaehlpunkte are updated by the coordinator
 SCAN_INTERVAL = timedelta(minutes=60 * 6)
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
@@ -40,12 +42,17 @@ async def async_setup_entry(
     async_add_entities,
 ):
     """Setup sensors from a config entry created in the integrations UI."""
-    config = hass.data[DOMAIN][config_entry.entry_id]
-    wnsm_sensors = [
-        WNSMSensor(config[CONF_USERNAME], config[CONF_PASSWORD], zp["zaehlpunktnummer"])
-        for zp in config[CONF_ZAEHLPUNKTE]
+    config = config_entry.data
+    # refreshed for the first time by the setup of the entry
+    coordinator: WNSMCoordinator = hass.data[DOMAIN][config_entry.entry_id]
+    wnsm_sensors = [WNSMSensor(coordinator, zaehlpunkt) for zaehlpunkt in coordinator.zaehlpunkte]
+    # diagnostic sensors of the api client, disabled by default
+    metrics_sensors = [
+        ApiMetricsSensor(config[CONF_USERNAME], config[CONF_PASSWORD], config_entry.entry_id, kind)
+        for kind in ApiMetricsSensor.KINDS
     ]
-    async_add_entities(wnsm_sensors, update_before_add=True)
+    async_add_entities(wnsm_sensors)
+    async_add_entities(metrics_sensors, update_before_add=True)
 
 
 async def async_setup_platform(
@@ -57,5 +64,10 @@ async def async_setup_platform(
     ] = None,  # pylint: disable=unused-argument
 ) -> None:
     """Set up the sensor platform by adding it into configuration.yaml"""
-    wnsm_sensor = WNSMSensor(config[CONF_USERNAME], config[CONF_PASSWORD], config[CONF_DEVICE_ID])
-    async_add_entities([wnsm_sensor], update_before_add=True)
+    coordinator = WNSMCoordinator(hass, config[CONF_USERNAME], config[CONF_PASSWORD], [config[CONF_DEVICE_ID]], None)
+    await coordinator.async_refresh()
+    if not coordinator.last_update_success:
+        # without a config entry, the platform is retried instead (async_config_entry_first_refresh needs an entry)
+        await coordinator.async_shutdown()
+        raise PlatformNotReady from coordinator.last_exception
+    async_add_entities([WNSMSensor(coordinator, config[CONF_DEVICE_ID])])
@@ -0,0 +1,53 @@
+"""
+Services of the Wiener Netze Smartmeter integration
+"""
+import voluptuous as vol
+
+import homeassistant.helpers.config_validation as cv
+from homeassistant.core import HomeAssistant, ServiceCall
+
+from .backfill import async_get_backfills
+from .const import DOMAIN
+
+ATTR_ZAEHLPUNKT = "zaehlpunkt"
+
+SERVICE_PAUSE_BACKFILL = "pause_backfill"
+SERVICE_RESUME_BACKFILL = "resume_backfill"
+SERVICE_CANCEL_BACKFILL = "cancel_backfill"
+
+BACKFILL_SCHEMA = vol.Schema({vol.Optional(ATTR_ZAEHLPUNKT): cv.string})
+
+
+def _backfills(hass: HomeAssistant, call: ServiceCall) -> list:
+    """
+    the backfill jobs addressed by a service call, all of them if no zaehlpunkt is given
+    """
+    backfills = async_get_backfills(hass)
+    zaehlpunkt = call.data.get(ATTR_ZAEHLPUNKT)
+    if zaehlpunkt is None:
+        return list(backfills.values())
+    return [backfills[zaehlpunkt]] if zaehlpunkt in backfills else []
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """
+    registers the services (once for all entries)
+    """
+    if hass.services.has_service(DOMAIN, SERVICE_PAUSE_BACKFILL):
+        return
+
+    async def pause_backfill(call: ServiceCall) -> None:
+        for backfill in _backfills(hass, call):
+            await backfill.async_pause()
+
+    async def resume_backfill(call: ServiceCall) -> None:
+        for backfill in _backfills(hass, call):
+            await backfill.async_resume()
+
+    async def cancel_backfill(call: ServiceCall) -> None:
+        for backfill in _backfills(hass, call):
+            await backfill.async_cancel()
+
+    hass.services.async_register(DOMAIN, SERVICE_PAUSE_BACKFILL, pause_backfill, schema=BACKFILL_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_RESUME_BACKFILL, resume_backfill, schema=BACKFILL_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_CANCEL_BACKFILL, cancel_backfill, schema=BACKFILL_SCHEMA)
@@ -5,7 +5,7 @@ from __future__ import annotations
 from functools import reduce
 from datetime import timezone, timedelta, datetime
 import logging
-from typing import Optional
+from typing import Any, Callable, Optional
 
 
 def today(tz: Optional[timezone] = None) -> datetime:
@@ -71,15 +71,60 @@ def safeget(dct, *keys, default=None):
     return dct
 
 
+def _compile_step(key: str | int) -> Callable[[Any], Any]:
+    """
+    compiles a single segment of a dotted path: digits index lists, all others index dicts
+    """
+    if isinstance(key, int):
+        def get_index(data):
+            return data[key] if isinstance(data, list) and key < len(data) else None
+        return get_index
+
+    def get_key(data):
+        return data.get(key) if isinstance(data, dict) else None
+    return get_key
+
+
+def compile_path(path: str) -> Callable[[Any], Any]:
+    """
+    compiles a dotted path (see `dict_path`) into a getter with the same semantics:
+    digit segments index lists, all others index dicts, anything missing (or of another type) yields None
+    """
+    steps = tuple(_compile_step(strint(s)) for s in path.split("."))
+    if len(steps) == 1:
+        return steps[0]
+
+    def get_path(data):
+        for step in steps:
+            data = step(data)
+            if data is None:
+                return None
+        return data
+    return get_path
+
+
+class AttributeExtractor:
+    """
+    An attribute mapping (see `translate_dict`) compiled into one getter per attribute.
+    Compile it once where the mapping is used (e.g. at module level) and call it per response.
+    """
+
+    __slots__ = ("attrs_list", "_getters")
+
+    def __init__(self, attrs_list: list[tuple[str, str]]):
+        self.attrs_list = attrs_list
+        self._getters = tuple((destination, compile_path(src)) for src, destination in attrs_list)
+
+    def __call__(self, dictionary: dict) -> dict[str, Any]:
+        return {destination: getter(dictionary) for destination, getter in self._getters}
+
+
 def translate_dict(
         dictionary: dict, attrs_list: list[tuple[str, str]]
 ) -> dict[str, str]:
     """
     Given a response dictionary and an attribute mapping (with nested accessors separated by '.')
-    returns a dictionary including all "picked" attributes addressed by attrs_list
+    returns a dictionary including all "picked" attributes addressed by attrs_list.
+    Compiles the mapping on every call, repeatedly used mappings are compiled once into an AttributeExtractor.
     """
-    result = {}
-    for src, destination in attrs_list:
-        value = dict_path(src, dictionary)
-        result[destination] = value
-    return result
+    return AttributeExtractor(attrs_list)(dictionary)
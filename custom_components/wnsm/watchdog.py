@@ -0,0 +1,49 @@
+"""
+Watchdog measuring for how long the event loop is held while a task (e.g. a statistics import) runs
+"""
+import asyncio
+from typing import Callable, Optional
+
+#: interval between two wakeups of the watchdog (seconds)
+WATCHDOG_INTERVAL = 0.05
+
+
+class LoopWatchdog:
+    """
+    Wakes up every `interval` seconds while in the context and observes how late it has been woken up,
+    which is how long the event loop has been held by other (synchronous) work in the meantime.
+
+        async with LoopWatchdog(lambda hold: metrics.record_loop_hold("import", hold)) as watchdog:
+            await importer.async_import()
+        watchdog.max_hold
+    """
+
+    def __init__(self, observe: Optional[Callable[[float], None]] = None, interval: float = WATCHDOG_INTERVAL):
+        self.observe = observe
+        self.interval = interval
+        self.max_hold = 0.0
+        self.wakeups = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "LoopWatchdog":
+        self._task = asyncio.get_running_loop().create_task(self._watch())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _watch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            hold = max(loop.time() - expected, 0.0)
+            self.wakeups += 1
+            self.max_hold = max(self.max_hold, hold)
+            if self.observe is not None:
+                self.observe(hold)
@@ -1,5 +1,4 @@
 import logging
-from datetime import datetime
 from typing import Any, Optional
 
 from homeassistant.components.sensor import (
@@ -9,30 +8,29 @@ from homeassistant.components.sensor import (
 )
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.const import UnitOfEnergy
+from homeassistant.core import callback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.util import slugify
 
-from .AsyncSmartmeter import AsyncSmartmeter
-from .api import Smartmeter
 from .api.constants import ValueType
-from .importer import Importer
-from .utils import before, today
+from .backfill import async_get_backfills
+from .coordinator import WNSMCoordinator
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class WNSMSensor(SensorEntity):
+class WNSMSensor(CoordinatorEntity[WNSMCoordinator], SensorEntity):
     """
     Representation of a Wiener Smartmeter sensor
-    for measuring total increasing energy consumption for a specific zaehlpunkt
+    for measuring total increasing energy consumption for a specific zaehlpunkt,
+    updated by the coordinator of its account
     """
 
     def _icon(self) -> str:
         return "mdi:flash"
 
-    def __init__(self, username: str, password: str, zaehlpunkt: str) -> None:
-        super().__init__()
-        self.username = username
-        self.password = password
+    def __init__(self, coordinator: WNSMCoordinator, zaehlpunkt: str) -> None:
+        super().__init__(coordinator)
         self.zaehlpunkt = zaehlpunkt
 
         self._attr_native_value: int | float | None = 0
@@ -73,37 +71,28 @@ class WNSMSensor(SensorEntity):
     @property
     def available(self) -> bool:
         """Return True if entity is available."""
-        return self._available
+        return self.coordinator.last_update_success and self._available
 
     def granularity(self) -> ValueType:
         return ValueType.from_str(self._attr_extra_state_attributes.get("granularity", "QUARTER_HOUR"))
 
-    async def async_update(self):
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self._handle_coordinator_update()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
         """
-        update sensor
+        update sensor from the last cycle of the coordinator
         """
-        try:
-            smartmeter = Smartmeter(username=self.username, password=self.password)
-            async_smartmeter = AsyncSmartmeter(self.hass, smartmeter)
-            await async_smartmeter.login()
-            zaehlpunkt_response = await async_smartmeter.get_zaehlpunkt(self.zaehlpunkt)
-            self._attr_extra_state_attributes = zaehlpunkt_response
-
-            if async_smartmeter.is_active(zaehlpunkt_response):
-                # Since the update is not exactly at midnight, both yesterday and the day before are tried to make sure a meter reading is returned
-                reading_dates = [before(today(), 1), before(today(), 2)]
-                for reading_date in reading_dates:
-                    meter_reading = await async_smartmeter.get_meter_reading_from_historic_data(self.zaehlpunkt, reading_date, datetime.now())
-                    self._attr_native_value = meter_reading
-                importer = Importer(self.hass, async_smartmeter, self.zaehlpunkt, self.unit_of_measurement, self.granularity())
-                await importer.async_import()
-            self._available = True
-            self._updatets = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
-        except TimeoutError as e:
-            self._available = False
-            _LOGGER.warning(
-                "Error retrieving data from smart meter api - Timeout: %s" % e)
-        except RuntimeError as e:
-            self._available = False
-            _LOGGER.exception(
-                "Error retrieving data from smart meter api - Error: %s" % e)
+        meter = (self.coordinator.data or {}).get(self.zaehlpunkt)
+        if meter is not None:
+            self._attr_extra_state_attributes = meter.attributes
+            backfill = async_get_backfills(self.hass).get(self.zaehlpunkt)
+            if backfill is not None and backfill.active:
+                self._attr_extra_state_attributes = {**meter.attributes, "backfill": backfill.progress()}
+            self._attr_native_value = meter.meter_reading
+            self._available = meter.available
+            if meter.updated is not None:
+                self._updatets = meter.updated
+        super()._handle_coordinator_update()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the hourly aggregation of three years of quarter hour values:
+the Decimal per value loop of the importer before against the integer and the NumPy path of the kernel.
+
+    python tests/benchmarks/bench_aggregation.py
+"""
+import os
+import random
+import sys
+import timeit
+from collections import defaultdict
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "custom_components"))
+
+from wnsm.aggregation import UNIT_SCALE, aggregate_hourly, np, to_decimal  # noqa: E402
+from wnsm.api.series import SeriesBuilder  # noqa: E402
+
+COUNT = 4 * 24 * 365 * 3
+START = 1640995200  # 2022-01-01T00:00:00Z
+
+
+def _series():
+    rng = random.Random(42)
+    builder = SeriesBuilder()
+    for i in range(COUNT):
+        epoch = START + i * 900
+        builder.append_raw(epoch, epoch + 900, rng.randrange(0, 2000))
+    return builder.build()
+
+
+SERIES = _series()
+
+
+def decimal_loop():
+    dates = defaultdict(Decimal)
+    last_epoch = START
+    for epoch, value, estimated in SERIES.raw():
+        if epoch < last_epoch:
+            continue
+        last_epoch = epoch
+        if value is None:
+            continue
+        reading = Decimal(value * 1e-3)
+        if epoch % 900 != 0:
+            pass
+        dates[epoch - (epoch % 3600 - epoch % 60)] += reading
+    total = Decimal(0)
+    for epoch, usage in sorted(dates.items()):
+        total += usage
+    return total
+
+
+def integer_path():
+    return aggregate_hourly(SERIES, UNIT_SCALE["WH"], START, use_numpy=False)
+
+
+def numpy_path():
+    return aggregate_hourly(SERIES, UNIT_SCALE["WH"], START, use_numpy=True)
+
+
+def main():
+    assert np is None or integer_path() == numpy_path()
+    print(f"total: {to_decimal(integer_path().total)} kWh")
+    names = ("decimal_loop", "integer_path") + (("numpy_path",) if np is not None else ())
+    results = {}
+    for name in names:
+        seconds = min(timeit.repeat(globals()[name], number=1, repeat=5))
+        results[name] = seconds
+        print(f"{name:>14}: {seconds * 1000:8.1f} ms ({seconds / COUNT * 1e9:6.0f} ns/value)")
+    for name in names[1:]:
+        print(f"{'speedup ' + name.split('_')[0]:>14}: {results['decimal_loop'] / results[name]:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark suite of the hot paths from logging in to importing statistics, on synthetic bewegungsdaten
+of one day, one month, one year and three years of quarter hour values (see pytest.ini for how to run it
+and how to compare against a saved baseline).
+"""
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from it import smartmeter  # noqa: E402
+from standin import StandInConfig, StandInServer, quarter_hour_wh  # noqa: E402
+from wnsm.aggregation import UNIT_SCALE, aggregate_hourly, np  # noqa: E402
+from wnsm.api.series import MeasurementSeries  # noqa: E402
+from wnsm.api.streaming import STREAM_CHUNK_SIZE, JsonArrayStream  # noqa: E402
+from wnsm.api.timestamps import TimestampDecoder  # noqa: E402
+from wnsm.importer import statistics_batches  # noqa: E402
+from wnsm.utils import AttributeExtractor  # noqa: E402
+
+ZAEHLPUNKT = "AT0010000000000000001000000000001"
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+QUARTER_HOUR = 15 * 60
+
+#: number of quarter hour values per dataset
+DATASETS = {
+    "day": 96,
+    "month": 96 * 31,
+    "year": 96 * 365,
+    "three_years": 96 * 365 * 3,
+}
+
+#: the per value mapping of the bewegungsdaten rows
+ATTRS_VALUE = [
+    ("zeitpunktVon", "start"),
+    ("zeitpunktBis", "end"),
+    ("wert", "value"),
+    ("geschaetzt", "estimated"),
+]
+
+
+def _timestamp(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _bewegungsdaten(count: int) -> bytes:
+    """
+    a bewegungsdaten response body of `count` quarter hour values starting at START, as sent by the stand-in
+    """
+    start = int(START.timestamp())
+    values = []
+    for epoch in range(start, start + count * QUARTER_HOUR, QUARTER_HOUR):
+        values.append({
+            "wert": quarter_hour_wh(ZAEHLPUNKT, epoch) / 1000,
+            "zeitpunktVon": _timestamp(epoch),
+            "zeitpunktBis": _timestamp(epoch + QUARTER_HOUR),
+            "geschaetzt": epoch % 7919 == 0,
+        })
+    return json.dumps({
+        "descriptor": {
+            "geschaeftspartnernummer": "1234567890",
+            "zaehlpunktnummer": ZAEHLPUNKT,
+            "rolle": "V002",
+            "aggregat": "NONE",
+            "granularitaet": "QH",
+            "einheit": "KWH",
+        },
+        "values": values,
+    }).encode()
+
+
+class Dataset:
+    """The response body of a dataset and its decoded stages, built once per session"""
+
+    def __init__(self, name: str, count: int):
+        self.name = name
+        self.count = count
+        self.body = _bewegungsdaten(count)
+        self.values = json.loads(self.body)["values"]
+        self.timestamps = [value["zeitpunktVon"] for value in self.values]
+        self.series = MeasurementSeries.from_values(self.values)
+        self.hourly = aggregate_hourly(self.series, UNIT_SCALE["KWH"], START.timestamp())
+
+
+_DATASETS: dict[str, Dataset] = {}
+
+
+@pytest.fixture(scope="session", params=list(DATASETS))
+def dataset(request) -> Dataset:
+    if request.param not in _DATASETS:
+        _DATASETS[request.param] = Dataset(request.param, DATASETS[request.param])
+    return _DATASETS[request.param]
+
+
+@pytest.fixture(scope="module")
+def stand_in():
+    with StandInServer(StandInConfig()) as server, server.patch_constants():
+        yield server
+
+
+# login
+
+
+@pytest.mark.benchmark(group="login")
+def test_login(benchmark, stand_in):
+    benchmark(lambda: smartmeter().login())
+
+
+@pytest.mark.benchmark(group="login")
+def test_login_refresh(benchmark, stand_in):
+    stand_in.config.access_token_lifetime = 30  # within the refresh margin, every login refreshes
+    client = smartmeter().login()
+    try:
+        benchmark(client.login)
+    finally:
+        stand_in.config.access_token_lifetime = StandInConfig.access_token_lifetime
+
+
+# decoding
+
+
+@pytest.mark.benchmark(group="decode")
+def test_decode_json(benchmark, dataset):
+    result = benchmark(json.loads, dataset.body)
+    assert len(result["values"]) == dataset.count
+
+
+@pytest.mark.benchmark(group="decode")
+def test_decode_stream(benchmark, dataset):
+    def stream():
+        parser = JsonArrayStream("values")
+        count = 0
+        for offset in range(0, len(dataset.body), STREAM_CHUNK_SIZE):
+            count += len(parser.feed(dataset.body[offset:offset + STREAM_CHUNK_SIZE]))
+        parser.close()
+        return count
+    assert benchmark(stream) == dataset.count
+
+
+@pytest.mark.benchmark(group="decode")
+def test_decode_series(benchmark, dataset):
+    series = benchmark(MeasurementSeries.from_values, dataset.values)
+    assert len(series) == dataset.count
+
+
+@pytest.mark.benchmark(group="translate_dict")
+def test_translate_dict(benchmark, dataset):
+    extract = AttributeExtractor(ATTRS_VALUE)
+    rows = benchmark(lambda: [extract(value) for value in dataset.values])
+    assert len(rows) == dataset.count
+
+
+@pytest.mark.benchmark(group="timestamps")
+def test_timestamps(benchmark, dataset):
+    def decode():
+        decoder = TimestampDecoder()
+        return [decoder.decode(value) for value in dataset.timestamps]
+    epochs = benchmark(decode)
+    assert epochs[-1] - epochs[0] == (dataset.count - 1) * QUARTER_HOUR
+
+
+# importing
+
+
+@pytest.mark.benchmark(group="aggregation")
+def test_aggregate_python(benchmark, dataset):
+    hourly = benchmark(aggregate_hourly, dataset.series, UNIT_SCALE["KWH"], START.timestamp(), use_numpy=False)
+    assert hourly == dataset.hourly
+
+
+@pytest.mark.skipif(np is None, reason="numpy is not installed")
+@pytest.mark.benchmark(group="aggregation")
+def test_aggregate_numpy(benchmark, dataset):
+    hourly = benchmark(aggregate_hourly, dataset.series, UNIT_SCALE["KWH"], START.timestamp(), use_numpy=True)
+    assert hourly.total == dataset.hourly.total
+
+
+@pytest.mark.benchmark(group="statistics")
+def test_statistics(benchmark, dataset):
+    def prepare():
+        return sum(len(batch) for batch in statistics_batches(dataset.hourly, Decimal(0)))
+    assert benchmark(prepare) == dataset.count // 4
+    assert dataset.hourly.hours[-1] - dataset.hourly.hours[0] == timedelta(hours=dataset.count // 4 - 1).total_seconds()
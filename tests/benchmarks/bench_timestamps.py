@@ -0,0 +1,62 @@
+"""
+Benchmark of decoding the timestamps of three years of quarter hour values:
+per row parsing as done by the importer before (dt_util.parse_datetime, last_ts and alignment checks)
+and the full parser (datetime.fromisoformat) against the TimestampDecoder.
+
+    python tests/benchmarks/bench_timestamps.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "custom_components"))
+
+from homeassistant.util import dt as dt_util  # noqa: E402
+
+from wnsm.api.timestamps import TimestampDecoder, parse_epoch  # noqa: E402
+
+COUNT = 4 * 24 * 365 * 3
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+TIMESTAMPS = [(START + timedelta(minutes=15 * i)).strftime("%Y-%m-%dT%H:%M:%S.000Z") for i in range(COUNT)]
+
+
+def per_row_parsing():
+    last_ts = START
+    for value in TIMESTAMPS:
+        ts = dt_util.parse_datetime(value)
+        if ts < last_ts:
+            continue
+        last_ts = ts
+        if ts.minute % 15 != 0 or ts.second != 0 or ts.microsecond != 0:
+            pass
+
+
+def full_parser():
+    for value in TIMESTAMPS:
+        parse_epoch(value)
+
+
+def decoder():
+    decode = TimestampDecoder().decode
+    last_epoch = START.timestamp()
+    for value in TIMESTAMPS:
+        epoch = decode(value)
+        if epoch < last_epoch:
+            continue
+        last_epoch = epoch
+        if epoch % 900 != 0:
+            pass
+
+
+def main():
+    results = {}
+    for name in ("per_row_parsing", "full_parser", "decoder"):
+        seconds = min(timeit.repeat(globals()[name], number=1, repeat=5))
+        results[name] = seconds
+        print(f"{name:>16}: {seconds * 1000:8.1f} ms ({seconds / COUNT * 1e9:6.0f} ns/value)")
+    print(f"{'speedup':>16}: {results['per_row_parsing'] / results['decoder']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
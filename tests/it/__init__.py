@@ -3,6 +3,7 @@ import json
 import os
 import random
 import sys
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from importlib.resources import files
 from urllib import parse
@@ -10,6 +11,7 @@ from urllib.parse import urlencode
 
 import pytest
 import requests
+from homeassistant.core import HomeAssistant
 from requests_mock import Mocker
 
 from test_resources import post_data_matcher
@@ -363,8 +365,11 @@ def bewegungsdaten_response(customer_id: str, zp: str,
     }
 
 
-def smartmeter(username=USERNAME, password=PASSWORD, code_verifier=CODE_VERIFIER):
-    return api.client.Smartmeter(username=username, password=password, input_code_verifier=code_verifier)
+def smartmeter(username=USERNAME, password=PASSWORD, code_verifier=CODE_VERIFIER, request_policy=None):
+    # no retry delays and an own rate limiter, so tests do not throttle each other
+    return api.client.Smartmeter(username=username, password=password, input_code_verifier=code_verifier,
+                                 request_policy=request_policy or api.RequestPolicy(backoff=0),
+                                 rate_limiter=api.RateLimiter(rate=1000))
 
 
 @pytest.mark.usefixtures("requests_mock")
@@ -453,6 +458,31 @@ def mock_token(requests_mock: Mocker, code=RESPONSE_CODE, access_token=ACCESS_TO
         }), json={}, status_code=status)
 
 
+@pytest.mark.usefixtures("requests_mock")
+def mock_refresh_token(requests_mock: Mocker, refresh_token=REFRESH_TOKEN, access_token=ACCESS_TOKEN,
+                       new_refresh_token=REFRESH_TOKEN, status: int = 200, expires: int = 300):
+    """
+    mock POST /token using the refresh_token grant
+    """
+    matcher = post_data_matcher({
+        "grant_type": "refresh_token",
+        "client_id": "wn-smartmeter",
+        "refresh_token": refresh_token,
+    })
+    if status == 200:
+        requests_mock.post(f'{AUTH_URL}/token', additional_matcher=matcher, json={
+            "access_token": access_token,
+            "expires_in": expires,
+            "refresh_expires_in": 6 * expires,
+            "refresh_token": new_refresh_token,
+            "token_type": "Bearer",
+            "id_token": ID_TOKEN,
+        })
+    else:
+        requests_mock.post(f'{AUTH_URL}/token', additional_matcher=matcher,
+                           json={"error": "invalid_grant"}, status_code=status)
+
+
 @pytest.mark.usefixtures("requests_mock")
 def mock_authenticate(requests_mock: Mocker, username, password, code=RESPONSE_CODE, status: int | None = 302):
     """
@@ -600,3 +630,58 @@ def expect_bewegungsdaten(requests_mock: Mocker, customer_id: str, zp: str, date
                           "Accept": "application/json"
                       },
                       json=bewegungsdaten_response(customer_id, zp, granularity, anlagetype, wrong_zp, values_count))
+
+
+def async_smartmeter(username=USERNAME, password=PASSWORD, code_verifier=CODE_VERIFIER, request_policy=None):
+    return api.AsyncSmartmeterClient(username=username, password=password, input_code_verifier=code_verifier,
+                                     request_policy=request_policy or api.RequestPolicy(backoff=0),
+                                     rate_limiter=api.RateLimiter(rate=1000))
+
+
+def expect_async_login(aioresponses_mock, code=RESPONSE_CODE, expires: int = 300, status: int = 302):
+    """
+    mock the whole login flow (login page, credentials, token and app-config.json) for the aiohttp client
+    """
+    auth_html = files('test_resources').joinpath('auth.html').read_text()
+    aioresponses_mock.get(AUTH_URL + "/auth?" + parse.urlencode(LOGIN_ARGS), body=auth_html)
+    authenticate_query_params = {
+        "session_code": "SESSION_CODE_PLACEHOLDER",
+        "execution": "5939ddcc-efd4-407c-b01c-df8977d522b5",
+        "client_id": "wn-smartmeter",
+        "tab_id": "6tDgFA2FxbU"
+    }
+    authenticate_url = f'https://log.wien/auth/realms/logwien/login-actions/authenticate?{parse.urlencode(authenticate_query_params)}'
+    aioresponses_mock.post(authenticate_url, body=auth_html)
+    redirect_url = f'{REDIRECT_URI}/#state=cb142d1b-d8b4-4bf3-8a3e-92544790c5c4' \
+                   '&session_state=949e0f0d-b447-4208-bfef-273d694dc633' \
+                   f'&code={code}'
+    if status != 302:
+        aioresponses_mock.post(authenticate_url, status=status)
+        return
+    aioresponses_mock.post(authenticate_url, status=302, headers={'Location': redirect_url})
+    aioresponses_mock.post(f'{AUTH_URL}/token', payload={
+        "access_token": ACCESS_TOKEN,
+        "expires_in": expires,
+        "refresh_expires_in": 6 * expires,
+        "refresh_token": REFRESH_TOKEN,
+        "token_type": "Bearer",
+        "id_token": ID_TOKEN,
+    })
+    aioresponses_mock.get(API_CONFIG_URL, body=files('test_resources').joinpath('app-config.json').read_text())
+
+
+def expect_async_zaehlpunkte(aioresponses_mock, zps: list[dict], repeat: bool = False):
+    aioresponses_mock.get(parse.urljoin(API_URL_B2C, 'zaehlpunkte'), payload=zaehlpunkt_response(zps), repeat=repeat)
+
+
+@asynccontextmanager
+async def async_hass(config_dir):
+    """
+    a bare Home Assistant instance (no integrations set up) keeping its .storage in the given directory,
+    pending (delayed) writes are flushed when it is stopped
+    """
+    hass = HomeAssistant(str(config_dir))
+    try:
+        yield hass
+    finally:
+        await hass.async_stop(force=True)
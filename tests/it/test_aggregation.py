@@ -0,0 +1,129 @@
+"""Hourly aggregation tests"""
+import random
+from decimal import Decimal
+
+import pytest
+
+from wnsm.aggregation import SCALE, UNIT_SCALE, _hour, aggregate_hourly, np, to_decimal, to_float
+from wnsm.api.series import SeriesBuilder
+
+START = 1672531200  # 2023-01-01T00:00:00Z
+
+PATHS = [False] + ([True] if np is not None else [])
+
+
+def _series(values, start=START, cadence=900, typecode="q"):
+    builder = SeriesBuilder(typecode=typecode)
+    for i, value in enumerate(values):
+        epoch = start + i * cadence
+        builder.append_raw(epoch, epoch + cadence, value, estimated=i % 7 == 0)
+    return builder.build()
+
+
+#: conversion factors of the importer before the fixed point aggregation
+FACTOR = {UNIT_SCALE["KWH"]: 1.0, UNIT_SCALE["WH"]: 1e-3}
+
+#: every value is quantized to 1 mWh
+HALF_UNIT = Decimal(1) / SCALE / 2
+
+
+def _original_hourly(series, multiplier, since):
+    """
+    the computation of the importer before the fixed point aggregation: sums Decimal(wert * factor) per hour
+    """
+    hours = {}
+    last = since
+    for epoch, value, _ in series.raw():
+        if epoch < last:
+            continue
+        last = epoch
+        if value is None:
+            continue
+        hour = _hour(epoch)
+        hours[hour] = hours.get(hour, Decimal(0)) + Decimal(value * FACTOR[multiplier])
+    return dict(sorted(hours.items()))
+
+
+def _assert_matches_original(series, multiplier, since=START, exact_to_units=True):
+    """
+    both paths deviate from the original sums by the quantization of every value only,
+    for values of the resolution of the api (at most Wh) they are the original sums rounded to 1 mWh
+    """
+    original = _original_hourly(series, multiplier, since)
+    counts = {}
+    last = since
+    for epoch, value, _ in series.raw():
+        if epoch >= last:
+            last = epoch
+            if value is not None:
+                counts[_hour(epoch)] = counts.get(_hour(epoch), 0) + 1
+    unit = Decimal(1) / SCALE
+    for use_numpy in PATHS:
+        hourly = aggregate_hourly(series, multiplier, since, use_numpy=use_numpy)
+        assert hourly.hours == list(original)
+        assert all(isinstance(cumulated, int) for cumulated in hourly.sums)
+        total = Decimal(0)
+        for hour, usage, cumulated in zip(hourly.hours, hourly.usage, hourly.sums):
+            total += original[hour]
+            assert abs(to_decimal(usage) - original[hour]) <= counts[hour] * HALF_UNIT
+            if exact_to_units:
+                assert to_decimal(usage) == original[hour].quantize(unit)
+                assert to_decimal(cumulated) == total.quantize(unit)
+
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_sums_quarter_hours_per_hour(use_numpy):
+    series = _series([1, 2, 3, 4, 5, 6, 7, 8, None, 10])
+    hourly = aggregate_hourly(series, UNIT_SCALE["WH"], START, use_numpy=use_numpy)
+    assert hourly.hours == [START, START + 3600, START + 7200]
+    assert hourly.usage == [10_000, 26_000, 10_000]
+    assert hourly.sums == [10_000, 36_000, 46_000]
+    assert to_decimal(hourly.total) == Decimal("0.046")
+    assert to_float(hourly.usage[1]) == 0.026
+    assert hourly.skipped == 0
+    assert hourly.misaligned == 0
+    # every 7th value is estimated, 0 and 7 are not missing
+    assert hourly.estimated == 2
+
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_drops_values_before_since_and_out_of_order(use_numpy):
+    builder = SeriesBuilder(typecode="d")
+    for epoch, value in [(START - 900, 1.0), (START, 0.25), (START + 900, 0.5), (START + 450, 8.0),
+                         (START + 1800, 0.125), (START + 1800, 0.125), (START + 3960, 1.5)]:
+        builder.append_raw(epoch, epoch + 900, value)
+    hourly = aggregate_hourly(builder.build(), UNIT_SCALE["KWH"], START, use_numpy=use_numpy)
+    assert hourly.hours == [START, START + 3600]
+    assert hourly.usage == [1_000_000, 1_500_000]
+    assert hourly.skipped == 2
+    assert hourly.misaligned == 1
+
+
+@pytest.mark.parametrize("use_numpy", PATHS)
+def test_empty_series(use_numpy):
+    hourly = aggregate_hourly(_series([]), SCALE, START, use_numpy=use_numpy)
+    assert hourly.hours == hourly.usage == hourly.sums == []
+    assert hourly.total == 0
+
+
+def test_integral_values_match_the_original_sums():
+    rng = random.Random(7)
+    values = [None if rng.random() < 0.01 else rng.randrange(0, 5000) for _ in range(4 * 24 * 60)]
+    _assert_matches_original(_series(values), UNIT_SCALE["WH"])
+
+
+def test_fractional_values_match_the_original_sums():
+    rng = random.Random(11)
+    values = [None if rng.random() < 0.01 else round(rng.random() * 2, 3) for _ in range(4 * 24 * 60)]
+    series = _series(values, typecode="d")
+    assert series.values.typecode == "d"
+    _assert_matches_original(series, UNIT_SCALE["KWH"])
+    _assert_matches_original(series, UNIT_SCALE["WH"], since=START + 86400)
+
+
+def test_fractional_values_round_half_to_even():
+    # 0.0000005 kWh is half a unit, both paths round like round(), below the resolution of the api
+    series = _series([0.0000005, 0.0000015, 0.0000025, 1e-7], typecode="d")
+    for use_numpy in PATHS:
+        assert aggregate_hourly(series, UNIT_SCALE["KWH"], START, use_numpy=use_numpy).usage == [4]
+    _assert_matches_original(series, UNIT_SCALE["KWH"], exact_to_units=False)
@@ -1,9 +1,12 @@
 """API tests"""
+import json
 import pytest
+import requests
 import time
 import logging
 from requests_mock import Mocker
 import datetime as dt
+from urllib import parse
 from dateutil.relativedelta import relativedelta
 
 from it import (
@@ -21,10 +24,14 @@ from it import (
     PASSWORD,
     USERNAME,
     mock_token,
+    mock_refresh_token,
     mock_get_api_key,
+    CODE_VERIFIER,
+    API_URL_B2C,
     expect_history, expect_bewegungsdaten, zaehlpunkt_response,
 )
 from wnsm.api.errors import SmartmeterConnectionError, SmartmeterLoginError, SmartmeterQueryError
+from wnsm.api.policy import RateLimiter, RequestPolicy, TokenBucket, parse_retry_after
 import wnsm.api.constants as const
 
 COUNT = 10
@@ -175,6 +182,115 @@ def test_access_key_expired(requests_mock):
     assert 'Access Token is not valid anymore' in str(exc_info.value)
 
 
+def _count(requests_mock: Mocker, method: str, url_part: str, body_part: str = None) -> int:
+    return len([
+        r for r in requests_mock.request_history
+        if r.method == method and url_part in r.url and (body_part is None or body_part in (r.text or ""))
+    ])
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_login_refreshes_expiring_access_token(requests_mock: Mocker):
+    mock_login_page(requests_mock)
+    mock_authenticate(requests_mock, USERNAME, PASSWORD)
+    # expires within ACCESS_TOKEN_REFRESH_MARGIN
+    mock_token(requests_mock, expires=30)
+    mock_refresh_token(requests_mock, access_token="refreshed", new_refresh_token="rotated")
+    mock_get_api_key(requests_mock)
+
+    sm = smartmeter().login()
+    sm.login()
+
+    assert sm._access_token == "refreshed"
+    assert sm._refresh_token == "rotated"
+    assert 1 == _count(requests_mock, "GET", "/auth?")
+    assert 1 == _count(requests_mock, "POST", "/token", "grant_type=refresh_token")
+    assert 1 == _count(requests_mock, "GET", "app-config.json")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_login_does_not_refresh_valid_access_token(requests_mock: Mocker):
+    expect_login(requests_mock)
+
+    sm = smartmeter().login()
+    sm.login()
+
+    assert 1 == _count(requests_mock, "POST", "/token")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_login_with_credentials_after_refresh_token_expired(requests_mock: Mocker):
+    expect_login(requests_mock)
+
+    sm = smartmeter().login()
+    sm._access_token_expiration = sm._refresh_token_expiration = dt.datetime.now() - dt.timedelta(seconds=1)
+    sm.generate_code_verifier = lambda: CODE_VERIFIER
+    sm.login()
+
+    assert sm.is_logged_in()
+    assert 2 == _count(requests_mock, "GET", "/auth?")
+    assert 0 == _count(requests_mock, "POST", "/token", "grant_type=refresh_token")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_login_with_credentials_if_refresh_token_rejected(requests_mock: Mocker):
+    mock_login_page(requests_mock)
+    mock_authenticate(requests_mock, USERNAME, PASSWORD)
+    mock_token(requests_mock, expires=30)
+    mock_refresh_token(requests_mock, status=400)
+    mock_get_api_key(requests_mock)
+
+    sm = smartmeter().login()
+    sm.generate_code_verifier = lambda: CODE_VERIFIER
+    sm.login()
+
+    assert 2 == _count(requests_mock, "GET", "/auth?")
+    assert 1 == _count(requests_mock, "POST", "/token", "grant_type=refresh_token")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_call_api_refreshes_expiring_access_token(requests_mock: Mocker):
+    mock_login_page(requests_mock)
+    mock_authenticate(requests_mock, USERNAME, PASSWORD)
+    mock_token(requests_mock, expires=30)
+    mock_refresh_token(requests_mock)
+    mock_get_api_key(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+
+    smartmeter().login().zaehlpunkte()
+
+    assert 1 == _count(requests_mock, "POST", "/token", "grant_type=refresh_token")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_restored_auth_state_does_not_authenticate(requests_mock: Mocker):
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+    state = json.loads(json.dumps(smartmeter().login().export_auth_state()))
+    requests_mock.reset_mock()
+
+    sm = smartmeter(code_verifier=None)
+    assert sm.restore_auth_state(state)
+    zps = sm.login().zaehlpunkte()
+
+    assert 1 == len(zps[0]['zaehlpunkte'])
+    assert sm._code_verifier == CODE_VERIFIER
+    assert [r.url for r in requests_mock.request_history] == [parse.urljoin(API_URL_B2C, 'zaehlpunkte')]
+
+
+def test_restore_auth_state_rejects_expired_or_foreign_state():
+    sm = smartmeter()
+    sm._access_token, sm._refresh_token = "access", "refresh"
+    sm._access_token_expiration = sm._refresh_token_expiration = dt.datetime.now() - dt.timedelta(seconds=1)
+    state = sm.export_auth_state()
+
+    assert not smartmeter().restore_auth_state(state)
+    assert not smartmeter(username="someone.else@example.com").restore_auth_state(
+        {**state, "refresh_token_expiration": (dt.datetime.now() + dt.timedelta(hours=1)).timestamp()}
+    )
+    assert not smartmeter().restore_auth_state(None)
+
+
 @pytest.mark.usefixtures("requests_mock")
 def test_zaehlpunkte(requests_mock: Mocker):
     expect_login(requests_mock)
@@ -186,6 +302,51 @@ def test_zaehlpunkte(requests_mock: Mocker):
     assert not zps[0]['zaehlpunkte'][1]['isActive']
 
 
+@pytest.mark.usefixtures("requests_mock")
+def test_zaehlpunkte_are_cached(requests_mock: Mocker):
+    z = zaehlpunkt_response([enabled(zaehlpunkt()), enabled(zaehlpunkt_feeding())])[0]
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt()), enabled(zaehlpunkt_feeding())])
+    expect_history(requests_mock, z["geschaeftspartner"], z["zaehlpunkte"][0]['zaehlpunktnummer'])
+
+    sm = smartmeter().login()
+    sm.historical_data()
+    sm.historical_data(z["zaehlpunkte"][0]['zaehlpunktnummer'])
+    customer_id, zp, anlagetype = sm.get_zaehlpunkt(z["zaehlpunkte"][1]['zaehlpunktnummer'])
+
+    assert (customer_id, zp, anlagetype) == (z["geschaeftspartner"], z["zaehlpunkte"][1]['zaehlpunktnummer'],
+                                             const.AnlagenType.FEEDING)
+    assert 1 == _count(requests_mock, "GET", "_B2C/zaehlpunkte")
+
+    sm.invalidate_zaehlpunkte()
+    sm.get_zaehlpunkt()
+    assert 2 == _count(requests_mock, "GET", "_B2C/zaehlpunkte")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_zaehlpunkte_cache_expires(requests_mock: Mocker):
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+
+    sm = smartmeter()
+    sm.zaehlpunkte_ttl = 0
+    sm.login()
+    sm.get_zaehlpunkt()
+    sm.get_zaehlpunkt()
+
+    assert 2 == _count(requests_mock, "GET", "_B2C/zaehlpunkte")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_unknown_zaehlpunkt(requests_mock: Mocker):
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+
+    with pytest.raises(SmartmeterQueryError) as exc_info:
+        smartmeter().login().get_zaehlpunkt("AT0000000000000000000000000000000")
+    assert 'Zaehlpunkt AT0000000000000000000000000000000 not found!' == str(exc_info.value)
+
+
 @pytest.mark.usefixtures("requests_mock")
 def test_history(requests_mock: Mocker):
     z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
@@ -435,3 +596,85 @@ def test_verbrauch_raw(requests_mock: Mocker):
     verbrauch = smartmeter().login().verbrauch(customer_id, zp, dateFrom)
 
     assert 7 == len(verbrauch['values'])
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_call_api_retries_server_errors(requests_mock: Mocker):
+    expect_login(requests_mock)
+    requests_mock.get(parse.urljoin(API_URL_B2C, 'zaehlpunkte'), [
+        {"status_code": 503, "json": {}},
+        {"status_code": 429, "json": {}, "headers": {"Retry-After": "0"}},
+        {"status_code": 200, "json": zaehlpunkt_response([enabled(zaehlpunkt())])},
+    ])
+    zps = smartmeter().login().zaehlpunkte()
+    assert 1 == len(zps[0]['zaehlpunkte'])
+    assert 3 == _count(requests_mock, "GET", "_B2C/zaehlpunkte")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_call_api_gives_up_after_retries(requests_mock: Mocker):
+    expect_login(requests_mock)
+    requests_mock.get(parse.urljoin(API_URL_B2C, 'zaehlpunkte'), status_code=503, json={"error": "unavailable"})
+    sm = smartmeter(request_policy=RequestPolicy(retries=2, backoff=0)).login()
+    response = sm._call_api("zaehlpunkte", return_response=True)
+    assert 503 == response.status_code
+    assert 3 == _count(requests_mock, "GET", "_B2C/zaehlpunkte")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_call_api_does_not_repeat_failed_post(requests_mock: Mocker):
+    expect_login(requests_mock)
+    requests_mock.post(parse.urljoin(API_URL_B2C, 'user/ereignis'), status_code=500, json={})
+    smartmeter().login()._call_api("user/ereignis", data={}, method="POST")
+    assert 1 == _count(requests_mock, "POST", "user/ereignis")
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_call_api_retries_connection_errors(requests_mock: Mocker):
+    expect_login(requests_mock)
+    requests_mock.get(parse.urljoin(API_URL_B2C, 'zaehlpunkte'), [
+        {"exc": requests.exceptions.ConnectionError},
+        {"status_code": 200, "json": zaehlpunkt_response([enabled(zaehlpunkt())])},
+    ])
+    assert 1 == len(smartmeter().login().zaehlpunkte())
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_call_api_raises_connection_error_after_retries(requests_mock: Mocker):
+    expect_login(requests_mock)
+    requests_mock.get(parse.urljoin(API_URL_B2C, 'zaehlpunkte'), exc=requests.exceptions.ConnectionError)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        smartmeter(request_policy=RequestPolicy(retries=1, backoff=0)).login().zaehlpunkte()
+    assert 2 == _count(requests_mock, "GET", "_B2C/zaehlpunkte")
+
+
+def test_request_policy_delay():
+    policy = RequestPolicy(backoff=1.0, max_backoff=5.0, jitter=False)
+    assert [policy.delay(attempt) for attempt in range(4)] == [1.0, 2.0, 4.0, 5.0]
+    assert 3.0 == policy.delay(0, retry_after=3.0)
+    assert 5.0 == policy.delay(0, retry_after=120.0)
+    assert 0 <= RequestPolicy(backoff=1.0).delay(2) <= 4.0
+
+
+def test_parse_retry_after():
+    now = dt.datetime(2024, 1, 1, 12, 0, 0, tzinfo=dt.timezone.utc)
+    assert 120.0 == parse_retry_after("120")
+    assert 30.0 == parse_retry_after("Mon, 01 Jan 2024 12:00:30 GMT", now)
+    assert 0.0 == parse_retry_after("Mon, 01 Jan 2024 11:00:00 GMT", now)
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    assert 0.0 == bucket.reserve()
+    assert 0.0 == bucket.reserve()
+    assert 0.9 < bucket.reserve() <= 1.0
+    assert 1.9 < bucket.reserve() <= 2.0
+
+
+def test_rate_limiter_per_api():
+    limiter = RateLimiter(rate=1.0, capacity=1)
+    assert 0.0 == limiter.reserve(const.API_URL)
+    assert 0.0 == limiter.reserve(const.API_URL_B2B)
+    assert limiter.reserve(const.API_URL) > 0
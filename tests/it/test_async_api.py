@@ -0,0 +1,197 @@
+"""Async API tests"""
+import asyncio
+import datetime as dt
+import re
+
+import pytest
+from aioresponses import aioresponses
+from urllib import parse
+
+from it import (
+    API_URL_ALT,
+    API_URL_B2B,
+    AUTH_URL,
+    async_smartmeter,
+    bewegungsdaten,
+    bewegungsdaten_response,
+    enabled,
+    expect_async_login,
+    expect_async_zaehlpunkte,
+    history_response,
+    zaehlpunkt,
+    zaehlpunkt_feeding,
+    zaehlpunkt_response,
+)
+from wnsm.api.errors import SmartmeterConnectionError, SmartmeterLoginError, SmartmeterQueryError
+import wnsm.api.constants as const
+
+
+async def _login_and(call):
+    sm = async_smartmeter()
+    try:
+        await sm.login()
+        return await call(sm)
+    finally:
+        await sm.close()
+
+
+def test_async_successful_login():
+    with aioresponses() as m:
+        expect_async_login(m)
+        sm = asyncio.run(_login_and(lambda s: asyncio.sleep(0, result=s)))
+    assert sm.is_logged_in()
+    assert sm._api_gateway_token == "afb0be74-6455-44f5-a34d-6994223020ba"
+    assert sm._api_gateway_b2b_token == "93d5d520-7cc8-11eb-99bc-ba811041b5f6"
+
+
+def test_async_login_failing_on_login_page_load():
+    with aioresponses() as m:
+        m.get(AUTH_URL + "/auth", status=404, body="")
+        with pytest.raises(SmartmeterConnectionError):
+            asyncio.run(_login_and(lambda s: asyncio.sleep(0)))
+
+
+def test_async_login_without_location_header():
+    with aioresponses() as m:
+        expect_async_login(m, status=403)
+        with pytest.raises(SmartmeterLoginError) as exc_info:
+            asyncio.run(_login_and(lambda s: asyncio.sleep(0)))
+    assert 'Login failed. Check username/password.' in str(exc_info.value)
+
+
+def test_async_zaehlpunkte():
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        zps = asyncio.run(_login_and(lambda s: s.zaehlpunkte()))
+    assert 1 == len(zps[0]['zaehlpunkte'])
+
+
+def test_async_history():
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zp = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    customer_id = z["geschaeftspartner"]
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        m.get(re.compile(re.escape(parse.urljoin(API_URL_B2B, f'zaehlpunkte/{customer_id}/{zp}/messwerte')) + r'\?.*'),
+              payload=history_response(zp))
+        hist = asyncio.run(_login_and(lambda s: s.historical_data(zp)))
+    assert 1 == len(hist['messwerte'])
+    assert '1-1:1.8.0' == hist['obisCode']
+
+
+def test_async_bewegungsdaten_feeding():
+    z = zaehlpunkt_response([enabled(zaehlpunkt_feeding())])[0]
+    zp = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    customer_id = z["geschaeftspartner"]
+    date_from = dt.datetime(2023, 4, 21)
+    date_until = dt.datetime(2023, 5, 1)
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt_feeding())])
+        query = {
+            "geschaeftspartner": customer_id,
+            "zaehlpunktnummer": zp,
+            "rolle": const.RoleType.QUARTER_HOURLY_FEEDING.value,
+            "zeitpunktVon": "2023-04-21T00:00:00.000Z",
+            "zeitpunktBis": "2023-05-01T23:59:59.999Z",
+            "aggregat": "NONE",
+        }
+        m.get(parse.urljoin(API_URL_ALT, f'user/messwerte/bewegungsdaten?{parse.urlencode(query)}'),
+              payload=bewegungsdaten_response(customer_id, zp, anlagetype=const.AnlagenType.FEEDING))
+        hist = asyncio.run(_login_and(lambda s: s.bewegungsdaten(zp, date_from, date_until)))
+    assert 10 == len(hist['values'])
+
+
+def test_async_bewegungsdaten_wrong_zp():
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zp = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    customer_id = z["geschaeftspartner"]
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        m.get(re.compile(re.escape(parse.urljoin(API_URL_ALT, 'user/messwerte/bewegungsdaten')) + r'\?.*'),
+              payload=bewegungsdaten_response(customer_id, zp, wrong_zp=True))
+        with pytest.raises(SmartmeterQueryError) as exc_info:
+            asyncio.run(_login_and(lambda s: s.bewegungsdaten(zp, dt.date(2023, 4, 21), dt.date(2023, 5, 1))))
+    assert 'Returned data does not match given zaehlpunkt!' == str(exc_info.value)
+
+
+def test_async_login_refreshes_expiring_access_token():
+    async def login_twice(sm):
+        await sm.login()
+        return sm
+
+    with aioresponses() as m:
+        expect_async_login(m, expires=30)
+        m.post(f'{AUTH_URL}/token', payload={
+            "access_token": "refreshed",
+            "expires_in": 300,
+            "refresh_expires_in": 1800,
+            "refresh_token": "rotated",
+            "token_type": "Bearer",
+        })
+        sm = asyncio.run(_login_and(login_twice))
+        token_calls = [call for (method, url), calls in m.requests.items()
+                       if method == "POST" and str(url).endswith("/token") for call in calls]
+    assert sm._access_token == "refreshed"
+    assert sm._refresh_token == "rotated"
+    assert token_calls[-1].kwargs["data"]["grant_type"] == "refresh_token"
+
+
+def test_async_bewegungsdaten_range():
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zp = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    customer_id = z["geschaeftspartner"]
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        for day in (1, 3):
+            response = bewegungsdaten_response(customer_id, zp)
+            response["values"] = bewegungsdaten(count=48, timestamp=dt.datetime(2023, 1, day), interval="h")
+            m.get(re.compile(r'.*/user/messwerte/bewegungsdaten\?.*' + f'zeitpunktVon=2023-01-0{day}'),
+                  payload=response)
+        hist = asyncio.run(_login_and(lambda s: s.bewegungsdaten_range(
+            zp, dt.date(2023, 1, 1), dt.date(2023, 1, 4), window=dt.timedelta(days=2))))
+    assert 96 == len(hist['values'])
+    assert hist['descriptor']['zaehlpunktnummer'] == zp
+
+
+def test_async_call_api_retries_server_errors():
+    with aioresponses() as m:
+        expect_async_login(m)
+        url = re.compile(r'.*/WN_SMART_METER_PORTAL_API_B2C/zaehlpunkte$')
+        m.get(url, status=503, payload={})
+        m.get(url, status=429, payload={}, headers={"Retry-After": "0"})
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        zps = asyncio.run(_login_and(lambda s: s.zaehlpunkte()))
+    assert 1 == len(zps[0]['zaehlpunkte'])
+
+
+def test_async_client_has_no_requests_session():
+    sm = async_smartmeter()
+    assert sm.session is None
+    sm.reset()
+    assert sm.session is None
+
+
+@pytest.mark.parametrize("method", [
+    "consumptions", "base_information", "meter_readings", "profil", "create_ereignis", "delete_ereignis",
+])
+def test_async_endpoints_are_coroutines(method):
+    assert asyncio.iscoroutinefunction(getattr(type(async_smartmeter()), method))
+
+
+def test_async_profil_and_ereignis():
+    with aioresponses() as m:
+        expect_async_login(m)
+        m.get(parse.urljoin(API_URL_ALT, "user/profile"), payload={"defaultGeschaeftspartnerRegistration": {}})
+        m.post(re.compile(r".*/user/ereignis$"), payload={"id": 42})
+
+        async def calls(sm):
+            return await sm.profil(), await sm.create_ereignis("AT1", "Urlaub", dt.datetime(2023, 5, 1))
+
+        profil, ereignis = asyncio.run(_login_and(calls))
+    assert profil == {"defaultGeschaeftspartnerRegistration": {}}
+    assert ereignis == {"id": 42}
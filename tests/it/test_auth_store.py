@@ -0,0 +1,96 @@
+"""Tests of the persisted login state"""
+import asyncio
+from datetime import datetime, timedelta
+
+from aioresponses import aioresponses
+
+from it import (
+    ACCESS_TOKEN,
+    AUTH_URL,
+    REFRESH_TOKEN,
+    USERNAME,
+    async_hass,
+    async_smartmeter,
+    enabled,
+    expect_async_login,
+    expect_async_zaehlpunkte,
+    zaehlpunkt,
+)
+from wnsm.AsyncSmartmeter import AsyncSmartmeter
+from wnsm import auth_store
+from wnsm.auth_store import AuthStore
+
+
+async def _restore(config_dir):
+    """restores the stored login state into a new client, like after a restart"""
+    async with async_hass(config_dir) as hass:
+        client = async_smartmeter()
+        restored = await AuthStore(hass, USERNAME).async_restore(client)
+    return restored, client
+
+
+def test_login_state_saved_and_restored(tmp_path):
+    async def login():
+        async with async_hass(tmp_path) as hass:
+            client = async_smartmeter()
+            try:
+                await AsyncSmartmeter(hass, client, AuthStore(hass, USERNAME)).login()
+            finally:
+                await client.close()
+
+    with aioresponses() as m:
+        expect_async_login(m)
+        asyncio.run(login())
+    restored, client = asyncio.run(_restore(tmp_path))
+    assert restored
+    assert client.is_logged_in()
+    assert client._access_token == ACCESS_TOKEN
+    assert client._refresh_token == REFRESH_TOKEN
+    assert client._api_gateway_token == "afb0be74-6455-44f5-a34d-6994223020ba"
+
+
+def test_tokens_refreshed_by_api_calls_are_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth_store, "SAVE_DELAY", 0)
+
+    async def login_and_query():
+        async with async_hass(tmp_path) as hass:
+            client = async_smartmeter()
+            try:
+                await AsyncSmartmeter(hass, client, AuthStore(hass, USERNAME)).login()
+                # the login state is written, then the access token is about to expire and the api call refreshes it
+                await asyncio.sleep(0)
+                await hass.async_block_till_done()
+                await client.zaehlpunkte()
+            finally:
+                await client.close()
+
+    with aioresponses() as m:
+        expect_async_login(m, expires=30)
+        m.post(f'{AUTH_URL}/token', payload={
+            "access_token": "refreshed",
+            "expires_in": 300,
+            "refresh_expires_in": 1800,
+            "refresh_token": "rotated",
+            "token_type": "Bearer",
+        })
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        asyncio.run(login_and_query())
+    restored, client = asyncio.run(_restore(tmp_path))
+    assert restored
+    assert client._access_token == "refreshed"
+    assert client._refresh_token == "rotated"
+
+
+def test_expired_login_state_not_restored(tmp_path):
+    async def save_expired():
+        async with async_hass(tmp_path) as hass:
+            client = async_smartmeter()
+            client._access_token, client._refresh_token = ACCESS_TOKEN, REFRESH_TOKEN
+            client._access_token_expiration = client._refresh_token_expiration = datetime.now() - timedelta(seconds=1)
+            AuthStore(hass, USERNAME).async_schedule_save(client)
+
+    asyncio.run(save_expired())
+    restored, client = asyncio.run(_restore(tmp_path))
+    assert not restored
+    assert client._access_token is None
+    assert client._refresh_token is None
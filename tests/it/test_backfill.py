@@ -0,0 +1,293 @@
+"""Tests of the backfill checkpoints and jobs"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+import pytest
+
+from it import async_hass
+from wnsm import importer as importer_module
+from wnsm.api.errors import SmartmeterQueryError
+from wnsm.backfill import BackfillCheckpoint, BackfillJob, async_get_backfills
+from wnsm.const import DOMAIN
+from wnsm.gaps import GapTracker
+from wnsm.importer import Importer
+from wnsm.services import SERVICE_CANCEL_BACKFILL, SERVICE_PAUSE_BACKFILL, SERVICE_RESUME_BACKFILL, async_setup_services
+
+END = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def test_checkpoint_walks_windows():
+    checkpoint = BackfillCheckpoint.begin(END, timedelta(days=65))
+    assert checkpoint.start == checkpoint.next == END - timedelta(days=65)
+    assert checkpoint.sum == Decimal(0)
+    assert 3 == checkpoint.windows_total(timedelta(days=30)) == checkpoint.windows_left(timedelta(days=30))
+    assert 0.0 == checkpoint.percent
+
+    windows = []
+    while not checkpoint.done:
+        start, end = checkpoint.window(timedelta(days=30))
+        windows.append((start, end))
+        checkpoint = checkpoint._replace(next=end, sum=checkpoint.sum + 1)
+        assert checkpoint.windows_left(timedelta(days=30)) == 3 - len(windows)
+    assert [end - start for start, end in windows] == [timedelta(days=30), timedelta(days=30), timedelta(days=5)]
+    assert windows[-1][1] == END
+    assert all(previous[1] == following[0] for previous, following in zip(windows, windows[1:]))
+    assert 100.0 == checkpoint.percent
+    assert Decimal(3) == checkpoint.sum
+
+
+def test_checkpoint_round_trip():
+    checkpoint = BackfillCheckpoint.begin(END, total_usage=Decimal("12.345678"))._replace(
+        next=END - timedelta(days=100), paused=True)
+    data = checkpoint.as_dict()
+    assert data["sum"] == "12.345678"
+    assert BackfillCheckpoint.from_dict(data) == checkpoint
+    assert BackfillCheckpoint.from_dict(None) is None
+    assert 90.9 == checkpoint.percent
+
+
+ZP = "AT0010000000000000001000004392265"
+WINDOW = timedelta(days=365)
+
+
+class WindowImporter:
+    """
+    Imports the windows of a backfill by adding 1 to the sum per window.
+    Windows in `failures` raise the given error once, windows in `blocked` wait until released.
+    """
+
+    def __init__(self, failures: Optional[dict] = None, blocked: Optional[set] = None, gaps: Optional[GapTracker] = None):
+        self.windows = []
+        self.failures = failures or {}
+        self.blocked = blocked or set()
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.gaps = gaps
+
+    async def async_import_range(self, start, end, total_usage):
+        if start in self.failures:
+            raise self.failures.pop(start)
+        if start in self.blocked:
+            self.started.set()
+            await self.release.wait()
+        self.windows.append(start)
+        return total_usage + 1
+
+
+def _job(hass, importer: WindowImporter) -> BackfillJob:
+    job = BackfillJob(hass, None, ZP, window=WINDOW)
+    job.importer = importer
+    return job
+
+
+async def _finished(job: BackfillJob):
+    while job.running:
+        await asyncio.sleep(0)
+
+
+def test_backfill_resumes_after_restart(tmp_path):
+    first_window = END - timedelta(days=365 * 3)
+    second_window = first_window + WINDOW
+
+    async def interrupted():
+        async with async_hass(tmp_path) as hass:
+            importer = WindowImporter(failures={second_window: TimeoutError("Timeout")})
+            job = _job(hass, importer)
+            await job.async_begin(END)
+            await _finished(job)
+            return importer.windows, job.checkpoint, job.last_error
+
+    async def resumed():
+        async with async_hass(tmp_path) as hass:
+            importer = WindowImporter()
+            job = _job(hass, importer)
+            checkpoint = await job.async_load()
+            assert job.async_start()
+            await _finished(job)
+            return importer.windows, checkpoint, job.checkpoint, job.active
+
+    windows, checkpoint, last_error = asyncio.run(interrupted())
+    assert windows == [first_window]
+    assert checkpoint.next == second_window and checkpoint.sum == Decimal(1)
+    assert last_error == "TimeoutError: Timeout"
+
+    windows, restored, checkpoint, active = asyncio.run(resumed())
+    assert restored == BackfillCheckpoint(first_window, END, second_window, Decimal(1))
+    assert windows == [second_window, second_window + WINDOW]
+    # the finished backfill keeps its checkpoint, the regular import takes over at its end
+    assert checkpoint.done and checkpoint.sum == Decimal(3) and not active
+
+
+def test_backfill_stops_on_api_errors(tmp_path):
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            job = _job(hass, WindowImporter(failures={END - timedelta(days=365 * 3): SmartmeterQueryError("Bad request")}))
+            await job.async_begin(END)
+            await _finished(job)
+            return job.active, job.last_error, job.progress()
+
+    active, last_error, progress = asyncio.run(run())
+    assert active
+    assert last_error == "SmartmeterQueryError: Bad request"
+    assert progress["last_error"] == last_error and progress["state"] == "pending"
+
+
+def test_backfill_pause_and_resume(tmp_path):
+    first_window = END - timedelta(days=365 * 3)
+
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            importer = WindowImporter(blocked={first_window + WINDOW})
+            job = _job(hass, importer)
+            await job.async_begin(END)
+            await importer.started.wait()
+            running = job.progress()
+            await job.async_pause()
+            paused = job.progress(), job.running, job.async_start()
+            importer.blocked.clear()
+            await job.async_resume()
+            await _finished(job)
+            return running, paused, importer.windows, job.active
+
+    running, (paused, still_running, started), windows, active = asyncio.run(run())
+    assert running["state"] == "running"
+    assert running["percent"] == 33.3 and running["windows_left"] == 2
+    assert running["next"] == (END - timedelta(days=365 * 2)).isoformat()
+    assert paused["state"] == "paused" and paused["eta"] is None
+    assert not still_running and not started
+    # the interrupted window is imported again
+    assert windows == [first_window, first_window + WINDOW, first_window + 2 * WINDOW]
+    assert not active
+
+
+def test_backfill_cancel_is_persisted(tmp_path):
+    first_window = END - timedelta(days=365 * 3)
+
+    async def cancel():
+        async with async_hass(tmp_path) as hass:
+            gaps = GapTracker(hass, ZP)
+            importer = WindowImporter(blocked={first_window + WINDOW}, gaps=gaps)
+            job = _job(hass, importer)
+            await job.async_begin(END)
+            await importer.started.wait()
+            await job.async_cancel()
+            return job.active, job.running, job.progress(), gaps.scanned
+
+    async def restart():
+        async with async_hass(tmp_path) as hass:
+            job = _job(hass, WindowImporter())
+            await job.async_load()
+            return job.cancelled, job.active, job.async_start(), job.resume_point(None, Decimal(0)), \
+                job.resume_point(first_window + WINDOW, Decimal(1)), job.resume_point(END + WINDOW, Decimal(5))
+
+    active, running, progress, scanned = asyncio.run(cancel())
+    assert not active and not running and progress is None
+    assert scanned
+    cancelled, active, started, no_statistics, partial, after = asyncio.run(restart())
+    assert cancelled and not active and not started
+    # the regular import continues at the end of the cancelled backfill, not before
+    assert no_statistics == (END, Decimal(1))
+    assert partial == (END, Decimal(1))
+    assert after == (END + WINDOW, Decimal(5))
+
+
+class ActiveSmartmeter:
+    async def login(self):
+        pass
+
+    async def get_zaehlpunkt(self, zaehlpunkt):
+        return {"zaehlpunktnummer": zaehlpunkt}
+
+    @staticmethod
+    def is_active(zaehlpunkt):
+        return True
+
+
+class NoRecorder:
+    async def async_add_executor_job(self, target, *args):
+        return {}
+
+
+class IncrementalImporter(Importer):
+    """Records the incremental imports instead of fetching and writing statistics"""
+
+    def __init__(self, hass, backfill):
+        super().__init__(hass, ActiveSmartmeter(), ZP, "kWh", backfill=backfill)
+        self.imports = []
+
+    async def _incremental_import_statistics(self, start, total_usage):
+        self.imports.append((start, total_usage))
+        return total_usage
+
+
+@pytest.mark.parametrize("statistics", [
+    {},
+    # the statistics imported by the backfill until it has been cancelled
+    {f"{DOMAIN}:{ZP.lower()}": [{"sum": 2.0, "end": (END - WINDOW).timestamp()}]},
+])
+def test_importer_continues_after_cancelled_backfill(tmp_path, monkeypatch, statistics):
+    monkeypatch.setattr(importer_module, "get_instance", lambda hass: NoRecorder())
+
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            job = _job(hass, WindowImporter())
+            job.checkpoint = BackfillCheckpoint.begin(END)._replace(next=END - WINDOW, sum=Decimal(2), cancelled=True)
+            importer = IncrementalImporter(hass, job)
+            await importer._async_import(statistics)
+            return importer.imports, job.running
+
+    imports, running = asyncio.run(run())
+    # neither is the backfill started again nor is the whole history imported at once
+    assert imports == [(END, Decimal(2))]
+    assert not running
+
+
+def test_importer_continues_after_finished_backfill_without_statistics(tmp_path, monkeypatch):
+    # e.g. the meter has been installed today, the backfill did not import any statistics
+    monkeypatch.setattr(importer_module, "get_instance", lambda hass: NoRecorder())
+
+    async def backfill():
+        async with async_hass(tmp_path) as hass:
+            job = _job(hass, WindowImporter())
+            await job.async_begin(END)
+            await _finished(job)
+
+    async def next_cycles():
+        async with async_hass(tmp_path) as hass:
+            job = _job(hass, WindowImporter())
+            await job.async_load()
+            importer = IncrementalImporter(hass, job)
+            for _ in range(2):
+                await importer._async_import({})
+            return importer.imports, job.active, job.running, job.importer.windows
+
+    asyncio.run(backfill())
+    imports, active, running, windows = asyncio.run(next_cycles())
+    # the backfill is not started again every cycle
+    assert not active and not running and windows == []
+    assert imports == [(END, Decimal(3))] * 2
+
+
+def test_backfill_services(tmp_path):
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            async_setup_services(hass)
+            importer = WindowImporter(blocked={END - timedelta(days=365 * 3)})
+            job = async_get_backfills(hass)[ZP] = _job(hass, importer)
+            await job.async_begin(END)
+            await importer.started.wait()
+            await hass.services.async_call(DOMAIN, SERVICE_PAUSE_BACKFILL, {"zaehlpunkt": ZP}, blocking=True)
+            paused = job.checkpoint.paused, job.running
+            await hass.services.async_call(DOMAIN, SERVICE_RESUME_BACKFILL, {}, blocking=True)
+            resumed = job.checkpoint.paused, job.running
+            await hass.services.async_call(DOMAIN, SERVICE_CANCEL_BACKFILL, {"zaehlpunkt": ZP}, blocking=True)
+            # unknown zaehlpunkte are ignored
+            await hass.services.async_call(DOMAIN, SERVICE_PAUSE_BACKFILL, {"zaehlpunkt": "AT1"}, blocking=True)
+            return paused, resumed, job.cancelled, job.running
+
+    paused, resumed, cancelled, running = asyncio.run(run())
+    assert paused == (True, False)
+    assert resumed == (False, True)
+    assert cancelled and not running
@@ -0,0 +1,97 @@
+"""Tests of the registry sharing one api client per account"""
+import asyncio
+
+import aiohttp
+import pytest
+
+from it import PASSWORD, USERNAME, async_hass
+from wnsm import client_registry
+from wnsm.client_registry import async_get_registry
+
+
+@pytest.fixture(autouse=True)
+def sessions(monkeypatch):
+    """plain sessions instead of the ones of Home Assistant's http client (which needs the network integration)"""
+    created = []
+
+    def create_session(hass, auto_cleanup=True):
+        created.append(aiohttp.ClientSession())
+        return created[-1]
+
+    monkeypatch.setattr(client_registry, "async_create_clientsession", create_session)
+    return created
+
+
+def test_same_account_shares_client(tmp_path):
+    async def acquire():
+        async with async_hass(tmp_path) as hass:
+            registry = async_get_registry(hass)
+            first = registry.acquire(USERNAME, PASSWORD, "entry")
+            second = registry.acquire(USERNAME, PASSWORD, "coordinator")
+            other = registry.acquire("someone@else.at", PASSWORD, "other entry")
+            assert registry is async_get_registry(hass)
+            clients = len(registry)
+            registry.release(USERNAME, "entry")
+            registry.release(USERNAME, "coordinator")
+            registry.release("someone@else.at", "other entry")
+            await hass.async_block_till_done()
+            return first, second, other, clients
+
+    first, second, other, clients = asyncio.run(acquire())
+    assert first is second
+    assert other is not first
+    assert 2 == clients
+
+
+def test_release_by_last_owner_closes_session(tmp_path):
+    async def acquire_and_release():
+        async with async_hass(tmp_path) as hass:
+            registry = async_get_registry(hass)
+            client = registry.acquire(USERNAME, PASSWORD, "entry")
+            registry.acquire(USERNAME, PASSWORD, "coordinator")
+            session = client.smartmeter.session
+            connector = session.connector
+
+            registry.release(USERNAME, "entry")
+            await hass.async_block_till_done()
+            assert registry.get(USERNAME) is client
+            assert not session.closed
+
+            registry.release(USERNAME, "coordinator")
+            await hass.async_block_till_done()
+            assert registry.get(USERNAME) is None
+            assert 0 == len(registry)
+            # the pooled connections are closed, not only detached from the session
+            assert session.closed
+            assert connector.closed
+            # releasing again (e.g. unloading twice) is fine
+            registry.release(USERNAME, "coordinator")
+
+            again = registry.acquire(USERNAME, PASSWORD, "entry")
+            assert again is not client
+            registry.release(USERNAME, "entry")
+            await hass.async_block_till_done()
+
+    asyncio.run(acquire_and_release())
+
+
+def test_changed_password_resets_login(tmp_path):
+    async def acquire():
+        async with async_hass(tmp_path) as hass:
+            registry = async_get_registry(hass)
+            client = registry.acquire(USERNAME, PASSWORD, "entry")
+            client.smartmeter._access_token = "token"
+            client.smartmeter._refresh_token = "refresh"
+            assert registry.acquire(USERNAME, PASSWORD, "coordinator") is client
+            assert client.smartmeter._access_token == "token"
+
+            assert registry.acquire(USERNAME, "changed", "new entry") is client
+            assert client.smartmeter.password == "changed"
+            assert client.smartmeter._access_token is None
+            assert client.smartmeter._refresh_token is None
+            registry.release(USERNAME, "entry")
+            registry.release(USERNAME, "coordinator")
+            registry.release(USERNAME, "new entry")
+            await hass.async_block_till_done()
+
+    asyncio.run(acquire())
@@ -0,0 +1,38 @@
+"""Config flow tests"""
+import asyncio
+
+import pytest
+from aioresponses import aioresponses
+
+from it import async_smartmeter, enabled, expect_async_login, expect_async_zaehlpunkte, zaehlpunkt
+from wnsm import config_flow
+from wnsm.api.errors import SmartmeterLoginError
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    created = []
+
+    def client(username, password):
+        created.append(async_smartmeter(username, password))
+        return created[-1]
+
+    monkeypatch.setattr(config_flow, "AsyncSmartmeterClient", client)
+    return created
+
+
+def test_validate_auth_closes_session(clients):
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        zps = asyncio.run(config_flow.WienerNetzeSmartMeterCustomConfigFlow().validate_auth("user", "password"))
+    assert [zp.zaehlpunktnummer for zp in zps] == [zaehlpunkt()["zaehlpunktnummer"]]
+    assert clients[0].session.closed
+
+
+def test_validate_auth_closes_session_on_failure(clients):
+    with aioresponses() as m:
+        expect_async_login(m, status=403)
+        with pytest.raises(SmartmeterLoginError):
+            asyncio.run(config_flow.WienerNetzeSmartMeterCustomConfigFlow().validate_auth("user", "password"))
+    assert clients[0].session.closed
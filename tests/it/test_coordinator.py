@@ -0,0 +1,166 @@
+"""Tests of the coordinator updating all zaehlpunkte of an account in one cycle"""
+import asyncio
+from datetime import datetime, timezone
+
+import aiohttp
+import pytest
+from homeassistant.config_entries import ConfigEntry, ConfigEntryState
+from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers.update_coordinator import UpdateFailed
+
+import wnsm
+from it import PASSWORD, USERNAME, async_hass
+from wnsm import coordinator
+from wnsm.api.errors import SmartmeterConnectionError, SmartmeterLoginError, SmartmeterQueryError
+from wnsm.coordinator import WNSMCoordinator
+
+ZP_OK = "AT0010000000000000001000004392265"
+ZP_QUERY_ERROR = "AT0010000000000000001000004392266"
+ZP_CLIENT_ERROR = "AT0010000000000000001000004392267"
+ZP_CONNECTION_ERROR = "AT0010000000000000001000004392268"
+
+FAILURES = {
+    ZP_QUERY_ERROR: SmartmeterQueryError("Failed to fetch zaehlpunkt"),
+    ZP_CLIENT_ERROR: aiohttp.ClientConnectionError("Connection reset by peer"),
+    ZP_CONNECTION_ERROR: SmartmeterConnectionError("API Request failed with status 503", code=503),
+}
+
+
+class FakeClient:
+    def __init__(self):
+        self.zaehlpunkte_calls = 0
+
+    async def zaehlpunkte(self):
+        self.zaehlpunkte_calls += 1
+        return []
+
+
+class FakeSmartmeter:
+    """Answers the calls of an update cycle, the zaehlpunkte in FAILURES fail with their error"""
+
+    def __init__(self, login_error: Exception = None):
+        self.smartmeter = FakeClient()
+        self.login_error = login_error
+        self.logins = 0
+        self.meter_readings = 0
+
+    async def login(self):
+        self.logins += 1
+        if self.login_error is not None:
+            raise self.login_error
+
+    async def get_zaehlpunkt(self, zaehlpunkt: str) -> dict:
+        if zaehlpunkt in FAILURES:
+            raise FAILURES[zaehlpunkt]
+        return {"zaehlpunktnummer": zaehlpunkt, "active": True}
+
+    @staticmethod
+    def is_active(attributes: dict) -> bool:
+        return attributes["active"]
+
+    async def get_latest_meter_reading(self, zaehlpunkt: str, date_from: datetime, date_until: datetime):
+        self.meter_readings += 1
+        return 1234.5, date_until.astimezone(timezone.utc)
+
+
+class FakeRegistry:
+    def __init__(self, smartmeter: FakeSmartmeter):
+        self.smartmeter = smartmeter
+        self.owners = []
+
+    def acquire(self, username, password, owner):
+        self.owners.append(owner)
+        return self.smartmeter
+
+    def release(self, username, owner):
+        self.owners.remove(owner)
+
+
+class RunningBackfill:
+    """A backfill still importing the history, so the cycle does not import statistics"""
+    active = True
+
+    def async_start(self):
+        pass
+
+
+class StubCoordinator(WNSMCoordinator):
+    async def _async_backfill(self, zaehlpunkt, granularity, gaps=None, estimates=None):
+        return RunningBackfill()
+
+
+@pytest.fixture
+def smartmeter(monkeypatch):
+    fake = FakeSmartmeter()
+    registry = FakeRegistry(fake)
+    monkeypatch.setattr(coordinator, "async_get_registry", lambda hass: registry)
+    monkeypatch.setattr(wnsm, "async_get_registry", lambda hass: registry)
+    fake.registry = registry
+    return fake
+
+
+def _update(tmp_path, zaehlpunkte: list[str], cycles: int = 1):
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            wnsm = StubCoordinator(hass, USERNAME, PASSWORD, zaehlpunkte)
+            for _ in range(cycles):
+                wnsm.data = await wnsm._async_update_data()
+            return wnsm.data
+
+    return asyncio.run(run())
+
+
+def test_failing_meter_does_not_fail_the_others(tmp_path, smartmeter):
+    data = _update(tmp_path, [ZP_QUERY_ERROR, ZP_OK, ZP_CLIENT_ERROR, ZP_CONNECTION_ERROR])
+    assert data[ZP_OK].available
+    assert data[ZP_OK].meter_reading == 1234.5
+    assert not any(data[zaehlpunkt].available for zaehlpunkt in FAILURES)
+
+
+def test_all_meters_failing_fails_the_update(tmp_path, smartmeter):
+    with pytest.raises(UpdateFailed):
+        _update(tmp_path, list(FAILURES))
+
+
+def test_login_and_zaehlpunkte_once_per_cycle(tmp_path, smartmeter):
+    _update(tmp_path, [ZP_OK, ZP_QUERY_ERROR, ZP_CLIENT_ERROR], cycles=2)
+    assert 2 == smartmeter.logins
+    assert 2 == smartmeter.smartmeter.zaehlpunkte_calls
+
+
+def test_meter_reading_not_queried_again_the_same_day(tmp_path, smartmeter):
+    data = _update(tmp_path, [ZP_OK], cycles=3)
+    assert 1 == smartmeter.meter_readings
+    assert data[ZP_OK].meter_reading == 1234.5
+
+
+@pytest.mark.parametrize("error", [
+    SmartmeterLoginError("Login failed"),
+    SmartmeterConnectionError("Could not login"),
+    aiohttp.ClientConnectionError("Connection refused"),
+    TimeoutError("Timeout"),
+])
+def test_login_failure_fails_the_update(tmp_path, smartmeter, error):
+    smartmeter.login_error = error
+    with pytest.raises(UpdateFailed):
+        _update(tmp_path, [ZP_OK])
+
+
+def test_failing_first_update_retries_the_entry_setup(tmp_path, smartmeter):
+    smartmeter.login_error = SmartmeterConnectionError("Could not login")
+    entry = ConfigEntry(
+        data={"username": USERNAME, "password": PASSWORD, "zaehlpunkte": [{"zaehlpunktnummer": ZP_OK}]},
+        discovery_keys={}, domain="wnsm", minor_version=1, options=None, source="user",
+        state=ConfigEntryState.SETUP_IN_PROGRESS, subentries_data=None, title=USERNAME, unique_id=None, version=1,
+    )
+
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            with pytest.raises(ConfigEntryNotReady):
+                await wnsm.async_setup_entry(hass, entry)
+            # the entry does not hold on to the client, the coordinator is shut down when HA unloads the entry
+            assert [type(owner) for owner in smartmeter.registry.owners] == [WNSMCoordinator]
+            await entry._async_process_on_unload(hass)
+            assert smartmeter.registry.owners == []
+
+    asyncio.run(run())
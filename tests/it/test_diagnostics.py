@@ -0,0 +1,38 @@
+"""Diagnostics tests"""
+import asyncio
+import json
+
+from it import PASSWORD, USERNAME, async_hass, enabled, zaehlpunkt, zaehlpunkt_response
+from wnsm.api.models import contracts_from_json
+from wnsm.const import CONF_ZAEHLPUNKTE
+from wnsm.diagnostics import async_get_config_entry_diagnostics
+
+
+class Entry:
+    def __init__(self, data: dict):
+        self.data = data
+
+
+def test_diagnostics_do_not_contain_personal_data(tmp_path):
+    zaehlpunkte = [
+        {**zp.as_attributes(), "label": "Wohnung Musterfrau", "streetNumber": "17/4"}
+        for zp in contracts_from_json(zaehlpunkt_response([enabled(zaehlpunkt())]))[0].zaehlpunkte
+    ]
+    entry = Entry({"username": USERNAME, "password": PASSWORD, CONF_ZAEHLPUNKTE: zaehlpunkte})
+
+    async def diagnostics():
+        async with async_hass(tmp_path) as hass:
+            return await async_get_config_entry_diagnostics(hass, entry)
+
+    dump = json.dumps(asyncio.run(diagnostics()))
+    personal = [USERNAME, PASSWORD] + [
+        zaehlpunkte[0][key] for key in (
+            "customerId", "zaehlpunktnummer", "label", "equipmentNumber", "deviceId",
+            "street", "streetNumber", "zip", "city", "longitude", "latitude",
+        )
+    ]
+    assert all(value for value in personal)
+    for value in personal:
+        assert str(value) not in dump, value
+    # the non identifying attributes are kept
+    assert json.loads(dump)["entry"][CONF_ZAEHLPUNKTE][0]["active"] == zaehlpunkte[0]["active"]
@@ -0,0 +1,335 @@
+"""Tests of the detection and patching of gaps in the statistics"""
+import asyncio
+import time
+from decimal import Decimal
+
+import pytest
+
+from it import async_hass
+from wnsm import importer as importer_module
+from wnsm.aggregation import SCALE, UNIT_SCALE, aggregate_hourly
+from wnsm.api.errors import SmartmeterConnectionError
+from wnsm.api.series import SeriesBuilder
+from wnsm.const import ESTIMATE_REVALIDATION_DELAY, GAP_MAX_ATTEMPTS, GAP_PATCH_DELAY, GAP_PATCH_LIMIT
+from wnsm.gaps import (
+    DAY, HOUR, EstimateTracker, Gap, GapTracker, find_estimated, find_gaps, merge_gaps, rebase, statistics_gaps
+)
+from wnsm.importer import Importer
+
+START = 1672531200  # 2023-01-01T00:00:00Z
+
+
+def _series(values, start=START, cadence=900, estimated=()):
+    builder = SeriesBuilder()
+    for i, value in enumerate(values):
+        epoch = start + i * cadence
+        builder.append_raw(epoch, epoch + cadence, value, estimated=i in estimated)
+    return builder.build()
+
+
+def _rows(usage, start=START, total=0.0):
+    rows = []
+    for i, state in enumerate(usage):
+        total += state
+        rows.append({"start": float(start + i * HOUR), "state": state, "sum": total})
+    return rows
+
+
+def test_complete_series_has_no_gaps():
+    assert find_gaps(_series([1] * 4 * 24), START) == []
+
+
+def test_null_values_are_gaps():
+    values = [1] * 4 * 6
+    values[5] = None
+    values[12:20] = [None] * 8
+    assert find_gaps(_series(values), START) == [(START + HOUR, START + 2 * HOUR), (START + 3 * HOUR, START + 5 * HOUR)]
+
+
+def test_trailing_null_values_are_not_published_yet():
+    values = [1] * 4 * 3 + [None] * 4 * 2
+    assert find_gaps(_series(values), START) == []
+    assert find_gaps(_series(values), START, START + 5 * HOUR) == [(START + 3 * HOUR, START + 5 * HOUR)]
+
+
+def test_missing_values_are_gaps():
+    builder = SeriesBuilder()
+    builder.extend_series(_series([1] * 4 * 2))
+    for i in range(12):
+        epoch = START + 3 * HOUR + i * 900
+        builder.append_raw(epoch, epoch + 900, 1)
+    assert find_gaps(builder.build(), START) == [(START + 2 * HOUR, START + 3 * HOUR)]
+
+
+def test_hours_before_the_first_reading_are_no_gaps():
+    # e.g. the meter has been installed two hours after the start of the imported window
+    values = [None] * 4 * 2 + [1] * 4 * 2 + [None] * 4 + [1] * 4
+    assert find_gaps(_series(values), START) == [(START, START + 2 * HOUR), (START + 4 * HOUR, START + 5 * HOUR)]
+    assert find_gaps(_series(values), START, None, True) == [(START + 4 * HOUR, START + 5 * HOUR)]
+    assert find_gaps(_series([None] * 8), START, START + 2 * HOUR, True) == []
+
+
+def test_daily_values_cover_their_hours():
+    assert find_gaps(_series([5, None, 7], cadence=DAY), START) == [(START + DAY, START + 2 * DAY)]
+
+
+def test_estimated_hours():
+    series = _series([1] * 4 * 6, estimated={1, 2, 12, 16, 23})
+    assert find_estimated(series, START) == [(START, START + HOUR), (START + 3 * HOUR, START + 6 * HOUR)]
+    assert find_estimated(series, START + HOUR, START + 5 * HOUR) == [(START + 3 * HOUR, START + 5 * HOUR)]
+    assert find_estimated(_series([1] * 8), START) == []
+
+
+def test_estimated_null_values_are_gaps_only():
+    series = _series([1, None, 1, 1], estimated={1})
+    assert find_estimated(series, START) == []
+    assert find_gaps(series, START) == [(START, START + HOUR)]
+
+
+def test_estimated_daily_values():
+    assert find_estimated(_series([5, 6], cadence=DAY, estimated={1}), START) == [(START + DAY, START + 2 * DAY)]
+
+
+def test_statistics_gaps():
+    starts = [START, START + HOUR, START + 4 * HOUR, START + 5 * HOUR, START + 7 * HOUR]
+    assert statistics_gaps(starts) == [(START + 2 * HOUR, START + 4 * HOUR), (START + 6 * HOUR, START + 7 * HOUR)]
+    assert statistics_gaps([START, START + DAY, START + 3 * DAY], DAY) == [(START + 2 * DAY, START + 3 * DAY)]
+
+
+def test_merge_gaps():
+    gaps = [Gap(START + 5 * DAY, START + 5 * DAY + HOUR, 2), Gap(START, START + HOUR, 3), Gap(START + HOUR, START + 3 * HOUR, 1)]
+    assert merge_gaps(gaps) == [Gap(START, START + 3 * HOUR, 1), Gap(START + 5 * DAY, START + 5 * DAY + HOUR, 2)]
+    assert merge_gaps(gaps, tolerance=5 * DAY) == [Gap(START, START + 5 * DAY + HOUR, 1)]
+    # merged gaps are due once the later one is due
+    assert merge_gaps([Gap(START, START + HOUR, 0, 10), Gap(START + HOUR, START + 2 * HOUR, 1, 20)]) == [
+        Gap(START, START + 2 * HOUR, 0, 20)
+    ]
+
+
+def test_rebase_rewrites_from_first_changed_hour():
+    rows = _rows([1.0, 2.0, 0.0, 0.0, 3.0, 4.0], total=10.0)
+    # the range [START, START + 4h) is re-fetched, the hours 2 and 3 were null before
+    values = [0.25] * 4 + [0.5] * 4 + [0.75] * 4 + [0.25] * 4
+    hourly = aggregate_hourly(_series(values), UNIT_SCALE["KWH"], START)
+    changed, delta = rebase(rows, hourly, START + 4 * HOUR)
+    assert delta == Decimal("4")
+    assert [(hour, usage, total) for hour, usage, total in changed] == [
+        (START + 2 * HOUR, 3 * SCALE, Decimal("16")),
+        (START + 3 * HOUR, SCALE, Decimal("17")),
+    ]
+
+
+def test_rebase_fills_unrecorded_hours():
+    rows = _rows([1.0, 2.0], total=10.0)
+    rows.append({"start": float(START + 3 * HOUR), "state": 1.0, "sum": 14.0})
+    hourly = aggregate_hourly(_series([0.25] * 4 + [0.5] * 4 + [0.25] * 4), UNIT_SCALE["KWH"], START)
+    changed, delta = rebase(rows, hourly, START + 3 * HOUR)
+    assert delta == Decimal("1")
+    assert changed == [(START + 2 * HOUR, SCALE, Decimal("14"))]
+
+
+def test_rebase_unchanged():
+    rows = _rows([1.0, 1.0])
+    hourly = aggregate_hourly(_series([0.25] * 8), UNIT_SCALE["KWH"], START)
+    assert rebase(rows, hourly, START + 2 * HOUR) == ([], Decimal(0))
+
+
+ZP = "AT0010000000000000001000004392265"
+
+
+class PatchingImporter:
+    """Answers the patches of the gaps by their start: the remaining hours, None or an error to raise"""
+
+    def __init__(self, results: dict):
+        self.results = results
+        self.patched = []
+
+    async def async_patch_hours(self, start, end, pending):
+        self.patched.append((start, end, pending))
+        result = self.results.get(start, [])
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_gaps_are_patched_after_a_delay(tmp_path):
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            gaps = GapTracker(hass, ZP)
+            await gaps.async_add([(START, START + HOUR)])
+            importer = PatchingImporter({})
+            await gaps.async_patch(importer)
+            return gaps.gaps, importer.patched
+
+    before = time.time()
+    gaps, patched = asyncio.run(run())
+    # not re-fetched in the cycle they have been found in
+    assert patched == []
+    assert [(gap.start, gap.end, gap.attempts) for gap in gaps] == [(START, START + HOUR, 0)]
+    assert gaps[0].due >= int(before + GAP_PATCH_DELAY.total_seconds())
+
+
+def test_gaps_patched_until_complete(tmp_path):
+    day = START + DAY
+
+    async def patch():
+        async with async_hass(tmp_path) as hass:
+            gaps = GapTracker(hass, ZP, delay=0 * GAP_PATCH_DELAY)
+            gaps.gaps = [
+                Gap(START, START + HOUR),
+                Gap(day, day + 3 * HOUR, 1),
+                Gap(2 * day, 2 * day + HOUR),
+                Gap(3 * day, 3 * day + HOUR, GAP_MAX_ATTEMPTS - 1),
+                Gap(4 * day, 4 * day + HOUR, GAP_MAX_ATTEMPTS - 1),
+            ]
+            importer = PatchingImporter({
+                day: [(day + 2 * HOUR, day + 3 * HOUR)],
+                2 * day: SmartmeterConnectionError("API Request failed with status 503", code=503),
+                3 * day: None,
+            })
+            await gaps.async_patch(importer)
+            return importer.patched
+
+    async def restore():
+        async with async_hass(tmp_path) as hass:
+            gaps = GapTracker(hass, ZP)
+            await gaps.async_load()
+            return gaps.gaps
+
+    patched = asyncio.run(patch())
+    # the least often tried first, at most GAP_PATCH_LIMIT per cycle
+    assert [start for start, _, _ in patched] == [START, 2 * day, day, 3 * day][:GAP_PATCH_LIMIT]
+    assert all(pending is find_gaps for _, _, pending in patched)
+    assert [gap[:3] for gap in asyncio.run(restore())] == [
+        # the complete gap is gone, the failed one is retried, the last one has not been tried this cycle
+        (day + 2 * HOUR, day + 3 * HOUR, 2),
+        (2 * day, 2 * day + HOUR, 1),
+        (4 * day, 4 * day + HOUR, GAP_MAX_ATTEMPTS - 1),
+    ]
+
+
+def test_estimates_are_revalidated_later(tmp_path):
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            estimates = EstimateTracker(hass, ZP)
+            await estimates.async_add([(START, START + HOUR)])
+            due = estimates.gaps[0].due
+            estimates.gaps = [estimates.gaps[0]._replace(due=0)]
+            importer = PatchingImporter({START: [(START, START + HOUR)]})
+            await estimates.async_patch(importer)
+            return due, estimates.gaps, importer.patched
+
+    before = time.time()
+    due, gaps, patched = asyncio.run(run())
+    assert due >= int(before + ESTIMATE_REVALIDATION_DELAY.total_seconds())
+    assert patched == [(START, START + HOUR, find_estimated)]
+    # still estimated, tried again later
+    assert [gap[:3] for gap in gaps] == [(START, START + HOUR, 1)]
+
+
+def test_estimates_are_not_merged_across_days(tmp_path):
+    # e.g. an hour of every day has been estimated
+    days = [(START + i * DAY, START + i * DAY + HOUR) for i in range(60)]
+
+    async def run():
+        async with async_hass(tmp_path) as hass:
+            estimates, gaps = EstimateTracker(hass, ZP), GapTracker(hass, ZP)
+            await estimates.async_add(days)
+            await gaps.async_add(days)
+            return estimates.gaps, gaps.gaps
+
+    estimates, gaps = asyncio.run(run())
+    assert [gap[:2] for gap in estimates] == days
+    assert [gap[:2] for gap in gaps] == [(START, days[-1][1])]
+
+
+class InlineHass:
+    async def async_add_executor_job(self, target, *args):
+        return target(*args)
+
+
+class FakeRecorder:
+    """Answers the statistics query of a patch with the given rows and records the adjustments"""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        self.adjusted = []
+
+    async def async_add_executor_job(self, target, *args):
+        return {f"wnsm:{ZP.lower()}": self.rows} if self.rows else {}
+
+    def async_adjust_statistics(self, statistic_id, start_time, sum_adjustment, unit):
+        self.adjusted.append((statistic_id, start_time.timestamp(), sum_adjustment, unit))
+
+    async def async_block_till_done(self):
+        pass
+
+
+class PatchedImporter(Importer):
+    """Re-fetches a fixed series and records the written statistics instead of writing them to the recorder"""
+
+    def __init__(self, series, estimates=None):
+        super().__init__(InlineHass(), None, ZP, "kWh", estimates=estimates)
+        self.series = series
+        self.written = []
+
+    async def _async_fetch(self, start, end):
+        return self.series, UNIT_SCALE["KWH"]
+
+    async def _async_write_statistics(self, metadata, statistics):
+        self.written.extend(statistics)
+
+
+class RecordingEstimates:
+    def __init__(self):
+        self.added = []
+
+    async def async_add(self, gaps):
+        self.added.extend(gaps)
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = FakeRecorder(_rows([1.0, 2.0, 0.0, 0.0, 3.0, 4.0], total=10.0))
+    monkeypatch.setattr(importer_module, "get_instance", lambda hass: recorder)
+    return recorder
+
+
+def test_patch_hours_rebases_later_statistics(recorder):
+    # the hours 2 and 3 were null when they were imported, they are published now (the last one estimated)
+    values = [0.25] * 4 + [0.5] * 4 + [0.75] * 4 + [0.25] * 4
+    estimates = RecordingEstimates()
+    importer = PatchedImporter(_series(values, estimated={15}), estimates)
+    remaining = asyncio.run(importer.async_patch_hours(START, START + 4 * HOUR))
+    assert remaining == []
+    assert [(row["start"].timestamp(), row["state"], row["sum"]) for row in importer.written] == [
+        (START + 2 * HOUR, 3.0, Decimal("16")),
+        (START + 3 * HOUR, 1.0, Decimal("17")),
+    ]
+    # the statistics from the end of the patched range on are re-based by the usage filled in
+    assert recorder.adjusted == [(f"wnsm:{ZP.lower()}", START + 4 * HOUR, 4.0, "kWh")]
+    assert estimates.added == [(START + 3 * HOUR, START + 4 * HOUR)]
+
+
+def test_patch_hours_still_incomplete(recorder):
+    importer = PatchedImporter(_series([0.25] * 4 + [0.5] * 4 + [0.75] * 4 + [None] * 4))
+    remaining = asyncio.run(importer.async_patch_hours(START, START + 4 * HOUR))
+    assert remaining == [(START + 3 * HOUR, START + 4 * HOUR)]
+    # the still missing hour is re-based along with the filled in one
+    assert [(row["start"].timestamp(), row["sum"]) for row in importer.written] == [
+        (START + 2 * HOUR, Decimal("16")), (START + 3 * HOUR, Decimal("16")),
+    ]
+    assert recorder.adjusted == [(f"wnsm:{ZP.lower()}", START + 4 * HOUR, 3.0, "kWh")]
+
+
+def test_patch_hours_unchanged(recorder):
+    importer = PatchedImporter(_series([0.25] * 4 + [0.5] * 4))
+    assert asyncio.run(importer.async_patch_hours(START, START + 2 * HOUR)) == []
+    assert importer.written == [] and recorder.adjusted == []
+
+
+def test_patch_hours_without_statistics(recorder):
+    recorder.rows = []
+    importer = PatchedImporter(_series([0.25] * 4))
+    assert asyncio.run(importer.async_patch_hours(START, START + HOUR)) is None
+    assert importer.written == []
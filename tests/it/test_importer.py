@@ -0,0 +1,129 @@
+"""Tests of the batched statistics import"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from wnsm.aggregation import UNIT_SCALE, aggregate_hourly
+from wnsm.api.constants import ValueType
+from wnsm.api.series import SeriesBuilder
+from wnsm.gaps import HOUR
+from wnsm.importer import Importer, statistics_batches
+
+START = 1672531200  # 2023-01-01T00:00:00Z
+
+
+def _series(hours: int, kwh: float = 0.25, installed: int = 0, estimated: bool = False):
+    builder = SeriesBuilder()
+    for i in range(hours * 4):
+        epoch = START + i * 900
+        builder.append_raw(epoch, epoch + 900, kwh if i >= installed * 4 else None, estimated=estimated)
+    return builder.build()
+
+
+class RecordingHass:
+    """Runs executor jobs inline and records the batches built by them"""
+
+    def __init__(self, events: list):
+        self.events = events
+
+    async def async_add_executor_job(self, target, *args):
+        result = target(*args)
+        if target is next:
+            self.events.append(("build", None if result is None else len(result)))
+        return result
+
+
+class RecordingImporter(Importer):
+    """Imports a fixed series and records the committed batches instead of writing them to the recorder"""
+
+    def __init__(self, series, events: list, batch_size: int):
+        super().__init__(RecordingHass(events), None, "AT0010000000000000001000004392265", "kWh", ValueType.QUARTER_HOUR,
+                         batch_size=batch_size)
+        self.series = series
+        self.events = events
+        self.written = []
+        self.holds = []
+        # seconds the event loop is blocked by the fetch
+        self.blocking = 0.0
+
+    def _record_loop_hold(self, seconds: float):
+        self.holds.append(seconds)
+
+    async def _async_fetch(self, start, end):
+        if self.blocking:
+            await asyncio.sleep(0)
+            time.sleep(self.blocking)
+            await asyncio.sleep(0.01)
+        return self.series, UNIT_SCALE["KWH"]
+
+    async def _async_write_statistics(self, metadata, statistics):
+        self.events.append(("commit", len(statistics)))
+        self.written.extend(statistics)
+
+
+def test_statistics_batches_split_rows():
+    hourly = aggregate_hourly(_series(10), UNIT_SCALE["KWH"], START)
+    batches = list(statistics_batches(hourly, Decimal(0), 4))
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [row["start"].timestamp() for batch in batches for row in batch] == [START + i * HOUR for i in range(10)]
+    assert [len(batch) for batch in statistics_batches(hourly, Decimal(0), 10)] == [10]
+
+
+def test_statistics_batches_carry_the_sum():
+    hourly = aggregate_hourly(_series(10), UNIT_SCALE["KWH"], START)
+    batches = list(statistics_batches(hourly, Decimal("100.5"), 4))
+    assert [batch[0]["sum"] for batch in batches] == [Decimal("101.5"), Decimal("105.5"), Decimal("109.5")]
+    assert [row["sum"] for batch in batches for row in batch] == [Decimal("100.5") + i for i in range(1, 11)]
+    assert all(row["state"] == 1.0 for batch in batches for row in batch)
+
+
+def test_each_batch_is_committed_before_the_next_one_is_built():
+    events = []
+    importer = RecordingImporter(_series(10), events, batch_size=4)
+    start = datetime.fromtimestamp(START, timezone.utc)
+    total = asyncio.run(importer.async_import_range(start, start, Decimal(7)))
+    assert total == Decimal(17)
+    assert events == [
+        ("build", 4), ("commit", 4),
+        ("build", 4), ("commit", 4),
+        ("build", 2), ("commit", 2),
+        ("build", None),
+    ]
+    assert [row["sum"] for row in importer.written] == [Decimal(7) + i for i in range(1, 11)]
+
+
+def test_loop_hold_of_a_backfill_window_is_measured():
+    importer = RecordingImporter(_series(2), [], batch_size=4)
+    importer.blocking = 0.2
+    start = datetime.fromtimestamp(START, timezone.utc)
+    asyncio.run(importer.async_import_range(start, start, Decimal(0)))
+    assert max(importer.holds) >= 0.1
+
+
+class RecordingGaps:
+    def __init__(self):
+        self.added = []
+
+    async def async_add(self, gaps):
+        self.added.extend(gaps)
+
+
+def test_hours_before_the_first_reading_are_gaps_only_after_previous_statistics():
+    start = datetime.fromtimestamp(START, timezone.utc)
+    for total_usage, gaps in ((Decimal(0), []), (Decimal(5), [(START, START + 2 * HOUR)])):
+        importer = RecordingImporter(_series(6, installed=2), [], batch_size=24)
+        importer.gaps = RecordingGaps()
+        asyncio.run(importer.async_import_range(start, start, total_usage))
+        assert importer.gaps.added == gaps
+
+
+def test_empty_windows_record_no_gaps_or_estimates():
+    start = datetime.fromtimestamp(START, timezone.utc)
+    # nothing reported yet, missing and zero values (some of them estimated) are not imported
+    for series in (_series(6, installed=6), _series(6, kwh=0, installed=2, estimated=True)):
+        importer = RecordingImporter(series, [], batch_size=24)
+        importer.gaps, importer.estimates = RecordingGaps(), RecordingGaps()
+        assert asyncio.run(importer.async_import_range(start, start, Decimal(5))) is None
+        assert importer.written == []
+        assert importer.gaps.added == importer.estimates.added == []
@@ -0,0 +1,142 @@
+"""Peak memory of the initial (three years) statistics import, measured with tracemalloc"""
+import asyncio
+import json
+import re
+import tracemalloc
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from aioresponses import CallbackResult, aioresponses
+
+from it import (
+    async_smartmeter,
+    enabled,
+    expect_async_login,
+    expect_async_zaehlpunkte,
+    zaehlpunkt,
+    zaehlpunkt_response,
+)
+from standin import quarter_hour_wh
+from wnsm.AsyncSmartmeter import AsyncSmartmeter
+from wnsm.aggregation import to_decimal
+from wnsm.api.constants import ValueType
+from wnsm.importer import Importer
+
+QUARTER_HOUR = 15 * 60
+MIB = 1024 * 1024
+
+#: ceiling of the peak memory of an initial import of three years of quarter hour values (about 14 MiB now,
+#: the raw responses alone are 13 MiB), lower it whenever the import gets leaner
+PEAK_CEILING = 18 * MIB
+
+
+class RecordingImporter(Importer):
+    """Keeps only the number of written statistics and the last one instead of writing them to the recorder"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.written = 0
+        self.last = None
+
+    async def _async_write_statistics(self, metadata, statistics):
+        self.written += len(statistics)
+        self.last = statistics[-1]
+
+
+class ExecutorHass:
+    """Runs executor jobs in the default executor of the loop, like hass.async_add_executor_job"""
+
+    def async_add_executor_job(self, target, *args):
+        return asyncio.get_running_loop().run_in_executor(None, target, *args)
+
+
+def _parse(value: str) -> int:
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+class BewegungsdatenResponses:
+    """
+    Answers the bewegungsdaten requests of the windows with synthetic quarter hour values.
+    The bodies are kept per url, so a second import allocates nothing but what the client and importer do.
+    """
+
+    def __init__(self, customer_id: str, zp: str):
+        self.customer_id = customer_id
+        self.zp = zp
+        self.bodies: dict[str, bytes] = {}
+        self.total_wh = {}
+
+    def __call__(self, url, **kwargs):
+        key = str(url)
+        if key not in self.bodies:
+            start, end = _parse(url.query["zeitpunktVon"]), _parse(url.query["zeitpunktBis"])
+            start = -(-start // QUARTER_HOUR) * QUARTER_HOUR
+            values = []
+            for epoch in range(start, end, QUARTER_HOUR):
+                wh = quarter_hour_wh(self.zp, epoch)
+                self.total_wh[epoch] = wh
+                values.append({
+                    "wert": wh / 1000,
+                    "zeitpunktVon": datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "zeitpunktBis": datetime.fromtimestamp(epoch + QUARTER_HOUR, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "geschaetzt": False,
+                })
+            self.bodies[key] = json.dumps({
+                "descriptor": {
+                    "geschaeftspartnernummer": self.customer_id,
+                    "zaehlpunktnummer": self.zp,
+                    "rolle": "V002",
+                    "aggregat": "NONE",
+                    "granularitaet": "QH",
+                    "einheit": "KWH",
+                },
+                "values": values,
+            }).encode()
+        return CallbackResult(status=200, body=self.bodies[key], content_type="application/json")
+
+
+def _initial_import():
+    """
+    runs the initial import twice (the first one builds the responses) and traces the second one
+    """
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zp = z["zaehlpunkte"][0]["zaehlpunktnummer"]
+    responses = BewegungsdatenResponses(z["geschaeftspartner"], zp)
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())], repeat=True)
+        m.get(re.compile(r".*/user/messwerte/bewegungsdaten\?.*"), callback=responses, repeat=True)
+
+        async def run():
+            client = async_smartmeter()
+            try:
+                await client.login()
+                smartmeter = AsyncSmartmeter(None, client)
+                await RecordingImporter(ExecutorHass(), smartmeter, zp, "kWh", ValueType.QUARTER_HOUR)._import_statistics()
+                importer = RecordingImporter(ExecutorHass(), smartmeter, zp, "kWh", ValueType.QUARTER_HOUR)
+                tracemalloc.start()
+                try:
+                    total = await importer._import_statistics()
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+                return importer, total, peak
+            finally:
+                await client.close()
+
+        importer, total, peak = asyncio.run(run())
+    return responses, importer, total, peak
+
+
+def test_initial_import_peak_memory():
+    responses, importer, total, peak = _initial_import()
+
+    # three years of values have been imported
+    assert importer.written == len(responses.total_wh) // 4
+    assert importer.written >= 365 * 3 * 24
+    assert total == to_decimal(sum(responses.total_wh.values()) * 1000)
+    assert importer.last["sum"] == total
+    assert isinstance(total, Decimal)
+
+    # neither the raw responses nor one object per value are held at once
+    assert peak < PEAK_CEILING, f"peak memory of the initial import is {peak / MIB:.1f} MiB"
@@ -0,0 +1,72 @@
+"""Tests of the daily meter reading"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from wnsm.AsyncSmartmeter import AsyncSmartmeter, MeterReading
+from wnsm.api.constants import ValueType
+from wnsm.coordinator import WNSMCoordinator
+from wnsm.utils import before, today
+
+
+def _messwert(day: int, wh):
+    return {
+        "messwert": wh,
+        "zeitVon": f"2023-04-{day:02d}T22:00:00.000Z",
+        "zeitBis": f"2023-04-{day + 1:02d}T22:00:00.000Z",
+        "qualitaet": "VAL",
+    }
+
+
+class HistoricalDataClient:
+    def __init__(self, response: dict):
+        self.response = response
+        self.queries = []
+
+    async def historical_data(self, zaehlpunkt, date_from, date_until, value_type):
+        self.queries.append((zaehlpunkt, date_from, date_until, value_type))
+        return self.response
+
+
+def test_latest_meter_reading():
+    # the messwerte are not necessarily ordered by time
+    messwerte = [_messwert(20, 4_000_000), _messwert(22, 4_020_000), _messwert(21, 4_010_000)]
+    assert AsyncSmartmeter.latest_meter_reading(messwerte) == MeterReading(
+        4020.0, datetime(2023, 4, 22, 22, tzinfo=timezone.utc)
+    )
+
+
+def test_latest_meter_reading_skips_missing_values():
+    messwerte = [_messwert(20, 4_000_000), _messwert(21, 4_010_000), _messwert(22, None), {"messwert": 1, "zeitVon": None}]
+    assert AsyncSmartmeter.latest_meter_reading(messwerte) == MeterReading(
+        4010.0, datetime(2023, 4, 21, 22, tzinfo=timezone.utc)
+    )
+    assert AsyncSmartmeter.latest_meter_reading([_messwert(22, None)]) is None
+    assert AsyncSmartmeter.latest_meter_reading([]) is None
+
+
+@pytest.mark.parametrize("response", [{"messwerte": None}, {"messwerte": []}, {}])
+def test_get_latest_meter_reading_without_messwerte(response):
+    client = HistoricalDataClient(response)
+    start, end = datetime(2023, 4, 21), datetime(2023, 4, 23)
+    assert asyncio.run(AsyncSmartmeter(None, client).get_latest_meter_reading("AT1", start, end)) is None
+    # both days are queried at once
+    assert client.queries == [("AT1", start, end, ValueType.METER_READ)]
+
+
+def test_get_latest_meter_reading():
+    client = HistoricalDataClient({"messwerte": [_messwert(21, 4_010_000), _messwert(22, 4_020_000)]})
+    reading = asyncio.run(AsyncSmartmeter(None, client).get_latest_meter_reading(
+        "AT1", datetime(2023, 4, 21), datetime(2023, 4, 23)))
+    assert reading.value == 4020.0
+
+
+def test_meter_reading_is_queried_until_yesterday_is_known():
+    assert WNSMCoordinator._needs_meter_reading(None)
+    # the reading of the day before yesterday is not the latest one, yesterday's is queried
+    assert WNSMCoordinator._needs_meter_reading(before(today(), 2).astimezone())
+    # once yesterday's reading is known, the api is not queried again until the next day
+    assert not WNSMCoordinator._needs_meter_reading(before(today(), 1).astimezone())
+    assert not WNSMCoordinator._needs_meter_reading(before(today(), 1).astimezone() + timedelta(hours=1))
+    assert not WNSMCoordinator._needs_meter_reading(today().astimezone())
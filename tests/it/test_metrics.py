@@ -0,0 +1,140 @@
+"""Metrics tests"""
+import asyncio
+from urllib import parse
+
+import pytest
+from aioresponses import aioresponses
+from requests_mock import Mocker
+
+from it import (
+    API_URL_B2C,
+    async_smartmeter,
+    enabled,
+    expect_async_login,
+    expect_async_zaehlpunkte,
+    expect_history,
+    expect_login,
+    expect_zaehlpunkte,
+    mock_authenticate,
+    mock_login_page,
+    smartmeter,
+    zaehlpunkt,
+    zaehlpunkt_response,
+    PASSWORD,
+    USERNAME,
+)
+from wnsm.api.errors import SmartmeterConnectionError
+from wnsm.api.metrics import Histogram, MetricsRegistry, endpoint_name
+
+
+def test_endpoint_name():
+    assert "zaehlpunkte" == endpoint_name("zaehlpunkte")
+    assert "zaehlpunkte/{id}/{id}/messwerte" == endpoint_name(
+        "zaehlpunkte/1234567/AT0010000000000000001000004392265/messwerte?datumVon=2023-01-01")
+    assert "user/messwerte/bewegungsdaten" == endpoint_name("user/messwerte/bewegungsdaten?zaehlpunktnummer=AT1")
+    assert "user/ereignis/{id}" == endpoint_name("user/ereignis/42")
+
+
+def test_histogram():
+    histogram = Histogram((1.0, 2.0, 5.0))
+    for value in (0.5, 1.5, 1.7, 3.0, 10.0):
+        histogram.observe(value)
+    assert 5 == histogram.count
+    assert 0.5 == histogram.min
+    assert 10.0 == histogram.max
+    assert 2.0 == histogram.quantile(0.5)
+    assert 10.0 == histogram.quantile(1.0)
+    assert {"1.0": 1, "2.0": 2, "5.0": 1, "+Inf": 1} == histogram.as_dict()["buckets"]
+    assert Histogram((1.0,)).quantile(0.5) is None
+
+
+def test_registry_counts_errors():
+    registry = MetricsRegistry()
+    registry.record_request("zaehlpunkte", 0.1, 200, 100)
+    registry.record_request("zaehlpunkte", 0.2, 503, 10, retry=True)
+    registry.record_request("zaehlpunkte", 0.3, error=ConnectionResetError("reset"), retry=True)
+    stats = registry.snapshot()["zaehlpunkte"]
+    assert 3 == stats["requests"]
+    assert 2 == stats["retries"]
+    assert {"200": 1, "503": 1} == stats["statuses"]
+    assert {"HTTP 503": 1, "ConnectionResetError": 1} == stats["errors"]
+    assert "ConnectionResetError: reset" == stats["last_error"]
+    summary = registry.summary()
+    assert 3 == summary["requests"]
+    assert 2 == summary["errors"]
+    assert 0.2 == pytest.approx(summary["mean_latency"])
+
+
+def test_registry_records_loop_holds():
+    registry = MetricsRegistry()
+    assert registry.summary()["max_loop_hold"] is None
+    for hold in (0.0005, 0.002, 0.3):
+        registry.record_loop_hold("import", hold)
+    holds = registry.loop_holds()["import"]
+    assert 3 == holds["count"]
+    assert 0.3 == holds["max"]
+    assert 0.3 == registry.summary()["max_loop_hold"]
+    registry.reset()
+    assert {} == registry.loop_holds()
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_login_steps_and_api_calls_are_recorded(requests_mock: Mocker):
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+    expect_history(requests_mock, z["geschaeftspartner"], z["zaehlpunkte"][0]['zaehlpunktnummer'])
+    sm = smartmeter().login()
+    sm.historical_data()
+
+    snapshot = sm.metrics.snapshot()
+    assert {"login/page", "login/credentials", "login/tokens", "app-config", "zaehlpunkte",
+            "zaehlpunkte/{id}/{id}/messwerte"} == set(snapshot)
+    assert 1 == snapshot["zaehlpunkte"]["requests"]
+    assert 1 == snapshot["zaehlpunkte"]["decode"]["count"]
+    assert snapshot["zaehlpunkte"]["size"]["sum"] > 0
+    assert {"200": 1} == snapshot["zaehlpunkte/{id}/{id}/messwerte"]["statuses"]
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_failing_login_step_is_recorded(requests_mock: Mocker):
+    mock_login_page(requests_mock, status=500)
+    mock_authenticate(requests_mock, USERNAME, PASSWORD)
+    sm = smartmeter()
+    with pytest.raises(SmartmeterConnectionError):
+        sm.login()
+    assert {"SmartmeterConnectionError": 1} == sm.metrics.snapshot()["login/page"]["errors"]
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_retries_are_recorded(requests_mock: Mocker):
+    expect_login(requests_mock)
+    requests_mock.get(parse.urljoin(API_URL_B2C, 'zaehlpunkte'), [
+        {"status_code": 503, "json": {}},
+        {"status_code": 200, "json": zaehlpunkt_response([enabled(zaehlpunkt())])},
+    ])
+    sm = smartmeter().login()
+    sm.zaehlpunkte()
+    stats = sm.metrics.snapshot()["zaehlpunkte"]
+    assert 2 == stats["requests"]
+    assert 1 == stats["retries"]
+    assert {"HTTP 503": 1} == stats["errors"]
+
+
+def test_async_api_calls_are_recorded():
+    async def run():
+        sm = async_smartmeter()
+        try:
+            await sm.login()
+            await sm.zaehlpunkte()
+            return sm.metrics.snapshot()
+        finally:
+            await sm.close()
+
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        snapshot = asyncio.run(run())
+    assert {"login/page", "login/credentials", "login/tokens", "app-config", "zaehlpunkte"} == set(snapshot)
+    assert {"200": 1} == snapshot["zaehlpunkte"]["statuses"]
+    assert 1 == snapshot["zaehlpunkte"]["decode"]["count"]
@@ -0,0 +1,83 @@
+"""Response model tests"""
+import pytest
+from requests_mock import Mocker
+
+from it import (
+    bewegungsdaten_response,
+    enabled,
+    expect_login,
+    expect_zaehlpunkte,
+    history_response,
+    smartmeter,
+    zaehlpunkt,
+    zaehlpunkt_feeding,
+    zaehlpunkt_response,
+)
+from wnsm.api.constants import AnlagenType
+from wnsm.api.errors import SmartmeterQueryError
+from wnsm.api.models import (
+    BewegungsdatenDescriptor,
+    Contract,
+    HistoricalDataHeader,
+    Zaehlpunkt,
+    contracts_from_json,
+)
+from wnsm.const import ATTRS_BEWEGUNGSDATEN, ATTRS_HISTORIC_DATA, ATTRS_ZAEHLPUNKTE_CALL
+from wnsm.utils import translate_dict
+
+
+@pytest.mark.parametrize("zp", [enabled(zaehlpunkt()), zaehlpunkt_feeding()])
+def test_zaehlpunkt_attributes_match_attribute_mapping(zp):
+    model = Zaehlpunkt.from_json(zp, "1234567890")
+    assert model.as_attributes() == translate_dict({**zp, "geschaeftspartner": "1234567890"}, ATTRS_ZAEHLPUNKTE_CALL)
+    assert model.zaehlpunktnummer == zp["zaehlpunktnummer"]
+    assert model.anlagetype in (AnlagenType.CONSUMING, AnlagenType.FEEDING)
+
+
+def test_zaehlpunkt_without_nummer_is_invalid():
+    with pytest.raises(SmartmeterQueryError):
+        Zaehlpunkt.from_json({"customLabel": "x"})
+
+
+def test_contracts_from_json():
+    contracts = contracts_from_json(zaehlpunkt_response([enabled(zaehlpunkt()), zaehlpunkt_feeding()]))
+    assert len(contracts) == 1
+    assert isinstance(contracts[0], Contract)
+    assert contracts[0].customer_id == "1234567890"
+    assert [zp.customer_id for zp in contracts[0].zaehlpunkte] == ["1234567890", "1234567890"]
+    assert contracts_from_json(None) == ()
+    assert contracts_from_json([{"geschaeftspartner": "1"}]) == (Contract("1", ()),)
+
+
+def test_contracts_skip_zaehlpunkte_without_nummer(caplog):
+    response = zaehlpunkt_response([enabled(zaehlpunkt()), {"customLabel": "x"}, zaehlpunkt_feeding()])
+    contracts = contracts_from_json(response)
+    assert [zp.zaehlpunktnummer for zp in contracts[0].zaehlpunkte] == [
+        zaehlpunkt()["zaehlpunktnummer"], zaehlpunkt_feeding()["zaehlpunktnummer"]
+    ]
+    assert "Skipping zaehlpunkt of contract 1234567890" in caplog.text
+
+
+def test_descriptor_attributes_match_attribute_mapping():
+    response = bewegungsdaten_response("1234567890", "AT0010000000000000001000004392265", values_count=2)
+    attributes = {**BewegungsdatenDescriptor.from_json(response["descriptor"]).as_attributes(), "values": response["values"]}
+    assert attributes == translate_dict(response, ATTRS_BEWEGUNGSDATEN)
+    assert BewegungsdatenDescriptor.from_json(None) == BewegungsdatenDescriptor(None, None, None, None, None, None)
+
+
+def test_historical_data_header_matches_attribute_mapping():
+    zaehlwerk = history_response("AT0010000000000000001000004392265")["zaehlwerke"][0]
+    attributes = {**HistoricalDataHeader.from_json(zaehlwerk).as_attributes(), "values": zaehlwerk["messwerte"]}
+    assert attributes == translate_dict(zaehlwerk, ATTRS_HISTORIC_DATA)
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_contracts_are_cached_with_zaehlpunkte(requests_mock: Mocker):
+    zp = enabled(zaehlpunkt())
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [zp])
+    client = smartmeter().login()
+    contracts = client.contracts()
+    assert client.contracts() is contracts
+    assert client.zaehlpunkt_info(zp["zaehlpunktnummer"]) is contracts[0].zaehlpunkte[0]
+    assert len([r for r in requests_mock.request_history if r.path.endswith("/zaehlpunkte")]) == 1
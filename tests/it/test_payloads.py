@@ -0,0 +1,54 @@
+"""Tests of the debug logging of payloads"""
+import logging
+
+import pytest
+
+from wnsm.api import payloads
+
+
+class Exploding:
+    def __str__(self):
+        raise AssertionError("payload has been formatted")
+
+
+@pytest.fixture
+def full_logger():
+    full = logging.getLogger(payloads.__name__ + ".full")
+    yield full
+    full.setLevel(logging.NOTSET)
+
+
+def test_nothing_formatted_unless_debug(caplog):
+    caplog.set_level(logging.INFO, logger=payloads.__name__)
+    payloads.log_exchange("https://example.com", {"a": Exploding()}, {"values": [Exploding()]})
+    payloads.log_payload("Returned data: %s", Exploding())
+    assert caplog.records == []
+
+
+def test_payloads_sampled_and_truncated(caplog):
+    caplog.set_level(logging.DEBUG, logger=payloads.__name__)
+    payloads.log_exchange("https://example.com/api", None, {"descriptor": {"einheit": "KWH"}, "values": list(range(1000))})
+    message = caplog.records[-1].getMessage()
+    assert "API Request: https://example.com/api" in message
+    assert "body: " not in message
+    assert '"einheit": "KWH"' in message
+    assert "995 more items" in message
+    assert "999" not in message
+
+    payloads.log_payload("Raw: %s", b"x" * (payloads.PAYLOAD_LOG_LIMIT * 2))
+    message = caplog.records[-1].getMessage()
+    assert message.endswith(f"... (truncated, {payloads.PAYLOAD_LOG_LIMIT * 2} in total)")
+    assert len(message) < payloads.PAYLOAD_LOG_LIMIT + 100
+
+
+def test_full_payloads_on_request(caplog, full_logger):
+    caplog.set_level(logging.DEBUG)
+    assert not payloads.is_full()
+
+    full_logger.setLevel(logging.DEBUG)
+    assert payloads.is_full()
+    payloads.log_exchange("https://example.com/api", {"query": 1}, {"values": list(range(1000))})
+    message = caplog.records[-1].getMessage()
+    assert 'body: {\n  "query": 1\n}' in message
+    assert "999" in message
+    assert "more items" not in message
@@ -0,0 +1,166 @@
+"""Range fetcher tests"""
+import asyncio
+import datetime as dt
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from wnsm.api import range_fetcher
+from wnsm.api.client import Smartmeter
+from wnsm.api.errors import SmartmeterConnectionError
+
+
+def test_split_range_in_months():
+    windows = range_fetcher.split_range(dt.datetime(2023, 1, 15, 6, 0), dt.date(2023, 3, 20))
+    assert windows == [
+        (dt.datetime(2023, 1, 15, 6, 0), dt.date(2023, 2, 14)),
+        (dt.date(2023, 2, 15), dt.date(2023, 3, 14)),
+        (dt.date(2023, 3, 15), dt.date(2023, 3, 20)),
+    ]
+
+
+def test_split_range_single_day():
+    windows = range_fetcher.split_range(dt.date(2023, 1, 1), dt.date(2023, 1, 1), dt.timedelta(days=7))
+    assert windows == [(dt.date(2023, 1, 1), dt.date(2023, 1, 1))]
+
+
+def test_split_range_empty():
+    assert range_fetcher.split_range(dt.date(2023, 1, 2), dt.date(2023, 1, 1)) == []
+
+
+def test_default_range():
+    assert Smartmeter._default_range(dt.date(2023, 1, 1), dt.date(2023, 2, 1)) == (dt.date(2023, 1, 1), dt.date(2023, 2, 1))
+    assert Smartmeter._default_range(None, dt.date(2023, 2, 1)) == (dt.date(2020, 2, 1), dt.date(2023, 2, 1))
+    assert Smartmeter._default_range() == (dt.date.today() - relativedelta(years=3), dt.date.today())
+    assert Smartmeter._historical_data_query(None, dt.date(2023, 2, 1))["datumVon"] == "2020-02-01"
+
+
+def test_split_window():
+    assert range_fetcher.split_window((dt.date(2023, 1, 1), dt.date(2023, 1, 4))) == [
+        (dt.date(2023, 1, 1), dt.date(2023, 1, 2)),
+        (dt.date(2023, 1, 3), dt.date(2023, 1, 4)),
+    ]
+    assert range_fetcher.split_window((dt.date(2023, 1, 1), dt.date(2023, 1, 1))) == [
+        (dt.date(2023, 1, 1), dt.date(2023, 1, 1)),
+    ]
+
+
+def test_fetch_windows_keeps_order_and_limits_concurrency():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fetch(start, end):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # later windows finish first
+        await asyncio.sleep(0.001 * (12 - start.month))
+        in_flight -= 1
+        return start.month
+
+    windows = range_fetcher.split_range(dt.date(2023, 1, 1), dt.date(2023, 12, 31), relativedelta(months=1))
+    results = asyncio.run(range_fetcher.fetch_windows(fetch, windows, max_concurrency=3))
+    assert results == list(range(1, 13))
+    assert max_in_flight == 3
+
+
+def test_fetch_windows_does_not_retry_errors():
+    # transient errors are retried per request by the client already, 4xx errors are not transient at all
+    calls = []
+
+    async def fetch(start, end):
+        calls.append(start)
+        raise SmartmeterConnectionError("boom", code=404)
+
+    with pytest.raises(SmartmeterConnectionError):
+        asyncio.run(range_fetcher.fetch_windows(
+            fetch, [(dt.date(2023, 1, 1), dt.date(2023, 1, 31))], retries=2, retry_delay=0))
+    assert len(calls) == 1
+
+
+def test_fetch_windows_cancels_pending_windows_on_failure():
+    started, cancelled = [], []
+
+    async def fetch(start, end):
+        started.append(start)
+        if start.month == 2:
+            raise SmartmeterConnectionError("boom")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(start)
+            raise
+
+    async def fetch_all():
+        with pytest.raises(SmartmeterConnectionError):
+            await range_fetcher.fetch_windows(fetch, windows, max_concurrency=3)
+        # as the error is raised, not once the loop is closed
+        return list(cancelled)
+
+    windows = range_fetcher.split_range(dt.date(2023, 1, 1), dt.date(2023, 6, 30), relativedelta(months=1))
+    cancelled_on_failure = asyncio.run(fetch_all())
+    # the windows in flight are cancelled instead of left running, the remaining ones are never started
+    assert sorted(cancelled_on_failure) == sorted(start for start in started if start.month != 2)
+    assert len(started) < len(windows)
+
+
+def test_fetch_windows_retries_timeouts_of_a_single_day():
+    calls = []
+
+    async def fetch(start, end):
+        calls.append(start)
+        if len(calls) < 3:
+            raise TimeoutError()
+        return "ok"
+
+    results = asyncio.run(range_fetcher.fetch_windows(
+        fetch, [(dt.date(2023, 1, 1), dt.date(2023, 1, 1))], retries=2, retry_delay=0))
+    assert results == ["ok"]
+    assert len(calls) == 3
+
+
+def test_fetch_windows_gives_up_after_retries():
+    async def fetch(start, end):
+        raise TimeoutError()
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(range_fetcher.fetch_windows(
+            fetch, [(dt.date(2023, 1, 1), dt.date(2023, 1, 1))], retries=1, retry_delay=0))
+
+
+def test_fetch_windows_splits_window_on_timeout():
+    async def fetch(start, end):
+        if (end - start).days > 7:
+            raise TimeoutError()
+        return start, end
+
+    results = asyncio.run(range_fetcher.fetch_windows(
+        fetch, [(dt.date(2023, 1, 1), dt.date(2023, 1, 31))], retry_delay=0))
+    assert results[0][0] == dt.date(2023, 1, 1)
+    assert results[-1][1] == dt.date(2023, 1, 31)
+    for (_, end), (start, _) in zip(results, results[1:]):
+        assert start == end + dt.timedelta(days=1)
+
+
+def test_merge_bewegungsdaten_drops_overlap():
+    responses = [
+        {"zaehlpunkt": "AT1", "values": [{"zeitpunktVon": "2023-01-01T00:00:00Z"},
+                                         {"zeitpunktVon": "2023-01-01T01:00:00Z"}]},
+        {"zaehlpunkt": "AT1", "values": [{"zeitpunktVon": "2023-01-01T01:00:00Z"},
+                                         {"zeitpunktVon": "2023-01-01T02:00:00Z"}]},
+        {"zaehlpunkt": "AT1", "values": []},
+    ]
+    merged = range_fetcher.merge_bewegungsdaten(responses)
+    assert merged["zaehlpunkt"] == "AT1"
+    assert [v["zeitpunktVon"] for v in merged["values"]] == [
+        "2023-01-01T00:00:00Z", "2023-01-01T01:00:00Z", "2023-01-01T02:00:00Z"]
+
+
+def test_merge_historical_data():
+    responses = [
+        {"obisCode": "1-1:1.8.0", "messwerte": [{"zeitVon": "2023-01-01T00:00:00Z", "messwert": 1}]},
+        {"obisCode": "1-1:1.8.0", "messwerte": [{"zeitVon": "2023-02-01T00:00:00Z", "messwert": 2}]},
+    ]
+    merged = range_fetcher.merge_historical_data(responses)
+    assert [v["messwert"] for v in merged["messwerte"]] == [1, 2]
+    assert range_fetcher.merge_historical_data([]) == {}
@@ -0,0 +1,166 @@
+"""MeasurementSeries tests"""
+import asyncio
+import datetime as dt
+import re
+import sys
+
+import pytest
+from aioresponses import aioresponses
+from requests_mock import Mocker
+
+from it import (
+    async_smartmeter,
+    bewegungsdaten,
+    bewegungsdaten_response,
+    enabled,
+    expect_async_login,
+    expect_async_zaehlpunkte,
+    expect_bewegungsdaten,
+    expect_login,
+    expect_zaehlpunkte,
+    history_response,
+    smartmeter,
+    zaehlpunkt,
+    zaehlpunkt_response,
+)
+from wnsm.api.series import MeasurementSeries, SeriesBuilder
+
+UTC = dt.timezone.utc
+
+
+def _values():
+    return [
+        {"wert": 0.25, "zeitpunktVon": "2023-01-01T00:00:00.000Z", "zeitpunktBis": "2023-01-01T00:15:00.000Z",
+         "geschaetzt": False},
+        {"wert": None, "zeitpunktVon": "2023-01-01T00:15:00.000Z", "zeitpunktBis": "2023-01-01T00:30:00.000Z",
+         "geschaetzt": False},
+        {"wert": 0.5, "zeitpunktVon": "2023-01-01T00:30:00.000Z", "zeitpunktBis": "2023-01-01T00:45:00.000Z",
+         "geschaetzt": True},
+    ]
+
+
+def test_series_round_trip():
+    series = MeasurementSeries.from_values(_values())
+    assert 3 == len(series)
+    assert series.to_dicts() == _values()
+    assert series.is_missing(1)
+    assert series.is_estimated(2)
+    assert 0.75 == series.total()
+
+
+def test_series_items_and_iteration():
+    series = MeasurementSeries.from_values(_values())
+    first = series[0]
+    assert dt.datetime(2023, 1, 1, 0, 0, tzinfo=UTC) == first.start
+    assert dt.datetime(2023, 1, 1, 0, 15, tzinfo=UTC) == first.end
+    assert 0.25 == first.value
+    assert not first.estimated
+    assert series[-1].estimated
+    assert [None, 0.5] == [m.value for m in series][1:]
+    with pytest.raises(IndexError):
+        series[3]
+
+
+def test_series_slicing():
+    series = MeasurementSeries.from_values(_values())
+    tail = series[1:]
+    assert 2 == len(tail)
+    assert tail.is_missing(0)
+    assert tail.is_estimated(1)
+    assert tail.to_dicts() == _values()[1:]
+    assert series[::2].to_dicts() == _values()[::2]
+    assert 0 == len(series[5:])
+
+
+def test_series_keeps_integers():
+    values = bewegungsdaten(count=20, timestamp=dt.datetime(2023, 1, 1), interval="qh")
+    for i, value in enumerate(values):
+        value["wert"] = i
+    series = MeasurementSeries.from_values(values)
+    assert "q" == series.values.typecode
+    assert 190 == series.total()
+
+    values[-1]["wert"] = 0.5
+    series = MeasurementSeries.from_values(values)
+    assert "d" == series.values.typecode
+    assert 171.5 == series.total()
+
+
+def test_series_is_compact():
+    values = bewegungsdaten(count=4 * 24 * 365, timestamp=dt.datetime(2022, 1, 1), interval="qh")
+    series = MeasurementSeries.from_values(values)
+    assert series.nbytes == 3 * 8 * len(values) + 2 * (len(values) // 8)
+    dict_size = sum(sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value.values()) for value in values)
+    assert series.nbytes < dict_size / 10
+
+
+def test_series_from_messwerte():
+    messwerte = history_response("AT1")["zaehlwerke"][0]["messwerte"]
+    series = MeasurementSeries.from_messwerte(messwerte)
+    assert series.to_dicts() == messwerte
+    assert 7256686 == series[0].value
+
+
+def test_series_concat_drops_overlap():
+    first = MeasurementSeries.from_values(_values()[:2])
+    second = MeasurementSeries.from_values(_values()[1:])
+    merged = MeasurementSeries.concat([first, second])
+    assert merged.to_dicts() == _values()
+    assert 0 == len(MeasurementSeries.concat([]))
+
+
+def test_series_builder_appends_raw_values():
+    builder = SeriesBuilder()
+    for i in range(10):
+        builder.append_raw(i * 900, (i + 1) * 900, i, estimated=i == 9, missing=i == 8)
+    series = builder.build()
+    assert 10 == len(series)
+    assert series.is_estimated(9)
+    assert series[8].value is None
+    assert 37 == series.total()
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_bewegungsdaten_series(requests_mock: Mocker):
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zpn = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    date_from = dt.datetime(2023, 4, 21)
+    date_until = dt.datetime(2023, 5, 1)
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+    expect_bewegungsdaten(requests_mock, z["geschaeftspartner"], zpn, date_from, date_until, values_count=50)
+
+    sm = smartmeter().login()
+    response = sm.bewegungsdaten_series(None, date_from, date_until)
+    values = sm.bewegungsdaten(None, date_from, date_until)["values"]
+    assert [v["wert"] for v in values] == [m.value for m in response["values"]]
+    assert zpn == response["descriptor"]["zaehlpunktnummer"]
+
+
+def test_async_bewegungsdaten_series():
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zp = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        for day in (1, 3):
+            response = bewegungsdaten_response(z["geschaeftspartner"], zp)
+            response["values"] = bewegungsdaten(count=48, timestamp=dt.datetime(2023, 1, day), interval="h")
+            m.get(re.compile(r'.*/user/messwerte/bewegungsdaten\?.*' + f'zeitpunktVon=2023-01-0{day}'),
+                  payload=response)
+
+        async def run():
+            sm = async_smartmeter()
+            try:
+                await sm.login()
+                return await sm.bewegungsdaten_series(zp, dt.date(2023, 1, 1), dt.date(2023, 1, 4),
+                                                      window=dt.timedelta(days=2))
+            finally:
+                await sm.close()
+
+        result = asyncio.run(run())
+    series = result["values"]
+    assert 96 == len(series)
+    assert dt.datetime(2023, 1, 1, tzinfo=UTC) == series[0].start
+    assert dt.datetime(2023, 1, 4, 23, tzinfo=UTC) == series[-1].start
+    assert zp == result["descriptor"]["zaehlpunktnummer"]
@@ -0,0 +1,97 @@
+"""End to end tests of the clients against the local stand-in server"""
+import asyncio
+import datetime as dt
+
+import aiohttp
+import pytest
+
+from it import smartmeter
+from standin import StandInConfig, StandInServer, day_wh, meter_reading_wh, quarter_hour_wh
+from wnsm import api
+from wnsm.api.constants import ValueType
+from wnsm.api.errors import SmartmeterLoginError
+
+YESTERDAY = dt.date.today() - dt.timedelta(days=1)
+
+
+@pytest.fixture
+def stand_in():
+    with StandInServer(StandInConfig(zaehlpunkte=2)) as server, server.patch_constants():
+        yield server
+
+
+def test_login_and_queries(stand_in):
+    client = smartmeter().login()
+    zp = stand_in.config.zaehlpunktnummern()[1]
+    assert [info.zaehlpunktnummer for contract in client.contracts() for info in contract.zaehlpunkte] == \
+        stand_in.config.zaehlpunktnummern()
+
+    day = YESTERDAY - dt.timedelta(days=1)
+    data = client.bewegungsdaten(zp, day, day)
+    assert len(data["values"]) == 96
+    start = int(dt.datetime(day.year, day.month, day.day, tzinfo=dt.timezone.utc).timestamp())
+    assert data["values"][5]["wert"] == quarter_hour_wh(zp, start + 5 * 900) / 1000
+
+    readings = client.historical_data(zp, day, YESTERDAY)
+    assert readings["obisCode"] == "1-1:1.8.0"
+    assert [m["messwert"] for m in readings["messwerte"]] == [meter_reading_wh(zp, day), meter_reading_wh(zp, YESTERDAY)]
+    assert meter_reading_wh(zp, YESTERDAY) - meter_reading_wh(zp, day) == day_wh(zp, day)
+
+    assert len(client.ereignisse(dt.datetime(2024, 1, 1), dt.datetime(2024, 1, 29), zp)) == 4
+    # the session keeps the connection alive
+    assert stand_in.stats["connections"] < sum(
+        count for name, count in stand_in.stats.items() if name not in ("connections", "errors")
+    )
+
+
+def test_wrong_password(stand_in):
+    with pytest.raises(SmartmeterLoginError):
+        smartmeter(password="wrong").login()
+
+
+def test_refresh_and_expired_tokens(stand_in):
+    stand_in.config.access_token_lifetime = 30  # within the refresh margin
+    client = smartmeter().login()
+    client.login()
+    assert stand_in.stats["login/refresh"] == 1
+    assert stand_in.stats["login/page"] == 1
+
+    # the rejected refresh token falls back to a login with credentials
+    stand_in.expire_tokens(refresh=True)
+    assert client.zaehlpunkte()
+    assert stand_in.stats["login/refresh"] == 2
+    assert stand_in.stats["login/page"] == 2
+
+
+def test_rejected_access_token_is_recorded(stand_in):
+    client = smartmeter().login()
+    stand_in.expire_tokens()
+    client.zaehlpunkte()
+    assert client.metrics.snapshot()["zaehlpunkte"]["statuses"] == {"401": 1}
+
+
+def test_injected_errors_are_retried(stand_in):
+    client = smartmeter().login()
+    stand_in.fail_next(2, 503)
+    assert client.zaehlpunkte()
+    assert stand_in.stats["errors"] == 2
+    assert stand_in.stats["zaehlpunkte"] == 3
+
+
+def test_async_client_fetches_windows_concurrently(stand_in):
+    stand_in.config.latency = 0.02
+    zp = stand_in.config.zaehlpunktnummern()[0]
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            client = api.AsyncSmartmeterClient(stand_in.config.username, stand_in.config.password, session=session,
+                                               request_policy=api.RequestPolicy(backoff=0),
+                                               rate_limiter=api.RateLimiter(rate=1000))
+            await client.login()
+            return await client.bewegungsdaten_series(zp, YESTERDAY - dt.timedelta(days=59), YESTERDAY,
+                                                      ValueType.QUARTER_HOUR, window=dt.timedelta(days=10))
+
+    series = asyncio.run(run())
+    assert len(series["values"]) == 60 * 96
+    assert stand_in.stats["bewegungsdaten"] == 6
+    assert list(series["values"].starts) == sorted(set(series["values"].starts))
@@ -0,0 +1,172 @@
+"""Streaming decoder tests"""
+import asyncio
+import datetime as dt
+import json
+import re
+
+import pytest
+from aioresponses import aioresponses
+from requests_mock import Mocker
+
+from it import (
+    async_smartmeter,
+    bewegungsdaten_response,
+    enabled,
+    expect_async_login,
+    expect_async_zaehlpunkte,
+    expect_bewegungsdaten,
+    expect_login,
+    expect_zaehlpunkte,
+    smartmeter,
+    zaehlpunkt,
+    zaehlpunkt_response,
+)
+from wnsm.api.errors import SmartmeterConnectionError, SmartmeterQueryError
+from wnsm.api.streaming import JsonArrayStream
+
+
+def _stream(document: bytes, key: str, chunk_size: int):
+    parser = JsonArrayStream(key)
+    items = []
+    for i in range(0, len(document), chunk_size):
+        items.extend(parser.feed(document[i:i + chunk_size]))
+    return items, parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 1 << 20])
+def test_stream_matches_json_loads(chunk_size):
+    document = {
+        "descriptor": {"zaehlpunktnummer": "AT1", "values": ["not", "streamed"], "note": "a \"values\": [ ] b"},
+        "values": [
+            {"wert": 1.25, "zeitpunktVon": "2023-01-01T00:00:00Z", "geschaetzt": False},
+            {"wert": None, "zeitpunktVon": "2023-01-01T00:15:00Z", "nested": [[1, 2], {"values": []}]},
+            {"wert": 3, "zeitpunktVon": "2023-01-01T00:30:00Z", "text": "Zählerstand ] , ["},
+            12345,
+        ],
+        "trailer": [1, 2, 3],
+    }
+    items, envelope = _stream(json.dumps(document, ensure_ascii=False).encode("utf-8"), "values", chunk_size)
+    assert items == document["values"]
+    assert envelope == {**document, "values": []}
+
+
+def test_stream_compact_and_empty():
+    items, envelope = _stream(b'{"values":[],"descriptor":{}}', "values", 3)
+    assert items == []
+    assert envelope == {"values": [], "descriptor": {}}
+
+
+def test_stream_without_key():
+    items, envelope = _stream(b'{"descriptor": {"einheit": "KWH"}}', "values", 5)
+    assert items == []
+    assert envelope == {"descriptor": {"einheit": "KWH"}}
+
+
+def test_stream_truncated_document():
+    parser = JsonArrayStream("values")
+    assert [{"wert": 1}] == parser.feed(b'{"values": [{"wert": 1}, {"wert"')
+    with pytest.raises(SmartmeterQueryError):
+        parser.close()
+
+
+def test_stream_invalid_document():
+    parser = JsonArrayStream("values")
+    parser.feed(b"<html>Service unavailable</html>")
+    with pytest.raises(SmartmeterQueryError):
+        parser.close()
+
+
+def test_stream_invalid_encoding():
+    parser = JsonArrayStream("values")
+    with pytest.raises(SmartmeterQueryError):
+        parser.feed(b'{"values": [{"wert": "\xff\xfe"}]}')
+        parser.close()
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_bewegungsdaten_stream(requests_mock: Mocker):
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zpn = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    date_from = dt.datetime(2023, 4, 21)
+    date_until = dt.datetime(2023, 5, 1)
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+    expect_bewegungsdaten(requests_mock, z["geschaeftspartner"], zpn, date_from, date_until, values_count=500)
+
+    sm = smartmeter().login()
+    parser = JsonArrayStream("values")
+    values = list(sm.bewegungsdaten_stream(None, date_from, date_until, parser=parser))
+
+    assert values == sm.bewegungsdaten(None, date_from, date_until)["values"]
+    assert 500 == len(values)
+    assert zpn == parser.envelope["descriptor"]["zaehlpunktnummer"]
+    stats = sm.metrics.snapshot()["user/messwerte/bewegungsdaten"]
+    assert 2 == stats["decode"]["count"]
+    assert 2 == stats["size"]["count"]
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_bewegungsdaten_stream_wrong_zp(requests_mock: Mocker):
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zpn = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    date_from = dt.datetime(2023, 4, 21)
+    date_until = dt.datetime(2023, 5, 1)
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+    expect_bewegungsdaten(requests_mock, z["geschaeftspartner"], zpn, date_from, date_until, wrong_zp=True)
+    with pytest.raises(SmartmeterQueryError):
+        list(smartmeter().login().bewegungsdaten_stream(None, date_from, date_until))
+
+
+@pytest.mark.usefixtures("requests_mock")
+def test_bewegungsdaten_stream_failing_request(requests_mock: Mocker):
+    expect_login(requests_mock)
+    expect_zaehlpunkte(requests_mock, [enabled(zaehlpunkt())])
+    requests_mock.get(re.compile(r'.*/user/messwerte/bewegungsdaten\?.*'), status_code=404, json={})
+    with pytest.raises(SmartmeterConnectionError) as exc_info:
+        list(smartmeter().login().bewegungsdaten_stream(None, dt.date(2023, 4, 21), dt.date(2023, 5, 1)))
+    assert 404 == exc_info.value.code
+
+
+def test_async_bewegungsdaten_stream():
+    z = zaehlpunkt_response([enabled(zaehlpunkt())])[0]
+    zp = z["zaehlpunkte"][0]['zaehlpunktnummer']
+    response = bewegungsdaten_response(z["geschaeftspartner"], zp, values_count=300)
+
+    async def run():
+        sm = async_smartmeter()
+        try:
+            await sm.login()
+            parser = JsonArrayStream("values")
+            values = [value async for value in sm.bewegungsdaten_stream(
+                zp, dt.date(2023, 4, 21), dt.date(2023, 5, 1), parser=parser)]
+            return values, parser.envelope
+        finally:
+            await sm.close()
+
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        m.get(re.compile(r'.*/user/messwerte/bewegungsdaten\?.*'), payload=response)
+        values, envelope = asyncio.run(run())
+    assert values == response["values"]
+    assert envelope["descriptor"] == response["descriptor"]
+
+
+def test_async_bewegungsdaten_stream_non_json_response():
+    zp = zaehlpunkt()["zaehlpunktnummer"]
+
+    async def run():
+        sm = async_smartmeter()
+        try:
+            await sm.login()
+            return [value async for value in sm.bewegungsdaten_stream(zp, dt.date(2023, 4, 21), dt.date(2023, 5, 1))]
+        finally:
+            await sm.close()
+
+    with aioresponses() as m:
+        expect_async_login(m)
+        expect_async_zaehlpunkte(m, [enabled(zaehlpunkt())])
+        m.get(re.compile(r'.*/user/messwerte/bewegungsdaten\?.*'), body="<html>Wartungsarbeiten</html>")
+        with pytest.raises(SmartmeterQueryError):
+            asyncio.run(run())
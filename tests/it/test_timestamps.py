@@ -0,0 +1,66 @@
+"""Timestamp decoder tests"""
+import datetime as dt
+
+import pytest
+
+from wnsm.api.timestamps import TimestampDecoder, parse_epoch
+
+UTC = dt.timezone.utc
+
+
+def _quarter_hours(start: dt.datetime, count: int, fmt: str = "%Y-%m-%dT%H:%M:%S.000Z") -> list[str]:
+    return [(start + dt.timedelta(minutes=15 * i)).strftime(fmt) for i in range(count)]
+
+
+def test_decoder_matches_full_parser():
+    timestamps = _quarter_hours(dt.datetime(2023, 3, 25, 20, 0), 4 * 24 * 3)
+    decoder = TimestampDecoder()
+    assert [decoder.decode(ts) for ts in timestamps] == [parse_epoch(ts) for ts in timestamps]
+    # only the first value of every day is not predicted
+    assert decoder.full == 0
+    assert decoder.fast == 4
+
+
+@pytest.mark.parametrize("timestamp", [
+    "2023-01-01T00:00:00Z",
+    "2023-01-01T00:00:00.000Z",
+    "2023-03-26T03:00:00+02:00",
+    "2023-10-29T02:00:00.000+01:00",
+    "2023-10-29T02:00:00-05:30",
+    "2023-01-01T00:00:00",
+    "2023-01-01T00:00:00.500Z",
+    "2023-01-01 00:00:00Z",
+    "2023-12-31T23:45:00.000Z",
+])
+def test_decoder_formats(timestamp):
+    assert parse_epoch(timestamp) == TimestampDecoder().decode(timestamp)
+
+
+def test_decoder_handles_gaps_and_changing_offsets():
+    timestamps = [
+        "2023-03-26T00:00:00.000+01:00",
+        "2023-03-26T00:15:00.000+01:00",
+        "2023-03-26T01:45:00.000+01:00",
+        "2023-03-26T03:00:00.000+02:00",
+        "2023-03-26T03:15:00.000+02:00",
+        "2023-03-26T03:15:00.000+02:00",
+        "2023-03-26T03:00:00.000+02:00",
+    ]
+    decoder = TimestampDecoder()
+    assert [decoder.decode(ts) for ts in timestamps] == [parse_epoch(ts) for ts in timestamps]
+
+
+def test_decoder_adapts_cadence():
+    hours = [(dt.datetime(2023, 1, 1) + dt.timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ") for i in range(48)]
+    decoder = TimestampDecoder()
+    assert [decoder.decode(ts) for ts in hours] == [parse_epoch(ts) for ts in hours]
+    assert 3600 == decoder.cadence
+    assert decoder.fast <= 4
+
+
+def test_decoder_rejects_invalid_timestamps():
+    decoder = TimestampDecoder()
+    with pytest.raises(ValueError):
+        decoder.decode("2023-01-01T25:00:00Z")
+    with pytest.raises(ValueError):
+        decoder.decode("yesterday")
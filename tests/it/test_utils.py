@@ -5,8 +5,8 @@ import sys
 # Add wnsm component dir so we can import utils/const without loading homeassistant
 _wnsm_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "custom_components", "wnsm")
 sys.path.insert(0, _wnsm_dir)
-from wnsm.utils import translate_dict  # noqa: E402
-from wnsm.const import ATTRS_BEWEGUNGSDATEN  # noqa: E402
+from wnsm.utils import AttributeExtractor, compile_path, dict_path, translate_dict  # noqa: E402
+from wnsm.const import ATTRS_BEWEGUNGSDATEN, ATTRS_METERREADINGS_CALL  # noqa: E402
 
 CONSUMPTION_EMPTY_VALUES_PAYLOAD = {
     "descriptor": {
@@ -33,3 +33,44 @@ def test_translate_dict_consumption_call_empty_values():
                       'values': [],
                       'zaehlpunkt': 'AT***',
                       "unitOfMeasurement": None}
+
+
+METER_READINGS_PAYLOAD = {
+    "meterReadings": [{"value": 7256686, "date": "2024-11-12", "validated": True, "type": None}],
+    "zaehlpunkt": {"zaehlpunktnummer": "AT***", "nested": [{"a": 1}, {"a": 2}]},
+    "list": "not a list",
+}
+
+
+def test_compiled_paths_match_dict_path():
+    """compiled getters return the same as dict_path, including None on missing or mistyped segments."""
+    paths = [
+        "meterReadings", "meterReadings.0", "meterReadings.0.value", "meterReadings.0.type", "meterReadings.1.value",
+        "meterReadings.value", "zaehlpunkt.zaehlpunktnummer", "zaehlpunkt.nested.1.a", "zaehlpunkt.nested.2.a",
+        "zaehlpunkt.0", "list.0", "list.x", "missing", "missing.deeper.0",
+    ]
+    for path in paths:
+        assert compile_path(path)(METER_READINGS_PAYLOAD) == dict_path(path, METER_READINGS_PAYLOAD), path
+    assert compile_path("0.value")(METER_READINGS_PAYLOAD["meterReadings"]) == 7256686
+    assert compile_path("a")(None) is None
+
+
+def test_translate_dict_meter_readings():
+    """translate_dict and a compiled extractor pick the same attributes as dict_path."""
+    result = translate_dict(METER_READINGS_PAYLOAD, ATTRS_METERREADINGS_CALL)
+    assert result == {
+        destination: dict_path(src, METER_READINGS_PAYLOAD) for src, destination in ATTRS_METERREADINGS_CALL
+    }
+    assert result["lastValue"] == 7256686
+    assert AttributeExtractor(ATTRS_METERREADINGS_CALL)(METER_READINGS_PAYLOAD) == result
+    assert translate_dict({}, ATTRS_METERREADINGS_CALL) == {
+        destination: None for _, destination in ATTRS_METERREADINGS_CALL
+    }
+
+
+def test_compiled_extractor_is_reused():
+    """a compiled extractor keeps its getters, every call only walks the responses."""
+    extract = AttributeExtractor(ATTRS_METERREADINGS_CALL)
+    assert extract.attrs_list is ATTRS_METERREADINGS_CALL
+    for i in range(3):
+        assert extract({"meterReadings": [{"value": i}]})["lastValue"] == i
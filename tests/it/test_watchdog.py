@@ -0,0 +1,35 @@
+"""Tests of the event loop watchdog"""
+import asyncio
+import time
+
+from wnsm.watchdog import LoopWatchdog
+
+
+def test_watchdog_observes_held_loop():
+    holds = []
+
+    async def run():
+        async with LoopWatchdog(holds.append, interval=0.01) as watchdog:
+            await asyncio.sleep(0.05)
+            time.sleep(0.2)  # holds the loop
+            await asyncio.sleep(0.05)
+        return watchdog
+
+    watchdog = asyncio.run(run())
+    assert watchdog.wakeups == len(holds) > 2
+    assert watchdog.max_hold == max(holds) >= 0.15
+    assert sorted(holds)[len(holds) // 2] < 0.1
+
+
+def test_watchdog_stops_on_error():
+    async def run():
+        watchdog = LoopWatchdog(interval=0.01)
+        try:
+            async with watchdog:
+                raise RuntimeError("failed")
+        except RuntimeError:
+            pass
+        await asyncio.sleep(0.03)
+        return watchdog
+
+    assert asyncio.run(run()).wakeups == 0
@@ -0,0 +1,9 @@
+"""Local stand-in server for the Wiener Netze login and api, see `server`."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "custom_components"))
+
+from .server import StandInConfig, StandInServer, day_wh, meter_reading_wh, quarter_hour_wh  # noqa: E402
+
+__all__ = ["StandInConfig", "StandInServer", "day_wh", "meter_reading_wh", "quarter_hour_wh"]
@@ -0,0 +1,45 @@
+"""
+Runs the stand-in until interrupted, e.g. to point a client at it manually:
+
+    cd tests && python -m standin --port 8080 --zaehlpunkte 3 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import time
+
+from standin import StandInConfig, StandInServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--zaehlpunkte", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--access-token-lifetime", type=int, default=300)
+    parser.add_argument("--refresh-token-lifetime", type=int, default=1800)
+    args = parser.parse_args()
+    config = StandInConfig(
+        zaehlpunkte=args.zaehlpunkte,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        access_token_lifetime=args.access_token_lifetime,
+        refresh_token_lifetime=args.refresh_token_lifetime,
+    )
+    with StandInServer(config, args.host, args.port) as server:
+        print(f"stand-in listening on {server.url} (user {config.username!r}, password {config.password!r})")
+        print(f"AUTH_URL={server.url}/auth/realms/logwien/protocol/openid-connect/")
+        try:
+            while True:
+                time.sleep(60)
+                print(dict(server.stats))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
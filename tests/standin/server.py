@@ -0,0 +1,541 @@
+"""
+Local stand-in for the Wiener Netze login (keycloak) and api gateways.
+
+Emulates the parts used by the clients on top of a threading HTTP/1.1 server with keep-alive:
+login page and credentials forms, PKCE token exchange and refresh, app-config.json,
+'zaehlpunkte', B2B 'messwerte', 'user/messwerte/bewegungsdaten', 'user/ereignisse' and 'user/profile'.
+Measurement values are synthetic, but deterministic per zaehlpunkt and timestamp.
+"""
+import base64
+import contextlib
+import hashlib
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib import parse
+
+from wnsm.api import constants as const
+
+AUTH_PATH = "/auth/realms/logwien/protocol/openid-connect/"
+APP_CONFIG_PATH = "/assets/app-config.json"
+B2C_PATH = "/gateway/WN_SMART_METER_PORTAL_API_B2C/1.0/"
+B2B_PATH = "/gateway/WN_SMART_METER_PORTAL_API_B2B/1.0/"
+ALT_PATH = "/sm/api/"
+
+QUARTER_HOUR = 15 * 60
+DAY = 24 * 60 * 60
+
+_LOGIN_FORM = '<html><body><form id="kc-form-login" action="{action}" method="post"></form></body></html>'
+_ERROR_PAGE = '<html><body><span id="input-error">Invalid username or password.</span></body></html>'
+
+
+@dataclass
+class StandInConfig:
+    """Behaviour of the stand-in, can be changed while it is running"""
+    username: str = "margit.musterfrau@gmail.com"
+    password: str = "Margit1234!"
+    #: number of (consuming) zaehlpunkte of the single contract
+    zaehlpunkte: int = 1
+    customer_id: str = "1234567890"
+    #: latency added to every request (seconds) and a uniformly distributed jitter on top
+    latency: float = 0.0
+    jitter: float = 0.0
+    #: fraction of api requests (not login requests) answered with `error_status`
+    error_rate: float = 0.0
+    error_status: int = 503
+    #: Retry-After header of injected errors (seconds), None to omit it
+    retry_after: Optional[int] = None
+    access_token_lifetime: int = 300
+    refresh_token_lifetime: int = 1800
+    #: fraction of estimated values
+    estimated_rate: float = 0.0
+    #: values are reported until the end of the day before today (like the real api), None for no limit
+    available_until: Optional[date] = field(default_factory=lambda: date.today() - timedelta(days=1))
+    seed: int = 42
+
+    def zaehlpunktnummern(self) -> list[str]:
+        return [f"AT00100000000000000010000{index:08d}" for index in range(1, self.zaehlpunkte + 1)]
+
+
+@lru_cache(maxsize=1 << 16)
+def _seed(zaehlpunkt: str) -> int:
+    return int(hashlib.sha256(zaehlpunkt.encode()).hexdigest()[:8], 16)
+
+
+def quarter_hour_wh(zaehlpunkt: str, epoch: int) -> int:
+    """
+    synthetic consumption (Wh) of the quarter hour starting at the given epoch: a daily profile with noise
+    """
+    slot = epoch // QUARTER_HOUR
+    hour = slot % 96 // 4
+    base = 40 if hour < 6 else 120 if 17 <= hour < 22 else 80
+    return base + (slot * 2654435761 + _seed(zaehlpunkt)) % 61
+
+
+@lru_cache(maxsize=1 << 14)
+def day_wh(zaehlpunkt: str, day: date) -> int:
+    start = _epoch(day)
+    return sum(quarter_hour_wh(zaehlpunkt, start + i * QUARTER_HOUR) for i in range(96))
+
+
+#: meter readings count from this day on
+METER_ORIGIN = date(2015, 1, 1)
+METER_ORIGIN_WH = 1_000_000
+
+# readings of every day since METER_ORIGIN per zaehlpunkt, extended on demand
+_readings: dict[str, list[int]] = {}
+_readings_lock = threading.Lock()
+
+
+def meter_reading_wh(zaehlpunkt: str, day: date) -> int:
+    """
+    meter reading (Wh) at the start of the given day
+    """
+    index = (day - METER_ORIGIN).days
+    if index <= 0:
+        return METER_ORIGIN_WH
+    with _readings_lock:
+        readings = _readings.setdefault(zaehlpunkt, [METER_ORIGIN_WH])
+        while len(readings) <= index:
+            previous = METER_ORIGIN + timedelta(days=len(readings) - 1)
+            readings.append(readings[-1] + day_wh(zaehlpunkt, previous))
+        return readings[index]
+
+
+def _epoch(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def _timestamp(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _parse(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def setup(self):
+        super().setup()
+        self.server.stand_in.count("connections")
+
+    def log_message(self, format, *args):  # noqa: A002 - signature of BaseHTTPRequestHandler
+        pass
+
+    def do_GET(self):
+        self.server.stand_in.handle(self, "GET")
+
+    def do_POST(self):
+        self.server.stand_in.handle(self, "POST")
+
+    def do_PUT(self):
+        self.server.stand_in.handle(self, "PUT")
+
+    def do_DELETE(self):
+        self.server.stand_in.handle(self, "DELETE")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    stand_in: "StandInServer"
+
+
+class StandInServer:
+    """
+    Runs the stand-in on localhost (a free port by default) in a background thread.
+
+        with StandInServer(StandInConfig(zaehlpunkte=3, latency=0.05)) as server, server.patch_constants():
+            Smartmeter(server.config.username, server.config.password).login().zaehlpunkte()
+
+    `stats` counts requests per route, new connections ('connections') and injected errors ('errors').
+    """
+
+    def __init__(self, config: Optional[StandInConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StandInConfig()
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._failures: list[int] = []
+        self._challenges: dict[str, str] = {}
+        self._codes: dict[str, str] = {}
+        self._access_tokens: dict[str, float] = {}
+        self._refresh_tokens: dict[str, float] = {}
+        self._server = _Server((host, port), _Handler)
+        self._server.stand_in = self
+        self._thread: Optional[threading.Thread] = None
+        self.b2c_api_key = secrets.token_hex(8)
+        self.b2b_api_key = secrets.token_hex(8)
+        self._routes = [
+            ("GET", re.compile(re.escape(AUTH_PATH) + "auth$"), "login/page", self._login_page),
+            ("POST", re.compile(r"/login-actions/authenticate$"), "login/username", self._login_username),
+            ("POST", re.compile(r"/login-actions/authenticate-password$"), "login/password", self._login_password),
+            ("POST", re.compile(re.escape(AUTH_PATH) + "token$"), "login/token", self._token),
+            ("GET", re.compile(re.escape(APP_CONFIG_PATH) + "$"), "app-config", self._app_config),
+            ("GET", re.compile(r"/zaehlpunkte$"), "zaehlpunkte", self._zaehlpunkte),
+            ("GET", re.compile(r"/zaehlpunkte/(?P<customer_id>[^/]+)/(?P<zaehlpunkt>[^/]+)/messwerte$"), "messwerte",
+             self._messwerte),
+            ("GET", re.compile(r"/user/messwerte/bewegungsdaten$"), "bewegungsdaten", self._bewegungsdaten),
+            ("GET", re.compile(r"/user/ereignisse$"), "ereignisse", self._ereignisse),
+            ("GET", re.compile(r"/user/profile$"), "profile", self._profile),
+        ]
+
+    # lifecycle
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="wnsm-stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @contextlib.contextmanager
+    def patch_constants(self):
+        """
+        points the api constants (login, app-config and gateway urls) to this server while in the context
+        """
+        names = ("AUTH_URL", "API_CONFIG_URL", "API_URL", "API_URL_B2B", "API_URL_ALT")
+        previous = {name: getattr(const, name) for name in names}
+        const.AUTH_URL = self.url + AUTH_PATH
+        const.API_CONFIG_URL = self.url + APP_CONFIG_PATH
+        const.API_URL = self.url + B2C_PATH
+        const.API_URL_B2B = self.url + B2B_PATH
+        const.API_URL_ALT = self.url + ALT_PATH
+        try:
+            yield self
+        finally:
+            for name, value in previous.items():
+                setattr(const, name, value)
+
+    # behaviour
+
+    def fail_next(self, count: int = 1, status: Optional[int] = None) -> None:
+        """
+        answers the next `count` api requests with the given status (default: config.error_status)
+        """
+        with self._lock:
+            self._failures.extend([status or self.config.error_status] * count)
+
+    def expire_tokens(self, refresh: bool = False) -> None:
+        """
+        lets all issued access tokens (and refresh tokens) expire, e.g. to test re-login and refresh
+        """
+        with self._lock:
+            self._access_tokens.clear()
+            if refresh:
+                self._refresh_tokens.clear()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    # dispatching
+
+    def handle(self, request: BaseHTTPRequestHandler, method: str) -> None:
+        url = parse.urlsplit(request.path)
+        length = int(request.headers.get("Content-Length") or 0)
+        body = request.rfile.read(length) if length else b""
+        for route_method, pattern, name, handler in self._routes:
+            match = pattern.search(url.path)
+            if match and route_method == method:
+                break
+        else:
+            self._send(request, 404, {"error": f"no route for {method} {url.path}"})
+            return
+        self.count(name)
+        self._delay()
+        if not name.startswith("login/") and name != "app-config":
+            if not self._authorized(request):
+                self._send(request, 401, {"error": "invalid_token"})
+                return
+            status = self._injected_failure()
+            if status is not None:
+                self.count("errors")
+                headers = {} if self.config.retry_after is None else {"Retry-After": str(self.config.retry_after)}
+                self._send(request, status, {"error": "injected"}, headers)
+                return
+        query = dict(parse.parse_qsl(url.query))
+        form = dict(parse.parse_qsl(body.decode())) if body else {}
+        handler(request, query=query, form=form, **match.groupdict())
+
+    def _delay(self) -> None:
+        latency = self.config.latency
+        if self.config.jitter:
+            with self._lock:
+                latency += self._random.uniform(0, self.config.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def _injected_failure(self) -> Optional[int]:
+        with self._lock:
+            if self._failures:
+                return self._failures.pop(0)
+            if self.config.error_rate and self._random.random() < self.config.error_rate:
+                return self.config.error_status
+        return None
+
+    def _authorized(self, request: BaseHTTPRequestHandler) -> bool:
+        authorization = request.headers.get("Authorization", "")
+        token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else None
+        with self._lock:
+            expiration = self._access_tokens.get(token)
+        if expiration is None or expiration < time.time():
+            return False
+        api_key = request.headers.get("X-Gateway-APIKey")
+        path = parse.urlsplit(request.path).path
+        if path.startswith(B2C_PATH):
+            return api_key == self.b2c_api_key
+        if path.startswith(B2B_PATH):
+            return api_key == self.b2b_api_key
+        return True
+
+    @staticmethod
+    def _send(request: BaseHTTPRequestHandler, status: int, payload, headers: Optional[dict] = None,
+              content_type: str = "application/json") -> None:
+        body = payload if isinstance(payload, bytes) else (
+            payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        )
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+    # login
+
+    def _login_page(self, request, query, form):
+        session = secrets.token_urlsafe(8)
+        with self._lock:
+            self._challenges[session] = query.get("code_challenge", "")
+        action = f"{self.url}/login-actions/authenticate?session={session}"
+        self._send(request, 200, _LOGIN_FORM.format(action=action), content_type="text/html")
+
+    def _login_username(self, request, query, form):
+        action = f"{self.url}/login-actions/authenticate-password?session={query.get('session', '')}"
+        self._send(request, 200, _LOGIN_FORM.format(action=action), content_type="text/html")
+
+    def _login_password(self, request, query, form):
+        if form.get("username") != self.config.username or form.get("password") != self.config.password:
+            self._send(request, 200, _ERROR_PAGE, content_type="text/html")
+            return
+        code = secrets.token_urlsafe(16)
+        with self._lock:
+            self._codes[code] = self._challenges.pop(query.get("session", ""), "")
+        location = f"{const.REDIRECT_URI}#state=&session_state={secrets.token_hex(4)}&code={code}"
+        self._send(request, 302, b"", {"Location": location}, content_type="text/html")
+
+    def _token(self, request, query, form):
+        now = time.time()
+        grant_type = form.get("grant_type")
+        with self._lock:
+            if grant_type == "authorization_code":
+                challenge = self._codes.pop(form.get("code", ""), None)
+                verifier = form.get("code_verifier", "")
+                expected = base64.urlsafe_b64encode(hashlib.sha256(verifier.encode()).digest()).decode().rstrip("=")
+                valid = challenge is not None and (not challenge or challenge == expected)
+            elif grant_type == "refresh_token":
+                self.stats["login/refresh"] += 1
+                expiration = self._refresh_tokens.pop(form.get("refresh_token", ""), None)
+                valid = expiration is not None and expiration >= now
+            else:
+                valid = False
+            if valid:
+                access_token, refresh_token = secrets.token_urlsafe(24), secrets.token_urlsafe(24)
+                self._access_tokens[access_token] = now + self.config.access_token_lifetime
+                self._refresh_tokens[refresh_token] = now + self.config.refresh_token_lifetime
+        if not valid:
+            self._send(request, 400, {"error": "invalid_grant"})
+            return
+        self._send(request, 200, {
+            "access_token": access_token,
+            "expires_in": self.config.access_token_lifetime,
+            "refresh_token": refresh_token,
+            "refresh_expires_in": self.config.refresh_token_lifetime,
+            "token_type": "Bearer",
+            "id_token": secrets.token_urlsafe(24),
+            "not-before-policy": 0,
+            "session_state": secrets.token_hex(8),
+            "scope": "openid email profile",
+        })
+
+    def _app_config(self, request, query, form):
+        self._send(request, 200, {
+            "b2cApiKey": self.b2c_api_key,
+            "b2bApiKey": self.b2b_api_key,
+            "b2cApiUrl": self.url + B2C_PATH,
+            "b2bApiUrl": self.url + B2B_PATH,
+        })
+
+    # api
+
+    def _zaehlpunkt(self, zaehlpunktnummer: str) -> dict:
+        return {
+            "zaehlpunktnummer": zaehlpunktnummer,
+            "customLabel": f"Zaehlpunkt {zaehlpunktnummer[-2:]}",
+            "equipmentNumber": zaehlpunktnummer[-10:],
+            "geraetNumber": f"ABC{zaehlpunktnummer[-13:]}",
+            "isSmartMeter": True,
+            "isDefault": zaehlpunktnummer == self.config.zaehlpunktnummern()[0],
+            "isActive": True,
+            "isDataDeleted": False,
+            "isSmartMeterMarketReady": True,
+            "dataDeletionTimestampUTC": None,
+            "verbrauchsstelle": {
+                "strasse": "Eine Strasse",
+                "hausnummer": "1/2/3",
+                "anlageHausnummer": "1",
+                "postleitzahl": "1010",
+                "ort": "Wien",
+                "laengengrad": "16.3738",
+                "breitengrad": "48.2082",
+            },
+            "anlage": {"typ": "TAGSTROM"},
+            "vertraege": [],
+            "idexStatus": {"granularity": {"status": "QUARTER_HOUR", "canBeChanged": True}},
+        }
+
+    def _zaehlpunkte(self, request, query, form):
+        self._send(request, 200, [{
+            "bezeichnung": f"Margit Musterfrau, Kundennummer {self.config.customer_id}",
+            "geschaeftspartner": self.config.customer_id,
+            "zaehlpunkte": [self._zaehlpunkt(zp) for zp in self.config.zaehlpunktnummern()],
+        }])
+
+    def _known(self, request, zaehlpunkt: str) -> bool:
+        if zaehlpunkt in self.config.zaehlpunktnummern():
+            return True
+        self._send(request, 404, {"error": f"unknown zaehlpunkt {zaehlpunkt}"})
+        return False
+
+    def _until(self, until: datetime) -> datetime:
+        if self.config.available_until is None:
+            return until
+        return min(until, datetime.fromtimestamp(_epoch(self.config.available_until) + DAY, timezone.utc))
+
+    def _estimated(self, zaehlpunkt: str, epoch: int) -> bool:
+        rate = self.config.estimated_rate
+        return bool(rate) and (epoch // QUARTER_HOUR * 40503 + _seed(zaehlpunkt)) % 10_000 < rate * 10_000
+
+    def _messwerte(self, request, query, form, customer_id, zaehlpunkt):
+        if not self._known(request, zaehlpunkt):
+            return
+        start = date.fromisoformat(query["datumVon"])
+        until = self._until(datetime.combine(date.fromisoformat(query["datumBis"]), datetime.min.time(),
+                                             timezone.utc) + timedelta(days=1))
+        valuetype = query.get("wertetyp", "METER_READ")
+        messwerte = []
+        if valuetype == "QUARTER_HOUR":
+            obis = "1-1:1.9.0"
+            for epoch in range(_epoch(start), int(until.timestamp()), QUARTER_HOUR):
+                messwerte.append(self._messwert(quarter_hour_wh(zaehlpunkt, epoch), epoch, QUARTER_HOUR, zaehlpunkt))
+        else:
+            obis = "1-1:1.8.0" if valuetype == "METER_READ" else "1-1:1.9.0"
+            day = start
+            while _epoch(day) < until.timestamp():
+                value = meter_reading_wh(zaehlpunkt, day) if valuetype == "METER_READ" else day_wh(zaehlpunkt, day)
+                messwerte.append(self._messwert(value, _epoch(day), DAY, zaehlpunkt))
+                day += timedelta(days=1)
+        self._send(request, 200, {
+            "zaehlpunkt": zaehlpunkt,
+            "zaehlwerke": [{"obisCode": obis, "einheit": "WH", "messwerte": messwerte}],
+        })
+
+    def _messwert(self, value: int, epoch: int, length: int, zaehlpunkt: str) -> dict:
+        return {
+            "messwert": value,
+            "zeitVon": _timestamp(epoch),
+            "zeitBis": _timestamp(epoch + length),
+            "qualitaet": "EST" if self._estimated(zaehlpunkt, epoch) else "VAL",
+        }
+
+    def _bewegungsdaten(self, request, query, form):
+        zaehlpunkt = query.get("zaehlpunktnummer", "")
+        if not self._known(request, zaehlpunkt):
+            return
+        rolle = query.get("rolle", "V002")
+        start = _parse(query["zeitpunktVon"])
+        until = self._until(_parse(query["zeitpunktBis"]))
+        daily = rolle in ("V001", "E001")
+        step = DAY if daily else QUARTER_HOUR
+        first = -(-int(start.timestamp()) // step) * step
+        values = []
+        for epoch in range(first, int(until.timestamp()), step):
+            wh = day_wh(zaehlpunkt, datetime.fromtimestamp(epoch, timezone.utc).date()) if daily \
+                else quarter_hour_wh(zaehlpunkt, epoch)
+            values.append({
+                "wert": wh / 1000,
+                "zeitpunktVon": _timestamp(epoch),
+                "zeitpunktBis": _timestamp(epoch + step),
+                "geschaetzt": self._estimated(zaehlpunkt, epoch),
+            })
+        self._send(request, 200, {
+            "descriptor": {
+                "geschaeftspartnernummer": query.get("geschaeftspartner"),
+                "zaehlpunktnummer": zaehlpunkt,
+                "rolle": rolle,
+                "aggregat": query.get("aggregat", "NONE"),
+                "granularitaet": "D" if daily else "QH",
+                "einheit": "KWH",
+            },
+            "values": values,
+        })
+
+    def _ereignisse(self, request, query, form):
+        zaehlpunkt = query.get("zaehlpunkt", "")
+        if not self._known(request, zaehlpunkt):
+            return
+        start = _parse(query["dateFrom"])
+        until = _parse(query["dateUntil"])
+        # one synthetic event per week
+        events = []
+        day = start
+        while day < until:
+            events.append({
+                "id": int(day.timestamp()) // DAY,
+                "name": "Waschmaschine",
+                "startAt": day.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "endAt": (day + timedelta(hours=2)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "zaehlpunkt": zaehlpunkt,
+            })
+            day += timedelta(days=7)
+        self._send(request, 200, events)
+
+    def _profile(self, request, query, form):
+        self._send(request, 200, {
+            "email": self.config.username,
+            "firstname": "Margit",
+            "lastname": "Musterfrau",
+            "defaultGeschaeftspartnerRegistration": {
+                "geschaeftspartner": self.config.customer_id,
+                "zaehlpunkt": self.config.zaehlpunktnummern()[0],
+            },
+        })